@@ -5,6 +5,14 @@ PROJECT_ID=$(gcloud config get-value project)
 SECRET_NAME="stream-keys"
 BACKUP_DIR="../backups/keys"
 TIMESTAMP=$(date +%Y%m%d_%H%M%S)
+STREAM_MANAGER_DIR="$(cd "$(dirname "$0")/../../stream-manager" && pwd)"
+
+# By default rotated keys are hot-reloaded: only the relay whose key changed
+# restarts. Pass --replace to also roll every instance in the group.
+ROLLING_REPLACE=false
+if [ "$1" == "--replace" ]; then
+    ROLLING_REPLACE=true
+fi
 
 # Create backup directory if it doesn't exist
 mkdir -p $BACKUP_DIR
@@ -36,10 +44,17 @@ EOF
 echo "Updating stream keys in Secret Manager..."
 echo "$PAYLOAD" | gcloud secrets versions add $SECRET_NAME --data-file=-
 
-# Trigger instance refresh in managed instance group
-echo "Refreshing instances to pick up new keys..."
-gcloud compute instance-groups managed rolling-action replace stream-relay-mig \
-    --max-unavailable 0 \
-    --zone=REDACTED_ZONE
+# Publish new versions to the stream manager's key store; its key watcher
+# restarts only the relays whose key changed
+echo "Publishing new key versions to the stream manager..."
+echo "$PAYLOAD" | (cd "$STREAM_MANAGER_DIR" && python -m app.services.key_store import -)
+
+if [ "$ROLLING_REPLACE" == "true" ]; then
+    # Trigger instance refresh in managed instance group
+    echo "Refreshing instances to pick up new keys..."
+    gcloud compute instance-groups managed rolling-action replace stream-relay-mig \
+        --max-unavailable 0 \
+        --zone=REDACTED_ZONE
+fi
 
 echo "Stream keys rotated successfully!"
\ No newline at end of file
@@ -38,8 +38,9 @@ echo "$PAYLOAD" | gcloud secrets versions add stream-keys --data-file=-
 
 if [ $? -eq 0 ]; then
     echo "Stream keys updated successfully!"
-    echo "New instances will automatically pick up the new keys"
-    echo "Existing instances will need to be refreshed"
+    # Hot reload: the stream manager restarts only the relays whose key changed
+    echo "$PAYLOAD" | (cd "$(dirname "$0")/../../stream-manager" && python -m app.services.key_store import -)
+    echo "Running relays with a changed key restart in place; no instance refresh needed"
 else
     echo "Error: Failed to update stream keys"
     exit 1
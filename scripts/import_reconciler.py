@@ -1,7 +1,10 @@
-import ast
+import difflib
+import io
 import os
+import shutil
+import tokenize
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 import json
 from datetime import datetime
 from rich import print
@@ -9,17 +12,289 @@ from rich.console import Console
 from rich.panel import Panel
 import configparser
 import subprocess
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 import sys
 
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'stream-manager'))
+
+from app.utils.fs_scan import PathFilter, scan
+from module_mapper import build_import_graph, dependents, parse_module
+
 console = Console()
 
+# Directories never searched for test files.
+TEST_SCAN_IGNORED = {
+    '.git', '.venv', 'venv', 'env', '__pycache__', '.pytest_cache', '.tox',
+    'node_modules', 'site-packages', 'dist-packages', 'build', 'dist', 'migration_data',
+}
+
 @dataclass
 class ImportChange:
     file_path: str
     old_import: str
     new_import: str
-    status: str = "pending"  # pending, success, error
+    status: str = "pending"  # pending, success, manual, error
+    score: float = 1.0  # export overlap between the old and new module
+
+# Below this many files a process pool costs more than it saves.
+MIN_PARALLEL_FILES = 32
+
+# Keywords of statements whose header ends in a colon, after which a
+# one-line body (`if X: import a`) starts a new statement.
+COMPOUND_KEYWORDS = {
+    'if', 'elif', 'else', 'while', 'for', 'try', 'except', 'finally', 'with', 'def', 'class', 'async',
+}
+
+# Exports defined by more modules than this (main, logger, ...) say little
+# about where a module moved, so they don't nominate candidates on their own.
+COMMON_EXPORT_LIMIT = 50
+
+
+def build_export_index(module_map: Dict) -> Dict[str, List[str]]:
+    """Map each export name to the sorted modules that define it."""
+    index = defaultdict(list)
+    for module in sorted(module_map):
+        for export in set(module_map[module]['exports']):
+            index[export].append(module)
+    return dict(index)
+
+
+def match_modules(old_map: Dict, new_map: Dict, min_score: float = 0.0,
+                  common_limit: int = COMMON_EXPORT_LIMIT) -> Dict[str, Tuple[str, float]]:
+    """Best new module for every old module, scored by Jaccard export overlap.
+
+    Candidates come from an export -> module inverted index built once, so
+    each old module is only compared with new modules it shares an export
+    with. Ties go to the candidate with the same final name component, then
+    to the lexicographically first path, so results don't depend on map
+    order. A module still present under its old path keeps it on a tie.
+    """
+    index = build_export_index(new_map)
+    new_exports = {module: frozenset(info['exports']) for module, info in new_map.items()}
+    matches = {}
+    for old_module, old_info in old_map.items():
+        exports = frozenset(old_info['exports'])
+        if not exports:
+            continue
+        postings = [index.get(export, ()) for export in exports]
+        candidates = {m for p in postings if len(p) <= common_limit for m in p}
+        if not candidates:
+            candidates = {m for p in postings for m in p}
+        if not candidates:
+            continue
+
+        leaf = old_module.rsplit('.', 1)[-1]
+        best = None
+        for candidate in candidates:
+            other = new_exports[candidate]
+            score = len(exports & other) / len(exports | other)
+            rank = (-score, candidate != old_module, candidate.rsplit('.', 1)[-1] != leaf, candidate)
+            if best is None or rank < best[0]:
+                best = (rank, candidate, score)
+        if best[2] > min_score:
+            matches[old_module] = (best[1], best[2])
+    return matches
+
+
+def _dotted_name(tokens: List[tokenize.TokenInfo], i: int) -> Tuple[str, int]:
+    """Read `a.b.c` starting at token `i`; returns the name and the next index."""
+    parts = [tokens[i].string]
+    i += 1
+    while tokens[i].string == '.' and tokens[i + 1].type == tokenize.NAME:
+        parts.append(tokens[i + 1].string)
+        i += 2
+    return '.'.join(parts), i
+
+
+def find_import_spans(source: str) -> List[Tuple[int, int, str, bool]]:
+    """Character spans of absolute module names in import statements.
+
+    Returns `(start, end, dotted_name, binds_name)` for every name after
+    `import` and after `from`; relative imports are skipped. `binds_name`
+    is true for `import a.b` without `as`, which binds `a` and is used as
+    `a.b.x` elsewhere in the file. Everything else in the source, comments
+    and formatting included, is left out of the spans.
+    """
+    offsets = [0]
+    for line in source.splitlines(keepends=True):
+        offsets.append(offsets[-1] + len(line))
+
+    def offset(position: Tuple[int, int]) -> int:
+        return offsets[position[0] - 1] + position[1]
+
+    skip = (tokenize.COMMENT, tokenize.NL)
+    tokens = [t for t in tokenize.generate_tokens(io.StringIO(source).readline) if t.type not in skip]
+    tokens.append(tokenize.TokenInfo(tokenize.ENDMARKER, '', (0, 0), (0, 0), ''))
+    spans = []
+    statement_start = True
+    # Whether the current statement is a compound one, how deep inside
+    # brackets we are, and how many lambdas still wait for their colon.
+    compound = False
+    depth = 0
+    lambdas = 0
+    i = 0
+    while i < len(tokens) - 1:
+        token = tokens[i]
+        if statement_start and token.type == tokenize.NAME and token.string in ('import', 'from'):
+            i += 1
+            while tokens[i].type == tokenize.NAME:
+                name, end = _dotted_name(tokens, i)
+                start = offset(tokens[i].start)
+                i = end
+                aliased = tokens[i].string == 'as'
+                spans.append((start, offset(tokens[end - 1].end), name, token.string == 'import' and not aliased))
+                if token.string == 'from':
+                    break
+                if aliased:
+                    i += 2
+                if tokens[i].string != ',':
+                    break
+                i += 1
+            statement_start = False
+            continue
+        starts = statement_start
+        statement_start = token.type in (tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT) or (
+            token.type == tokenize.OP and token.string == ';'
+        )
+        if statement_start:
+            compound, depth, lambdas = False, 0, 0
+        elif starts and token.type == tokenize.NAME:
+            compound = token.string in COMPOUND_KEYWORDS
+        elif token.type == tokenize.NAME and token.string == 'lambda' and depth == 0:
+            lambdas += 1
+        elif token.type == tokenize.OP:
+            if token.string in '([{':
+                depth += 1
+            elif token.string in ')]}':
+                depth -= 1
+            elif token.string == ':' and depth == 0 and compound:
+                if lambdas:
+                    lambdas -= 1
+                else:
+                    # The header ended; a one-line body follows.
+                    statement_start, compound = True, False
+        i += 1
+    return spans
+
+
+def rewrite_imports(source: str, mapping: Dict[str, str]) -> Tuple[str, List[str]]:
+    """Replace imported module names per `mapping`, touching nothing else.
+
+    `import old` becomes `import new as old`, so the name the file uses
+    stays bound. `import old.mod` can't be kept working that way, since
+    the file refers to `old.mod.x`; such imports are left alone and
+    returned as needing a manual change.
+    """
+    manual = []
+    for start, end, name, binds_name in reversed(find_import_spans(source)):
+        if name not in mapping:
+            continue
+        replacement = mapping[name]
+        if binds_name and replacement != name:
+            if '.' in name:
+                manual.append(name)
+                continue
+            replacement = f'{replacement} as {name}'
+        source = source[:start] + replacement + source[end:]
+    return source, sorted(set(manual))
+
+
+def rewrite_file(file_path: str, mapping: Dict[str, str],
+                 dry_run: bool = False) -> Tuple[str, Optional[str], Optional[str], List[str]]:
+    """Rewrite one file's imports; runs in worker processes.
+
+    Returns `(status, diff, error, manual)` where status is "success",
+    "unchanged" or "error" and `manual` lists the imports that need a
+    manual change. Files whose imports don't change are never written,
+    and in a dry run nothing is written at all.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        encoding, _ = tokenize.detect_encoding(io.BytesIO(data).readline)
+        source = data.decode(encoding)
+        updated, manual = rewrite_imports(source, mapping)
+    except (OSError, UnicodeDecodeError, SyntaxError, tokenize.TokenError) as e:
+        return 'error', None, str(e), []
+    if updated == source:
+        return 'unchanged', None, None, manual
+
+    display_path = os.path.relpath(file_path)
+    diff = ''.join(difflib.unified_diff(
+        source.splitlines(keepends=True), updated.splitlines(keepends=True),
+        fromfile=f'a/{display_path}', tofile=f'b/{display_path}',
+    ))
+    if not dry_run:
+        tmp_file = f'{file_path}.reconcile.tmp'
+        try:
+            with open(tmp_file, 'wb') as f:
+                f.write(updated.encode(encoding))
+            shutil.copymode(file_path, tmp_file)
+            os.replace(tmp_file, file_path)
+        except OSError as e:
+            return 'error', diff, str(e), manual
+    return 'success', diff, None, manual
+
+
+def find_test_files(root: Path) -> List[Path]:
+    """pytest-style test files (`test_*.py`, `*_test.py`) under `root`."""
+    return sorted(
+        Path(item.path)
+        for item in scan(root, PathFilter(TEST_SCAN_IGNORED), include_dirs=False)
+        if item.name.endswith('.py') and (item.name.startswith('test_') or item.name.endswith('_test.py'))
+    )
+
+
+def select_tests(changed_files: List[str], module_map: Dict, root: Path) -> Optional[List[str]]:
+    """Test files that import a changed file, directly or transitively.
+
+    Test modules are parsed here, since the mapper skips test directories,
+    and joined to the map's import graph. Returns None when the selection
+    can't be trusted and the whole suite should run: no test files found,
+    a changed file that isn't in the map, a changed `conftest.py`, or a
+    test file that doesn't parse.
+    """
+    tests = find_test_files(root)
+    if not tests:
+        return None
+    test_paths = {os.path.abspath(t): t for t in tests}
+    path_to_module = {os.path.abspath(info['path']): m for m, info in module_map.items()}
+
+    selected = set()
+    changed = set()
+    for path in map(os.path.abspath, changed_files):
+        if os.path.basename(path) == 'conftest.py':
+            return None
+        if path in test_paths:
+            selected.add(path)
+        elif path in path_to_module:
+            changed.add(path_to_module[path])
+        else:
+            return None
+
+    test_modules = {}
+    extra = {}
+    for path, test in test_paths.items():
+        imports, _, from_imports, error = parse_module(path)
+        if error:
+            return None
+        name = '.'.join(test.relative_to(root).with_suffix('').parts)
+        test_modules[name] = path
+        extra[name] = {'imports': imports, 'from_imports': from_imports}
+
+    graph = build_import_graph(module_map, extra)
+    selected.update(test_modules[m] for m in dependents(graph, changed) if m in test_modules)
+    return sorted(selected)
+
+
+def group_changes(changes: List[ImportChange]) -> Dict[str, List[ImportChange]]:
+    """Changes per file, in one pass and in first-seen order."""
+    grouped = defaultdict(list)
+    for change in changes:
+        grouped[change.file_path].append(change)
+    return dict(grouped)
 
 class ImportReconciler:
     def __init__(self):
@@ -64,14 +339,11 @@ class ImportReconciler:
         changes = []
         
         # Map old paths to new paths based on exports
-        path_mapping = {}
-        for old_path, old_info in old_map.items():
-            old_exports = set(old_info['exports'])
-            for new_path, new_info in new_map.items():
-                new_exports = set(new_info['exports'])
-                if old_exports & new_exports:  # If there's overlap in exports
-                    path_mapping[old_path] = new_path
-                    break
+        path_mapping = {
+            old_path: match
+            for old_path, match in match_modules(old_map, new_map).items()
+            if match[0] != old_path
+        }
         
         # Create list of required changes
         for old_path, old_info in old_map.items():
@@ -80,45 +352,79 @@ class ImportReconciler:
             # Check each import in the file
             for import_path in old_info['imports']:
                 if import_path in path_mapping:
+                    new_import, score = path_mapping[import_path]
                     changes.append(ImportChange(
                         file_path=file_path,
                         old_import=import_path,
-                        new_import=path_mapping[import_path]
+                        new_import=new_import,
+                        score=score
                     ))
         
         return changes
     
-    def update_imports_in_file(self, file_path: str, changes: List[ImportChange]) -> bool:
+    def update_imports_in_file(self, file_path: str, changes: List[ImportChange],
+                               dry_run: bool = False) -> bool:
         """Update imports in a single file."""
-        try:
-            with open(file_path, 'r') as f:
-                tree = ast.parse(f.read())
-                
-            modifier = ImportModifier(changes)
-            new_tree = modifier.visit(tree)
-            
-            with open(file_path, 'w') as f:
-                f.write(ast.unparse(new_tree))
-                
-            return True
-        except Exception as e:
-            console.print(f"[red]Error updating {file_path}: {e}[/red]")
-            return False
+        status, _, error, manual = rewrite_file(
+            file_path, {c.old_import: c.new_import for c in changes}, dry_run
+        )
+        for change in changes:
+            change.status = 'manual' if change.old_import in manual else status
+        if error:
+            console.print(f"[red]Error updating {file_path}: {error}[/red]")
+        for name in manual:
+            console.print(f"[yellow]{file_path}: `import {name}` needs a manual change[/yellow]")
+        return status != 'error'
+
+    def apply_changes(self, grouped: Dict[str, List[ImportChange]], dry_run: bool = False,
+                      workers: Optional[int] = None) -> Dict[str, Tuple[str, Optional[str], Optional[str], List[str]]]:
+        """Rewrite every file's imports in parallel; returns results per file."""
+        paths = list(grouped)
+        mappings = [{c.old_import: c.new_import for c in grouped[path]} for path in paths]
+        flags = [dry_run] * len(paths)
+        if len(paths) < MIN_PARALLEL_FILES or workers == 1:
+            results = list(map(rewrite_file, paths, mappings, flags))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(rewrite_file, paths, mappings, flags, chunksize=8))
+        for path, (status, _, _, manual) in zip(paths, results):
+            for change in grouped[path]:
+                change.status = 'manual' if change.old_import in manual else status
+        return dict(zip(paths, results))
             
-    def run_tests(self) -> Tuple[bool, str]:
-        """Run pytest and return results."""
-        try:
-            result = subprocess.run(
-                ['pytest'],
-                capture_output=True,
-                text=True
-            )
+    def run_tests(self, test_files: Optional[List[str]] = None,
+                  shards: int = 1) -> Tuple[bool, str]:
+        """Run pytest and return results.
+
+        Without `test_files` the whole suite runs. Otherwise only those
+        files run, split round-robin across `shards` parallel pytest
+        processes.
+        """
+        if test_files is None:
+            commands = [['pytest']]
+        elif not test_files:
+            return True, "No tests import the rewritten files"
+        else:
+            shards = max(1, min(shards, len(test_files)))
+            commands = [['pytest', *test_files[i::shards]] for i in range(shards)]
+
+        def run(command: List[str]) -> Tuple[bool, str]:
+            result = subprocess.run(command, capture_output=True, text=True)
             return result.returncode == 0, result.stdout
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(commands)) as pool:
+                results = list(pool.map(run, commands))
         except Exception as e:
             return False, str(e)
-            
-    def reconcile_imports(self, old_map_path: Path, new_map_path: Path):
-        """Main reconciliation process."""
+        return all(ok for ok, _ in results), "\n".join(output for _, output in results)
+
+    def reconcile_imports(self, old_map_path: Path, new_map_path: Path, dry_run: bool = False):
+        """Main reconciliation process.
+
+        With `dry_run` the combined unified diff is printed instead of
+        writing files, and tests are not run.
+        """
         # Load mapping files
         with open(old_map_path) as f:
             old_map = json.load(f)
@@ -130,22 +436,38 @@ class ImportReconciler:
         console.print(f"[yellow]Found {len(changes)} import changes needed[/yellow]")
         
         # Process each file's changes
-        processed_files = set()
-        for change in changes:
-            if change.file_path not in processed_files:
-                file_changes = [c for c in changes if c.file_path == change.file_path]
-                console.print(f"\nUpdating imports in: {change.file_path}")
-                
-                if self.update_imports_in_file(change.file_path, file_changes):
-                    console.print("[green]✓ Successfully updated imports[/green]")
-                else:
-                    console.print("[red]✗ Failed to update imports[/red]")
-                    
-                processed_files.add(change.file_path)
+        results = self.apply_changes(group_changes(changes), dry_run)
+        counts = defaultdict(int)
+        for file_path, (status, diff, error, manual) in results.items():
+            counts[status] += 1
+            counts['manual'] += len(manual)
+            if error:
+                console.print(f"[red]✗ {file_path}: {error}[/red]")
+            elif dry_run and diff:
+                console.print(diff, markup=False, highlight=False, end='')
+            for name in manual:
+                console.print(f"[yellow]! {file_path}: `import {name}` needs a manual change[/yellow]")
+        verb = "would be updated" if dry_run else "updated"
+        console.print(
+            f"\n[green]{counts['success']} files {verb}[/green], "
+            f"{counts['unchanged']} unchanged, {counts['error']} failed, "
+            f"{counts['manual']} imports need a manual change"
+        )
+        if dry_run:
+            return
         
-        # Run tests and show results
-        console.print("\n[yellow]Running tests...[/yellow]")
-        success, test_output = self.run_tests()
+        # Run the tests affected by the rewritten files, or all of them
+        rewritten = [path for path, (status, _, _, _) in results.items() if status == 'success']
+        new_paths = {info['path'] for info in new_map.values()}
+        module_map = new_map if all(path in new_paths for path in rewritten) else old_map
+        source_dir = Path(self.config['DEFAULT']['source_truth_dir'])
+        test_files = select_tests(rewritten, module_map, source_dir)
+        shards = int(self.config['DEFAULT'].get('test_shards', '1'))
+        if test_files is None:
+            console.print("\n[yellow]Running full test suite...[/yellow]")
+        else:
+            console.print(f"\n[yellow]Running {len(test_files)} affected test files...[/yellow]")
+        success, test_output = self.run_tests(test_files, shards)
         
         if success:
             console.print("[green]✓ All tests passed[/green]")
@@ -154,26 +476,6 @@ class ImportReconciler:
             console.print("\nTest output:")
             console.print(test_output)
 
-class ImportModifier(ast.NodeTransformer):
-    def __init__(self, changes: List[ImportChange]):
-        self.changes = {c.old_import: c.new_import for c in changes}
-        
-    def visit_Import(self, node):
-        new_names = []
-        for alias in node.names:
-            new_name = self.changes.get(alias.name, alias.name)
-            new_names.append(ast.alias(name=new_name, asname=alias.asname))
-        return ast.Import(names=new_names)
-        
-    def visit_ImportFrom(self, node):
-        if node.module in self.changes:
-            return ast.ImportFrom(
-                module=self.changes[node.module],
-                names=node.names,
-                level=node.level
-            )
-        return node
-
 def main():
     reconciler = ImportReconciler()
     
@@ -238,7 +540,8 @@ def main():
                     console.print("[red]Mapping files not found[/red]")
                     continue
                     
-                reconciler.reconcile_imports(old_map, new_map)
+                dry_run = input("Dry run, show diff only? (y/N): ").strip().lower() == 'y'
+                reconciler.reconcile_imports(old_map, new_map, dry_run)
                 
             elif choice == 4:
                 # TODO: Implement viewing last results
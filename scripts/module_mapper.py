@@ -1,18 +1,209 @@
 import ast
+import hashlib
 import os
+import subprocess
+import sys
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, Set, List, Tuple
+from typing import Dict, Iterable, Set, List, Optional, Tuple
 import json
 from datetime import datetime
 from rich import print
 from rich.console import Console
 from rich.panel import Panel
+from rich.table import Table
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'stream-manager'))
+
+from app.utils.fs_scan import PathFilter, read_ignore_file, scan
 
 console = Console()
 
+CACHE_FILE = '.module_map_cache.json'
+# Bump when parse_module's output changes so stale cache entries are dropped.
+CACHE_VERSION = 2
+# Below this many files a process pool costs more than it saves.
+MIN_PARALLEL_FILES = 32
+# Non-project imports at least this slow (cumulative, ms) are worth deferring.
+HEAVY_IMPORT_MS = 20.0
+IMPORTTIME_PREFIX = 'import time:'
+
+
+def _file_hash(file_path: str) -> str:
+    with open(file_path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def parse_module(file_path: str) -> Tuple[List[str], List[str], List[str], Optional[str]]:
+    """Parse imports and exports of one file; runs in worker processes.
+
+    Besides the imported modules, `from_imports` lists every `from X import
+    name` as `X.name` (with leading dots kept for relative imports), since
+    the name may itself be a submodule.
+    """
+    imports = set()
+    exports = set()
+    from_imports = set()
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+    except Exception as e:
+        return [], [], [], str(e)
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for name in node.names:
+                imports.add(name.name)
+        elif isinstance(node, ast.ImportFrom):
+            if node.module:
+                imports.add(node.module)
+            base = '.' * node.level + (node.module or '')
+            if node.level:
+                from_imports.add(base)
+            for name in node.names:
+                if name.name != '*':
+                    from_imports.add(f"{base}.{name.name}" if node.module else base + name.name)
+        elif isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef)):
+            if node.name != '__init__':
+                exports.add(node.name)
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    exports.add(target.id)
+    return sorted(imports), sorted(exports), sorted(from_imports), None
+
+
+def _module_index(module_map: Dict[str, Dict]) -> Dict[str, List[str]]:
+    """Every dotted suffix of every module name, mapped to those modules.
+
+    Module names are relative to the mapper's root (`stream-manager.app.x`)
+    while code imports them by their package path (`app.x`), so imports are
+    matched against suffixes. Packages are indexed by their directory name.
+    """
+    index = defaultdict(list)
+    for module in sorted(module_map):
+        parts = module.split('.')
+        if parts[-1] == '__init__':
+            parts = parts[:-1]
+        for i in range(len(parts)):
+            index['.'.join(parts[i:])].append(module)
+    return index
+
+
+def resolve_import(name: str, importer: str, index: Dict[str, List[str]]) -> List[str]:
+    """Project modules an import of `name` inside module `importer` may load."""
+    if name.startswith('.'):
+        level = len(name) - len(name.lstrip('.'))
+        package = importer.split('.')[:-1]
+        package = package[:len(package) - (level - 1)]
+        rest = name[level:]
+        full = '.'.join(package + ([rest] if rest else []))
+        return [m for m in index.get(full, ()) if m in (full, f"{full}.__init__")]
+    return list(index.get(name, ()))
+
+
+def build_import_graph(module_map: Dict[str, Dict],
+                       extra: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
+    """Internal import graph with forward and reverse edges.
+
+    `extra` holds importers that are not part of the map themselves, such
+    as test modules; they get forward edges and appear in `imported_by`.
+    """
+    index = _module_index(module_map)
+    graph = {module: {'imports': set(), 'imported_by': set()} for module in module_map}
+    for module, info in {**module_map, **(extra or {})}.items():
+        node = graph.setdefault(module, {'imports': set(), 'imported_by': set()})
+        for name in set(info['imports']) | set(info.get('from_imports', ())):
+            for target in resolve_import(name, module, index):
+                if target != module:
+                    node['imports'].add(target)
+                    graph[target]['imported_by'].add(module)
+    return {
+        module: {'imports': sorted(node['imports']), 'imported_by': sorted(node['imported_by'])}
+        for module, node in graph.items()
+    }
+
+
+def dependents(graph: Dict[str, Dict], modules: Iterable[str]) -> Set[str]:
+    """`modules` plus every module that imports one of them, transitively."""
+    seen = set(modules)
+    queue = deque(seen)
+    while queue:
+        for importer in graph.get(queue.popleft(), {}).get('imported_by', ()):
+            if importer not in seen:
+                seen.add(importer)
+                queue.append(importer)
+    return seen
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """Parse `-X importtime` output into records with their direct importer.
+
+    Each record has `name`, `self_us`, `cumulative_us`, `depth` and
+    `parent` (the module whose import triggered it, None at top level).
+    Python prints children before their parent, indented one level deeper.
+    """
+    records = []
+    pending = defaultdict(list)
+    for line in stderr.splitlines():
+        if not line.startswith(IMPORTTIME_PREFIX):
+            continue
+        fields = line[len(IMPORTTIME_PREFIX):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        record = {
+            'name': name.strip(),
+            'self_us': int(fields[0]),
+            'cumulative_us': int(fields[1]),
+            'depth': depth,
+            'parent': None,
+        }
+        for child in pending.pop(depth + 1, []):
+            child['parent'] = record['name']
+        pending[depth].append(record)
+        records.append(record)
+    return records
+
+
+def compare_import_profiles(old_path: str, new_path: str, limit: int = 25):
+    """Print the imports whose cumulative cost changed most between two profiles."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    old_costs = {r['name']: r['cumulative_us'] for r in old['imports']}
+    new_costs = {r['name']: r['cumulative_us'] for r in new['imports']}
+    names = sorted(
+        old_costs.keys() | new_costs.keys(),
+        key=lambda n: -abs(new_costs.get(n, 0) - old_costs.get(n, 0)),
+    )
+    table = Table(title=f"Import time: {old['target']} -> {new['target']}")
+    for column in ('module', 'old ms', 'new ms', 'change ms'):
+        table.add_column(column, justify='left' if column == 'module' else 'right')
+    for name in names[:limit]:
+        before, after = old_costs.get(name), new_costs.get(name)
+        table.add_row(
+            name,
+            f"{before / 1000:.1f}" if before is not None else '-',
+            f"{after / 1000:.1f}" if after is not None else '-',
+            f"{((after or 0) - (before or 0)) / 1000:+.1f}",
+        )
+    console.print(table)
+    console.print(
+        f"Total: {old['total_us'] / 1000:.1f} ms -> {new['total_us'] / 1000:.1f} ms"
+    )
+
+
 class ModuleMapper:
-    def __init__(self):
+    def __init__(self, workers: Optional[int] = None, use_cache: bool = True):
         self.root_dir = Path.cwd()
+        self.workers = workers
+        self.use_cache = use_cache
+        self.cache_file = self.root_dir / 'migration_data' / CACHE_FILE
         # Expanded ignored paths
         self.ignored_patterns = {
             '.venv', 'venv', 'env',  # Virtual environments
@@ -21,29 +212,19 @@ class ModuleMapper:
             '.idea', '.vscode',  # IDEs
             'node_modules',  # Node.js
             'site-packages', 'dist-packages',  # Installed packages
-            'build', 'dist', 'egg-info',  # Build artifacts
+            'build', 'dist',  # Build artifacts
             '.tox', '.coverage',  # Testing
             'migrations',  # Django/database migrations
             'tests', 'test'  # Test directories
         }
+        # Gitignore-style patterns for names that vary
+        self.ignored_globs = ['*.egg-info']
         self.module_map: Dict[str, Dict] = {}
         self.import_graph: Dict[str, Dict] = {}
+        self.stats: Dict[str, float] = {}
         
         console.print(f"[bold green]Initializing ModuleMapper at project root:[/bold green] {self.root_dir}")
     
-    def _should_ignore_path(self, path: Path) -> bool:
-        """Check if a path should be ignored based on patterns."""
-        path_parts = str(path).lower().split(os.sep)
-        return any(ignored in path_parts for ignored in self.ignored_patterns)
-
-    def _is_project_python_file(self, file_path: Path) -> bool:
-        """Check if file is a project Python file (not in ignored paths)."""
-        return (
-            file_path.is_file() 
-            and file_path.suffix == '.py'
-            and not self._should_ignore_path(file_path)
-        )
-    
     def _get_relative_module_path(self, file_path: Path) -> str:
         """Get the module path relative to project root."""
         try:
@@ -53,75 +234,120 @@ class ModuleMapper:
             
     def _parse_imports(self, file_path: Path) -> Tuple[Set[str], Set[str]]:
         """Parse imports and exports from a Python file."""
-        imports = set()
-        exports = set()
-        
+        imports, exports, _, error = parse_module(str(file_path))
+        if error:
+            console.print(f"[red]Error parsing {file_path}: {error}[/red]")
+        return set(imports), set(exports)
+
+    def _load_cache(self) -> Dict[str, Dict]:
+        if not self.use_cache or not self.cache_file.exists():
+            return {}
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                tree = ast.parse(f.read())
-                
-            for node in ast.walk(tree):
-                if isinstance(node, (ast.Import, ast.ImportFrom)):
-                    if isinstance(node, ast.Import):
-                        for name in node.names:
-                            imports.add(name.name)
-                    else:
-                        if node.module:
-                            imports.add(node.module)
-                
-                elif isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef)):
-                    if node.name != '__init__':
-                        exports.add(node.name)
-                elif isinstance(node, ast.Assign):
-                    for target in node.targets:
-                        if isinstance(target, ast.Name):
-                            exports.add(target.id)
-                            
-        except Exception as e:
-            console.print(f"[red]Error parsing {file_path}: {e}[/red]")
-            return set(), set()
-            
-        return imports, exports
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if cache.get('version') != CACHE_VERSION:
+            return {}
+        return cache.get('files', {})
+
+    def _save_cache(self, cache: Dict[str, Dict]):
+        if not self.use_cache:
+            return
+        self.cache_file.parent.mkdir(exist_ok=True)
+        tmp_file = self.cache_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'files': cache}, f)
+        os.replace(tmp_file, self.cache_file)
+
+    def _parse_all(self, paths: List[str]) -> List[Tuple[List[str], List[str], List[str], Optional[str]]]:
+        """Parse files in a process pool, or inline when there are only a few."""
+        if len(paths) < MIN_PARALLEL_FILES or self.workers == 1:
+            return [parse_module(path) for path in paths]
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(parse_module, paths, chunksize=16))
+
+    def _find_modules(self) -> List[Tuple[str, Path, os.stat_result]]:
+        """Project Python files as (module name, path, stat) triples."""
+        # Names are compared case-insensitively, so Tests/ and Build/ are skipped too.
+        path_filter = PathFilter(
+            self.ignored_patterns,
+            self.ignored_globs + read_ignore_file(str(self.root_dir / '.gitignore')),
+            ignore_case=True,
+        )
+        found = []
+        for item in scan(self.root_dir, path_filter, include_dirs=False):
+            if not item.name.endswith('.py'):
+                continue
+            file_path = Path(item.path)
+            relative_module = self._get_relative_module_path(file_path)
+            if relative_module:
+                found.append((relative_module, file_path, item.entry.stat()))
+        return found
 
     def map_project(self) -> Dict[str, Dict]:
-        """Map all Python modules in the project."""
+        """Map all Python modules in the project.
+
+        Files whose size and mtime (or, failing that, content hash) match
+        the on-disk cache are not parsed again; the rest are parsed in a
+        process pool.
+        """
         console.print("\n[yellow]Mapping Python modules in project...[/yellow]")
-        
-        for root, dirs, files in os.walk(self.root_dir):
-            # Filter out ignored directories
-            dirs[:] = [d for d in dirs if not any(ignored in d.lower() for ignored in self.ignored_patterns)]
-            
-            current_path = Path(root)
-            
-            # Skip if current path should be ignored
-            if self._should_ignore_path(current_path):
-                continue
-            
-            for file in files:
-                file_path = current_path / file
-                
-                # Skip if not a project Python file
-                if not self._is_project_python_file(file_path):
-                    continue
-                
-                relative_module = self._get_relative_module_path(file_path)
-                if not relative_module:
-                    continue
-                    
-                imports, exports = self._parse_imports(file_path)
-                
+        started = time.perf_counter()
+        cache = self._load_cache()
+        new_cache: Dict[str, Dict] = {}
+        to_parse: List[Tuple[str, str, Dict]] = []
+        errors: List[Tuple[str, str]] = []
+        cached = 0
+
+        for relative_module, file_path, stat in self._find_modules():
+            path = str(file_path)
+            key = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+            entry = cache.get(path)
+            if entry and entry['mtime_ns'] == key['mtime_ns'] and entry['size'] == key['size']:
+                key['sha1'] = entry['sha1']
+            else:
+                key['sha1'] = _file_hash(path)
+            if entry and entry['sha1'] == key['sha1']:
+                new_cache[path] = {**entry, **key}
                 self.module_map[relative_module] = {
-                    'path': str(file_path),
-                    'imports': list(imports),
-                    'exports': list(exports)
+                    'path': path, 'imports': entry['imports'], 'exports': entry['exports'],
+                    'from_imports': entry['from_imports'],
                 }
-                console.print(f"[green]Mapped module:[/green] {relative_module}")
+                cached += 1
+            else:
+                to_parse.append((relative_module, path, key))
+
+        results = self._parse_all([path for _, path, _ in to_parse])
+        for (relative_module, path, key), (imports, exports, from_imports, error) in zip(to_parse, results):
+            entry = {'imports': imports, 'exports': exports, 'from_imports': from_imports}
+            if error:
+                errors.append((path, error))
+            else:
+                new_cache[path] = {**key, **entry}
+            self.module_map[relative_module] = {'path': path, **entry}
+        self._save_cache(new_cache)
+        self.import_graph = build_import_graph(self.module_map)
+
+        self.stats = {
+            'modules': len(self.module_map),
+            'cached': cached,
+            'parsed': len(to_parse),
+            'errors': len(errors),
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+        for path, error in errors:
+            console.print(f"[red]Error parsing {path}: {error}[/red]")
         
         module_count = len(self.module_map)
         if module_count == 0:
             console.print("[yellow]No project Python modules found![/yellow]")
         else:
-            console.print(f"\n[bold green]Found {module_count} project Python modules[/bold green]")
+            console.print(
+                f"\n[bold green]Found {module_count} project Python modules[/bold green] "
+                f"({cached} from cache, {len(to_parse)} parsed, {len(errors)} errors, "
+                f"{self.stats['seconds']}s)"
+            )
         
         return self.module_map
 
@@ -140,6 +366,95 @@ class ModuleMapper:
         console.print(f"\n[bold green]Module map saved to:[/bold green] {module_map_file}")
         return module_map_file
 
+    def profile_imports(self, target: str, cwd: Optional[str] = None,
+                        heavy_ms: float = HEAVY_IMPORT_MS, timeout: float = 300.0) -> Dict:
+        """Measure import cost of an entry point with `-X importtime`.
+
+        `target` is a dotted module, which is imported, or a `.py` path,
+        which is run. Costs are attributed to mapped modules, and slow
+        non-project imports pulled in directly by a project module are
+        flagged as candidates for a deferred (function-level) import.
+        """
+        if target.endswith('.py'):
+            command = [sys.executable, '-X', 'importtime', target]
+        else:
+            command = [sys.executable, '-X', 'importtime', '-c', f'import {target}']
+        cwd = str(cwd or self.root_dir)
+        result = subprocess.run(command, cwd=cwd, capture_output=True, text=True, timeout=timeout)
+        records = parse_importtime(result.stderr)
+        errors = [line for line in result.stderr.splitlines() if not line.startswith(IMPORTTIME_PREFIX)]
+
+        if not self.module_map:
+            self.map_project()
+        index = _module_index(self.module_map)
+        project = {}
+        for record in records:
+            candidates = index.get(record['name'], [])
+            if len(candidates) > 1:
+                candidates = [m for m in candidates if self.module_map[m]['path'].startswith(cwd)]
+            if len(candidates) == 1:
+                project[record['name']] = candidates[0]
+
+        modules = {
+            project[r['name']]: {'name': r['name'], 'self_us': r['self_us'], 'cumulative_us': r['cumulative_us']}
+            for r in records if r['name'] in project
+        }
+        heavy = sorted(
+            (
+                {'module': r['name'], 'cumulative_us': r['cumulative_us'], 'imported_by': project[r['parent']]}
+                for r in records
+                if r['name'] not in project and r['parent'] in project
+                and r['cumulative_us'] >= heavy_ms * 1000
+            ),
+            key=lambda h: -h['cumulative_us'],
+        )
+        return {
+            'target': target,
+            'generated_at': datetime.now().isoformat(),
+            'returncode': result.returncode,
+            'errors': errors[-20:],
+            'total_us': sum(r['cumulative_us'] for r in records if r['depth'] == 0),
+            'modules': modules,
+            'heavy_imports': heavy,
+            'imports': [{k: r[k] for k in ('name', 'self_us', 'cumulative_us', 'parent')} for r in records],
+        }
+
+    def save_import_profile(self, profile: Dict, prefix: str = '') -> Path:
+        """Save an import profile next to the module maps."""
+        output_dir = self.root_dir / 'migration_data'
+        output_dir.mkdir(exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        prefix = f"{prefix}_" if prefix else ""
+        profile_file = output_dir / f'{prefix}import_profile_{timestamp}.json'
+        with open(profile_file, 'w') as f:
+            json.dump(profile, f, indent=2)
+        console.print(f"\n[bold green]Import profile saved to:[/bold green] {profile_file}")
+        return profile_file
+
+
+def print_import_profile(profile: Dict, limit: int = 15):
+    """Summarize a profile: slowest project modules and deferrable imports."""
+    console.print(
+        f"\n[bold]{profile['target']}[/bold]: {profile['total_us'] / 1000:.1f} ms total import time"
+    )
+    if profile['returncode'] != 0 and profile['errors']:
+        console.print(f"[red]Entry point exited with {profile['returncode']}: {profile['errors'][-1]}[/red]")
+    table = Table(title="Project modules")
+    for column in ('module', 'self ms', 'cumulative ms'):
+        table.add_column(column, justify='left' if column == 'module' else 'right')
+    ranked = sorted(profile['modules'].items(), key=lambda item: -item[1]['cumulative_us'])
+    for module, cost in ranked[:limit]:
+        table.add_row(module, f"{cost['self_us'] / 1000:.1f}", f"{cost['cumulative_us'] / 1000:.1f}")
+    console.print(table)
+    if profile['heavy_imports']:
+        console.print("\n[yellow]Heavy imports that could be deferred:[/yellow]")
+        for heavy in profile['heavy_imports'][:limit]:
+            console.print(
+                f"  {heavy['module']} ({heavy['cumulative_us'] / 1000:.1f} ms) "
+                f"imported by {heavy['imported_by']}"
+            )
+
+
 def get_mapping_files() -> List[Path]:
     """Get list of existing mapping files."""
     migration_dir = Path.cwd() / 'migration_data'
@@ -169,16 +484,18 @@ def display_menu():
         "2. Map New Project Structure\n"
         "3. Update Import Statements\n"
         "4. View Existing Mappings\n"
-        "5. Exit"
+        "5. Profile Import Time\n"
+        "6. Compare Import Profiles\n"
+        "7. Exit"
     ))
 
 def main():
     while True:
         display_menu()
         try:
-            choice = int(input("\nEnter your choice (1-5): "))
+            choice = int(input("\nEnter your choice (1-7): "))
             
-            if choice == 5:
+            if choice == 7:
                 console.print("[yellow]Goodbye![/yellow]")
                 break
                 
@@ -228,6 +545,34 @@ def main():
                         data = json.load(f)
                         console.print_json(data=data)
             
+            elif choice == 5:
+                target = input("\nEntry point (module name or .py path): ").strip()
+                cwd = input("Working directory (Enter for project root): ").strip() or None
+                prefix = input("Label for this structure, e.g. original/new: ").strip()
+                mapper = ModuleMapper()
+                mapper.map_project()
+                profile = mapper.profile_imports(target, cwd)
+                print_import_profile(profile)
+                mapper.save_import_profile(profile, prefix)
+            
+            elif choice == 6:
+                migration_dir = Path.cwd() / 'migration_data'
+                profile_files = sorted(migration_dir.glob('*import_profile*.json')) if migration_dir.exists() else []
+                if len(profile_files) < 2:
+                    console.print("[red]Need at least two import profiles to compare.[/red]")
+                    continue
+                
+                console.print("\n[yellow]Available import profiles:[/yellow]")
+                for i, f in enumerate(profile_files, 1):
+                    console.print(f"{i}. {f.name}")
+                
+                old_idx = int(input("\nSelect number for the FIRST profile: ")) - 1
+                new_idx = int(input("Select number for the SECOND profile: ")) - 1
+                if 0 <= old_idx < len(profile_files) and 0 <= new_idx < len(profile_files):
+                    compare_import_profiles(str(profile_files[old_idx]), str(profile_files[new_idx]))
+                else:
+                    console.print("[red]Invalid selection[/red]")
+            
             input("\nPress Enter to continue...")
             console.clear()
             
@@ -1,6 +1,11 @@
 import os
+import sys
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'stream-manager'))
+
+from app.utils.fs_scan import PathFilter, read_ignore_file, scan
+
 # Define the required directories and subdirectories
 required_directories = {
     "app": {
@@ -80,37 +85,29 @@ def create_directories(base_path, directories):
             if subdirs_only:
                 create_directories(dir_path, subdirs_only)
 
-def find_and_create_directories(start_path, directories):
+def find_and_create_directories(start_path, directories, max_depth=None):
     """
-    Recursively search for matching directories starting from the given path
-    and create required subdirectories where needed.
+    Search for matching directories starting from the given path in one
+    pruned pass and create required subdirectories where needed.
     """
-    start_path = Path(start_path)
-    
-    def walk_directory(current_path):
-        try:
-            # Get all subdirectories, excluding ignored ones
-            subdirs = [d for d in current_path.iterdir() 
-                      if d.is_dir() and d.name not in IGNORED_DIRS]
-            
-            # Check if any of the required directories exist at this level
-            for target_dir, sub_structure in directories.items():
-                target_path = current_path / target_dir
-                if target_path.exists():
-                    print(f"\nFound existing directory: {target_path}")
-                    print("Creating any missing subdirectories and files...")
-                    create_directories(target_path, sub_structure)
-            
-            # Recursively check subdirectories
-            for subdir in subdirs:
-                walk_directory(subdir)
-                
-        except PermissionError as e:
-            print(f"Permission denied accessing {current_path}: {e}")
-        except Exception as e:
-            print(f"Error processing {current_path}: {e}")
+    def report(error):
+        if isinstance(error, PermissionError):
+            print(f"Permission denied accessing {error.filename}: {error}")
+        else:
+            print(f"Error processing {error.filename}: {error}")
 
-    walk_directory(start_path)
+    found = scan(
+        start_path,
+        PathFilter(IGNORED_DIRS, read_ignore_file(os.path.join(start_path, '.gitignore'))),
+        max_depth=max_depth,
+        include_files=False, on_error=report,
+    )
+    for item in found:
+        if item.name in directories:
+            target_path = Path(item.path)
+            print(f"\nFound existing directory: {target_path}")
+            print("Creating any missing subdirectories and files...")
+            create_directories(target_path, directories[item.name])
 
 def main():
     current_path = Path.cwd()
@@ -0,0 +1,92 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+COPY_PROFILE = "copy"
+
+
+@dataclass(frozen=True)
+class Rendition:
+    """One rung of the shared encoder ladder."""
+
+    width: int
+    height: int
+    fps: int
+    video_bitrate_kbps: int
+    preset: str = "veryfast"
+
+    @property
+    def gop(self) -> int:
+        # Two-second keyframe interval, which every platform we target accepts.
+        return self.fps * 2
+
+
+# Output profiles selectable per platform. None means passthrough (-c copy).
+OUTPUT_PROFILES: Dict[str, Optional[Rendition]] = {
+    COPY_PROFILE: None,
+    "1080p30": Rendition(width=1920, height=1080, fps=30, video_bitrate_kbps=6000),
+    "720p30": Rendition(width=1280, height=720, fps=30, video_bitrate_kbps=3000),
+    "480p30": Rendition(width=854, height=480, fps=30, video_bitrate_kbps=1200),
+}
+
+
+def get_rendition(profile: Optional[str]) -> Optional[Rendition]:
+    """Resolve a platform's profile name; unknown or empty means passthrough."""
+    return OUTPUT_PROFILES.get(profile or COPY_PROFILE)
+
+
+STANDARD_LATENCY = "standard"
+
+
+@dataclass(frozen=True)
+class LatencyProfile:
+    """Input buffering and output flushing options for a relay.
+
+    `input_args` go before `-i`, `output_args` before each output and
+    `encoder_args` after the x264 options of transcoded renditions.
+    Profiles are ordered by `rank`, lowest latency first.
+    """
+
+    rank: int
+    input_args: Tuple[str, ...] = ()
+    output_args: Tuple[str, ...] = ()
+    encoder_args: Tuple[str, ...] = ()
+
+
+# Latency profiles selectable per platform. "standard" is plain ffmpeg
+# buffering; the others trade resilience to ingest jitter for delay.
+LATENCY_PROFILES: Dict[str, LatencyProfile] = {
+    "minimal": LatencyProfile(
+        rank=0,
+        input_args=(
+            "-fflags", "nobuffer", "-flags", "low_delay",
+            "-probesize", "32", "-analyzeduration", "0",
+            "-rtmp_buffer", "100", "-rw_timeout", "2000000",
+        ),
+        output_args=("-flush_packets", "1", "-max_interleave_delta", "0"),
+        encoder_args=("-tune", "zerolatency"),
+    ),
+    "low": LatencyProfile(
+        rank=1,
+        input_args=(
+            "-fflags", "nobuffer", "-flags", "low_delay",
+            "-rtmp_buffer", "500", "-rw_timeout", "5000000",
+        ),
+        output_args=("-flush_packets", "1"),
+        encoder_args=("-rc-lookahead", "10"),
+    ),
+    STANDARD_LATENCY: LatencyProfile(rank=2),
+}
+
+
+def get_latency_profile(name: Optional[str]) -> LatencyProfile:
+    """Resolve a platform's latency profile name; unknown or empty means standard."""
+    return LATENCY_PROFILES.get(name or STANDARD_LATENCY, LATENCY_PROFILES[STANDARD_LATENCY])
+
+
+def lowest_latency(names: Iterable[Optional[str]]) -> str:
+    """The lowest-latency profile among `names`, for relays shared by several platforms."""
+    return min(
+        (name if name in LATENCY_PROFILES else STANDARD_LATENCY for name in names),
+        key=lambda name: LATENCY_PROFILES[name].rank,
+        default=STANDARD_LATENCY,
+    )
@@ -1,19 +1,15 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
 DATABASE_URL = "sqlite:///./streaming.db"
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    # The cached engine creates the schema once per process.
+    from app.services.data_access import get_engine
+    get_engine()
 
 def get_db():
-    db = SessionLocal()
-    try:
-        return db
-    finally:
-        db.close()
+    """Return a new session; the caller is responsible for closing it."""
+    from app.services.data_access import get_sessionmaker
+    return get_sessionmaker()()
@@ -1,6 +1,6 @@
 import streamlit as st
 import subprocess
-from datetime import datetime
+from datetime import datetime, timedelta
 import sys
 import os
 
@@ -8,36 +8,315 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.stream_manager import StreamManager
-from app.database import init_db, get_db
-from app.models import Platform
+from app.config.profiles import (
+    COPY_PROFILE, LATENCY_PROFILES, OUTPUT_PROFILES, STANDARD_LATENCY,
+)
+from app.services.data_access import get_platform_registry
+from app.services.exporter import EXPORTER_PORT, MetricsExporter
+from app.services.fanout import TEE_RELAY_ID, TeeFanout
+from app.services.log_store import LEVELS, LogStore
+from app.services.key_store import KeyStore, KeyWatcher
+from app.services.metrics_collector import GcloudTransport
+from app.services.relay_agent import AgentClient, AgentError, load_secret, tee_op
+from app.services.scheduler import InstanceGroupNodes, RelayScheduler
+from app.services.segment_buffer import BUFFER_RELAY_ID, SegmentBuffer
+from app.ui.live_dashboard import LiveDashboard
+from app.services.metrics_history import MetricsHistory
+from app.services.relay_supervisor import RelaySupervisor
+from app.services.watchdog import RelayWatchdog
 
 # Initialize session state
-if "terminal_output" not in st.session_state:
-    st.session_state.terminal_output = []
+if "terminal_since" not in st.session_state:
+    st.session_state.terminal_since = None
 if "platforms" not in st.session_state:
     st.session_state.platforms = []
 
-# Initialize database
-init_db()
+# Cached platform registry; the engine and schema are set up once per process
+platform_registry = get_platform_registry()
 
 # Initialize stream manager
 stream_manager = StreamManager()
 
+@st.cache_resource
+def get_log_store():
+    """Bounded relay output, spooled to disk so it survives restarts"""
+    return LogStore()
+
+log_store = get_log_store()
+
+@st.cache_resource
+def get_relay_supervisor():
+    """One supervisor per server process, shared across reruns"""
+    return RelaySupervisor(log_store=log_store)
+
+relay_supervisor = get_relay_supervisor()
+
+@st.cache_resource
+def get_relay_watchdog():
+    """Background watchdog that restarts failed relays"""
+    watchdog = RelayWatchdog(relay_supervisor)
+    watchdog.start()
+    return watchdog
+
+relay_watchdog = get_relay_watchdog()
+
+@st.cache_resource
+def get_segment_buffer():
+    """Rolling ingest buffer that restarted relays start from"""
+    return SegmentBuffer(relay_supervisor, stream_manager)
+
+segment_buffer = get_segment_buffer()
+
+live_dashboard = LiveDashboard(relay_supervisor)
+
+# Lines of terminal history shown; older lines stay in the log spool.
+TERMINAL_LINES = 200
+
+@st.cache_resource
+def get_metrics_history():
+    """Background writer for relay sessions and metric history"""
+    history = MetricsHistory(relay_supervisor)
+    history.start()
+    return history
+
+metrics_history = get_metrics_history()
+
+@st.cache_resource
+def get_metrics_exporter():
+    """OpenMetrics endpoint for relay and host stats"""
+    exporter = MetricsExporter(relay_supervisor, relay_watchdog, segment_buffer=segment_buffer)
+    try:
+        exporter.start(port=EXPORTER_PORT)
+    except OSError as e:
+        # Most likely a standalone exporter already holds the port.
+        print(f"Metrics exporter not started: {e}", file=sys.stderr)
+    return exporter
+
+metrics_exporter = get_metrics_exporter()
+
+@st.cache_resource
+def get_tee_fanout():
+    """Shared tee fan-out process, driven by the same supervisor"""
+    return TeeFanout(relay_supervisor, stream_manager)
+
+tee_fanout = get_tee_fanout()
+
+@st.cache_resource
+def get_key_watcher():
+    """Applies rotated stream keys by restarting only the affected relay"""
+    watcher = KeyWatcher(KeyStore(), platform_registry, relay_supervisor, stream_manager, tee_fanout)
+    watcher.start()
+    return watcher
+
+key_watcher = get_key_watcher()
+
+@st.cache_resource
+def get_agent_client():
+    """Persistent connection to the relay node agent, opened on first use"""
+    return AgentClient(stream_manager.config["agent_address"], load_secret())
+
+@st.cache_resource
+def get_relay_scheduler():
+    """Places relays across the relay instance group by measured headroom"""
+    config = stream_manager.config
+    return RelayScheduler(
+        InstanceGroupNodes(GcloudTransport(config["instance_group"], config["zone"])),
+        load_secret(),
+        log=relay_supervisor.log,
+    )
+
+RELAY_TARGETS = ["Relay node agent", "This host (SSH session)", "Relay instance group (load-aware)"]
+
+FANOUT_MODES = ["One process per platform", "Single tee process (shared transcode ladder)"]
+
 def add_to_terminal(command: str, output: str):
     """Add command and its output to terminal history"""
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    st.session_state.terminal_output.append(f"[{timestamp}] $ {command}")
-    st.session_state.terminal_output.append(output)
-    st.session_state.terminal_output.append("-" * 50)
+    if command:
+        log_store.append(None, "manager", f"$ {command}", "info")
+    log_store.append(None, "manager", output)
+
+def relay_states(relay_target):
+    """State of each platform's relay on the selected target, by platform id"""
+    try:
+        if relay_target == RELAY_TARGETS[0]:
+            return {relay["platform_id"]: relay for relay in get_agent_client().status()}
+        if relay_target == RELAY_TARGETS[2]:
+            return get_relay_scheduler().status()
+    except (OSError, AgentError, subprocess.SubprocessError) as e:
+        st.warning(f"Relay state unavailable: {str(e)}")
+        return {}
+    return {
+        relay.platform_id: {"running": relay.running, "exit_status": relay.exit_status, "pid": relay.pid}
+        for relay in relay_supervisor.relays()
+    }
+
+def route_key_rotations(relay_target):
+    """Have rotated stream keys restart relays where the selected target runs them"""
+    try:
+        key_watcher.agent = get_agent_client() if relay_target == RELAY_TARGETS[0] else None
+        key_watcher.scheduler = get_relay_scheduler() if relay_target == RELAY_TARGETS[2] else None
+    except AgentError as e:
+        st.warning(f"Stream key rotation limited to local relays: {str(e)}")
+
+def dashboard_records(relay_target):
+    """Relay agent metrics for the live tiles, or None to show local relays"""
+    if relay_target == RELAY_TARGETS[1]:
+        return None
+
+    def records():
+        try:
+            if relay_target == RELAY_TARGETS[0]:
+                return get_agent_client().call([{"op": "metrics"}])[0]["relays"]
+            return list(get_relay_scheduler().metrics().values())
+        except (OSError, AgentError, subprocess.SubprocessError):
+            return None
+    return records
+
+def stop_platform_relay(platform_id, relay_target):
+    """Stop one platform's relay where the selected target runs it; returns its exit code"""
+    if relay_target == RELAY_TARGETS[0]:
+        return get_agent_client().call([{"op": "stop", "platform_id": platform_id}])[0].get("exit_status")
+    if relay_target == RELAY_TARGETS[2]:
+        return get_relay_scheduler().stop(platform_id)
+    return relay_supervisor.stop(platform_id)
+
+def restart_platform_relay(platform_id, relay_target):
+    """Restart one platform's relay where the selected target runs it; returns its pid"""
+    if relay_target == RELAY_TARGETS[0]:
+        result = get_agent_client().call([{"op": "restart", "platform_id": platform_id}])[0]
+    elif relay_target == RELAY_TARGETS[2]:
+        result = get_relay_scheduler().restart(platform_id) or {}
+    else:
+        relay = relay_supervisor.restart(platform_id)
+        return relay.pid if relay is not None else None
+    return (result.get("relay") or {}).get("pid")
+
+def remove_platform_relay(platform, relay_target, platforms, states):
+    """Take a deleted platform off the selected target, including any tee there"""
+    if relay_target == RELAY_TARGETS[0]:
+        ops = [{"op": "stop", "platform_id": platform.id}]
+        remaining = [p for p in platforms if p.id != platform.id]
+        if states.get(TEE_RELAY_ID, {}).get("running"):
+            if remaining:
+                ops.append(tee_op(remaining))
+            else:
+                ops.append({"op": "stop", "platform_id": TEE_RELAY_ID})
+        get_agent_client().call(ops)
+    elif relay_target == RELAY_TARGETS[2]:
+        get_relay_scheduler().stop(platform.id)
+    else:
+        tee_fanout.remove(platform.id)
+    # Drop any local record too, so the watchdog cannot bring it back.
+    relay_supervisor.remove(platform.id)
+    relay_watchdog.forget(platform.id)
 
 def setup_stream_commands(platforms):
-    """Generate ffmpeg commands for all platforms"""
-    commands = []
+    """Generate ffmpeg commands for all platforms, keyed by platform id"""
+    commands = {}
     for platform in platforms:
-        cmd = f"ffmpeg -i rtmp://localhost:1935/live -c copy -f flv {platform.rtmp_url}/{platform.stream_key}"
-        commands.append(cmd)
+        cmd = stream_manager.get_platform_command(platform)
+        commands[platform.id] = (platform.name, cmd)
     return commands
 
+def setup_streams_on_agent(platforms, tee: bool):
+    """Start every relay on the node in one batched agent request"""
+    if not platforms:
+        st.warning("No platforms configured")
+        return
+    address = stream_manager.config["agent_address"]
+    for name in ["tee"] if tee else [p.name for p in platforms]:
+        add_to_terminal("", f"Starting relay for {name} on {address}...")
+    try:
+        client = get_agent_client()
+        results = client.call([tee_op(platforms)]) if tee else client.start_platforms(platforms)
+    except (OSError, AgentError) as e:
+        st.error(f"Relay agent unavailable: {str(e)}")
+        add_to_terminal("", f"Error: {str(e)}")
+        return
+    for result in results:
+        relay = result.get("relay") or {}
+        if not result["ok"]:
+            st.error(f"Streaming failed for {relay.get('name')}: {relay.get('error') or result.get('error')}")
+        else:
+            add_to_terminal("", f"{relay['name']}: relay started on node (pid {relay['pid']})")
+    st.success("Streams set up on the relay node")
+
+def setup_streams_on_group(platforms):
+    """Place every relay on the instance group node with room for it"""
+    try:
+        scheduler = get_relay_scheduler()
+        plan = scheduler.reconcile(platforms)
+    except (OSError, AgentError, subprocess.SubprocessError) as e:
+        st.error(f"Scheduling failed: {str(e)}")
+        add_to_terminal("", f"Error: {str(e)}")
+        return
+    if not scheduler.nodes:
+        st.error("No relay nodes reachable in the instance group")
+        return
+    for demand in plan.unplaced:
+        st.error(f"No relay node has room for {demand.name}")
+    st.success(f"{len(plan.placements)} relays placed on {len(scheduler.nodes)} nodes")
+
+def render_terminal(placeholder):
+    """Show the newest terminal lines since the terminal was last cleared"""
+    records = log_store.tail(TERMINAL_LINES, since=st.session_state.terminal_since)
+    placeholder.code("\n".join(record.format() for record in records) or " ", language=None)
+
+def render_log_search(names):
+    """Filter the log spool by platform, level and time range"""
+    with st.expander("Search relay logs"):
+        sources = {"All": None, **{name: platform_id for platform_id, name in names.items()}}
+        source = st.selectbox("Relay", list(sources))
+        level = st.selectbox("Minimum level", list(LEVELS))
+        minutes = st.number_input("Last minutes", min_value=1, value=60)
+        if st.button("Search"):
+            records = log_store.search(
+                platform_id=sources[source],
+                level=level,
+                since=datetime.now() - timedelta(minutes=minutes),
+            )
+            st.caption(f"{len(records)} lines")
+            st.code("\n".join(record.format() for record in records) or " ", language=None)
+
+def render_segment_buffer(limit: int = 5):
+    """Show the segment buffer's size and the latest recoveries from it"""
+    if not segment_buffer.running:
+        return
+    stats = segment_buffer.stats()
+    age = f"{stats.age_seconds:.1f}s ago" if stats.age_seconds is not None else "none yet"
+    st.caption(
+        f"Segment buffer: {stats.segments} segments, {stats.window_seconds:.1f}s, "
+        f"{stats.disk_bytes / 1_000_000:.1f} MB on disk, last segment {age}"
+    )
+    recoveries = list(segment_buffer.recoveries)[-limit:]
+    if recoveries:
+        names = {relay.platform_id: relay.name for relay in relay_supervisor.relays()}
+        st.table([
+            {
+                "platform": names.get(recovery.platform_id, recovery.platform_id),
+                "recovered": recovery.started_at.strftime("%H:%M:%S"),
+                "first progress (s)": recovery.first_progress_seconds,
+            }
+            for recovery in recoveries
+        ])
+
+def render_restart_events(limit: int = 10):
+    """Show the most recent automatic relay restarts"""
+    events = list(relay_watchdog.events)[-limit:]
+    if events:
+        st.subheader("Recent Restarts")
+        st.table([
+            {
+                "platform": event.name,
+                "reason": event.reason,
+                "attempt": event.attempt,
+                "backoff (s)": round(event.delay, 1),
+                "detected": event.detected_at.strftime("%H:%M:%S"),
+                "restarted": event.restarted_at.strftime("%H:%M:%S") if event.restarted_at else "pending",
+            }
+            for event in reversed(events)
+        ])
+
 def main():
     st.title("Multi-Platform Stream Manager")
     
@@ -47,16 +326,19 @@ def main():
         platform_name = st.text_input("Platform Name")
         rtmp_url = st.text_input("RTMP URL")
         stream_key = st.text_input("Stream Key", type="password")
+        output_profile = st.selectbox("Output Profile", list(OUTPUT_PROFILES))
+        latency_profile = st.selectbox(
+            "Latency Profile", list(LATENCY_PROFILES), index=list(LATENCY_PROFILES).index(STANDARD_LATENCY)
+        )
         
         if st.button("Add Platform"):
-            db = get_db()
-            platform = Platform(
+            platform_registry.add(
                 name=platform_name,
                 rtmp_url=rtmp_url,
-                stream_key=stream_key
+                stream_key=stream_key,
+                output_profile=output_profile,
+                latency_profile=latency_profile
             )
-            db.add(platform)
-            db.commit()
             st.success(f"Added platform: {platform_name}")
             add_to_terminal(
                 f"Adding platform: {platform_name}",
@@ -68,24 +350,62 @@ def main():
     
     with col1:
         st.header("Stream Management")
-        db = get_db()
-        platforms = db.query(Platform).all()
+        platforms = platform_registry.all()
+
+        fanout_mode = st.radio("Fan-out mode", FANOUT_MODES)
+        relay_target = st.radio("Relay target", RELAY_TARGETS, index=1)
+        route_key_rotations(relay_target)
+        states = relay_states(relay_target)
 
         # Display configured platforms
         st.subheader("Configured Platforms")
         for platform in platforms:
-            st.text(f"• {platform.name}")
+            st.text(
+                f"• {platform.name} ({platform.output_profile or COPY_PROFILE}, "
+                f"{platform.latency_profile or STANDARD_LATENCY} latency)"
+            )
             platform_col1, platform_col2 = st.columns(2)
             
             # Add individual platform controls if needed
             with platform_col1:
                 if st.button(f"Delete {platform.name}", key=f"delete_{platform.id}"):
-                    db.delete(platform)
-                    db.commit()
-                    st.rerun()
+                    try:
+                        remove_platform_relay(platform, relay_target, platforms, states)
+                    except (OSError, AgentError, subprocess.SubprocessError) as e:
+                        st.error(f"Failed to stop relay for {platform.name}: {str(e)}")
+                        add_to_terminal("", f"Error: {str(e)}")
+                    else:
+                        platform_registry.delete(platform.id)
+                        st.rerun()
+
+            with platform_col2:
+                relay = states.get(platform.id)
+                if relay is not None and relay["running"]:
+                    stop_col, restart_col = st.columns(2)
+                    try:
+                        if stop_col.button("Stop", key=f"stop_{platform.id}"):
+                            code = stop_platform_relay(platform.id, relay_target)
+                            add_to_terminal(f"Stopping relay: {platform.name}", f"Relay exited with code {code}")
+                            st.rerun()
+                        if restart_col.button("Restart", key=f"restart_{platform.id}"):
+                            pid = restart_platform_relay(platform.id, relay_target)
+                            add_to_terminal(f"Restarting relay: {platform.name}", f"Relay restarted (pid {pid})")
+                    except (OSError, AgentError, subprocess.SubprocessError) as e:
+                        st.error(f"Relay control failed for {platform.name}: {str(e)}")
+                        add_to_terminal("", f"Error: {str(e)}")
+                elif relay is not None and relay["exit_status"] is not None:
+                    st.caption(f"Exited with code {relay['exit_status']}")
+
+        use_buffer = st.checkbox("Keep a segment buffer for fast relay recovery", value=True)
+
+        setup_requested = st.button("Connect and Setup Streams")
+        if setup_requested and relay_target == RELAY_TARGETS[0]:
+            setup_streams_on_agent(platforms, fanout_mode == FANOUT_MODES[1])
+        elif setup_requested and relay_target == RELAY_TARGETS[2]:
+            setup_streams_on_group(platforms)
 
         # Single SSH connection for all platforms
-        if st.button("Connect and Setup Streams"):
+        elif setup_requested:
             command = stream_manager.get_ssh_command()
             add_to_terminal(command, "Establishing SSH connection...")
             
@@ -106,30 +426,21 @@ def main():
                     if output:
                         add_to_terminal("", output.strip())
 
-                # Once connected, set up streaming commands
-                stream_commands = setup_stream_commands(platforms)
-                for cmd in stream_commands:
-                    add_to_terminal(
-                        cmd,
-                        "Setting up stream relay..."
-                    )
-                    try:
-                        stream_process = subprocess.Popen(
-                            cmd.split(),
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE,
-                            text=True
-                        )
-                        # Monitor stream setup
-                        while True:
-                            output = stream_process.stdout.readline()
-                            if output == "" and stream_process.poll() is not None:
-                                break
-                            if output:
-                                add_to_terminal("", output.strip())
-                    except Exception as e:
-                        st.error(f"Streaming failed: {str(e)}")
-                        add_to_terminal("", f"Error: {str(e)}")
+                # Once connected, start every relay at once
+                if use_buffer and not segment_buffer.running:
+                    relay = segment_buffer.start()
+                    add_to_terminal(" ".join(relay.command), "Starting segment buffer...")
+                if fanout_mode == FANOUT_MODES[1]:
+                    relays = [tee_fanout.sync(platforms)]
+                    add_to_terminal(tee_fanout.get_command(), "Setting up tee relay...")
+                else:
+                    stream_commands = setup_stream_commands(platforms)
+                    for name, cmd in stream_commands.values():
+                        add_to_terminal(cmd, f"Setting up stream relay for {name}...")
+                    relays = relay_supervisor.start_all(stream_commands)
+                for relay in relays:
+                    if relay is not None and relay.error:
+                        st.error(f"Streaming failed for {relay.name}: {relay.error}")
 
                 st.success("Successfully connected and set up streams")
                 
@@ -137,40 +448,57 @@ def main():
                 st.error(f"Connection failed: {str(e)}")
                 add_to_terminal("", f"Error: {str(e)}")
 
+        render_segment_buffer()
+        render_restart_events()
+
         # Optional: Add stop all streams button
         if st.button("Stop All Streams"):
             try:
-                # Kill all ffmpeg processes
-                kill_cmd = "pkill ffmpeg"
-                process = subprocess.run(
-                    kill_cmd.split(),
-                    capture_output=True,
-                    text=True
-                )
-                add_to_terminal(kill_cmd, "Stopping all streams...")
+                # Stop only the relays this manager started
+                if relay_target == RELAY_TARGETS[0]:
+                    get_agent_client().call([{"op": "stop_all"}])
+                elif relay_target == RELAY_TARGETS[2]:
+                    get_relay_scheduler().stop_all()
+                else:
+                    relay_supervisor.stop_all()
+                add_to_terminal("Stopping all relays", "Stopping all streams...")
                 st.success("All streams stopped")
             except Exception as e:
                 st.error(f"Failed to stop streams: {str(e)}")
                 add_to_terminal("", f"Error: {str(e)}")
 
-    # Terminal output in right column
+    # Live status and terminal output in right column
     with col2:
-        st.header("Terminal Output")
-        terminal_container = st.container()
-        
-        with terminal_container:
-            terminal_text = "\n".join(st.session_state.terminal_output)
-            st.text_area(
-                label="Terminal Output",
-                value=terminal_text,
-                height=400,
-                key="terminal",
-            )
+        live = st.checkbox("Live updates", value=True)
+        st.header("Relay Status")
+        status_container = st.container()
 
+        st.header("Terminal Output")
         # Add clear terminal button
         if st.button("Clear Terminal"):
-            st.session_state.terminal_output = []
+            st.session_state.terminal_since = datetime.now()
             st.rerun()
+        terminal = st.empty()
+        render_terminal(terminal)
+        terminal_sequence = log_store.sequence
+
+        names = {platform.id: platform.name for platform in platforms}
+        names.update({TEE_RELAY_ID: "tee", BUFFER_RELAY_ID: "buffer"})
+        render_log_search(names)
+
+        def refresh_terminal():
+            nonlocal terminal_sequence
+            if log_store.sequence != terminal_sequence:
+                terminal_sequence = log_store.sequence
+                render_terminal(terminal)
+
+        with status_container:
+            records = dashboard_records(relay_target)
+            if live:
+                # Blocks until the next interaction; must be drawn last.
+                live_dashboard.run(names, on_tick=refresh_terminal, records=records)
+            else:
+                live_dashboard.render_once(names, records)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Float, Index, UniqueConstraint
 from datetime import datetime
 from app.database import Base
 
@@ -10,4 +10,83 @@ class Platform(Base):
     name = Column(String, unique=True, index=True)
     rtmp_url = Column(String)
     stream_key = Column(String)
+    # Key into app.config.profiles.OUTPUT_PROFILES; "copy" relays the source as-is.
+    output_profile = Column(String, default="copy")
+    # Key into app.config.profiles.LATENCY_PROFILES; "standard" adds no flags.
+    latency_profile = Column(String, default="standard")
     created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class RelaySession(Base):
+    __tablename__ = "relay_sessions"
+
+    id = Column(Integer, primary_key=True)
+    platform_id = Column(Integer, nullable=False)
+    pid = Column(Integer)
+    command = Column(String)
+    started_at = Column(DateTime, nullable=False)
+    ended_at = Column(DateTime)
+    exit_status = Column(Integer)
+
+    __table_args__ = (
+        Index("ix_relay_sessions_platform_started", "platform_id", "started_at"),
+    )
+
+
+class MetricSample(Base):
+    """Raw per-relay metrics, one row per platform per 10-second interval."""
+
+    __tablename__ = "metric_samples"
+
+    id = Column(Integer, primary_key=True)
+    platform_id = Column(Integer, nullable=False)
+    ts = Column(Integer, nullable=False)  # interval start, unix seconds
+    bitrate_avg = Column(Float)
+    bitrate_min = Column(Float)
+    bitrate_max = Column(Float)
+    fps_avg = Column(Float)
+    speed_avg = Column(Float)
+    drop_frames = Column(Integer, default=0)
+    samples = Column(Integer, default=0)
+
+    __table_args__ = (
+        Index("ix_metric_samples_platform_ts", "platform_id", "ts"),
+        Index("ix_metric_samples_ts", "ts"),
+    )
+
+
+class MetricRollup(Base):
+    """Metric samples rolled up to coarser intervals (60s and 3600s)."""
+
+    __tablename__ = "metric_rollups"
+
+    platform_id = Column(Integer, primary_key=True)
+    resolution = Column(Integer, primary_key=True)  # interval length, seconds
+    ts = Column(Integer, primary_key=True)  # interval start, unix seconds
+    bitrate_avg = Column(Float)
+    bitrate_min = Column(Float)
+    bitrate_max = Column(Float)
+    fps_avg = Column(Float)
+    speed_avg = Column(Float)
+    drop_frames = Column(Integer, default=0)
+    samples = Column(Integer, default=0)
+
+    __table_args__ = (
+        Index("ix_metric_rollups_resolution_ts", "resolution", "ts"),
+    )
+
+
+class StreamKeyVersion(Base):
+    """Versioned stream keys; the local stand-in for Secret Manager versions."""
+
+    __tablename__ = "stream_key_versions"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)  # lower-cased platform name, e.g. "youtube"
+    version = Column(Integer, nullable=False)
+    value = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("name", "version", name="uq_stream_key_versions_name_version"),
+    )
@@ -0,0 +1,173 @@
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator, List, Optional
+
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from app.config.profiles import COPY_PROFILE, STANDARD_LATENCY
+from app.database import Base, DATABASE_URL
+from app.models import Platform
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+@lru_cache(maxsize=None)
+def get_engine(url: str = DATABASE_URL) -> Engine:
+    """Process-wide engine; the schema is created once, on first use."""
+    if url.startswith("sqlite"):
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            poolclass=QueuePool,
+            pool_size=5,
+            max_overflow=10,
+        )
+        event.listen(engine, "connect", _apply_sqlite_pragmas)
+    else:
+        engine = create_engine(url, pool_size=5, max_overflow=10, pool_pre_ping=True)
+    Base.metadata.create_all(bind=engine)
+    _add_missing_columns(engine)
+    return engine
+
+
+def _add_missing_columns(engine: Engine):
+    """Add model columns that an existing database predates.
+
+    `create_all` only creates missing tables, so a column added to an
+    existing model (such as `Platform.output_profile`) is added here. New
+    columns must be nullable or carry a scalar default.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(engine.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                default = column.default
+                if default is not None and default.is_scalar:
+                    value = f"'{default.arg}'" if isinstance(default.arg, str) else default.arg
+                    ddl += f" DEFAULT {value}"
+                connection.exec_driver_sql(ddl)
+
+
+@lru_cache(maxsize=None)
+def get_sessionmaker(url: str = DATABASE_URL) -> sessionmaker:
+    # Objects stay readable after commit so cached rows outlive their session.
+    return sessionmaker(
+        bind=get_engine(url), autocommit=False, autoflush=False, expire_on_commit=False
+    )
+
+
+@contextmanager
+def session_scope(url: str = DATABASE_URL) -> Iterator[Session]:
+    """Session for one unit of work: committed on success, rolled back on error."""
+    session = get_sessionmaker(url)()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+class PlatformRegistry:
+    """In-memory cache of configured platforms.
+
+    The table is read once and served from memory until a platform is
+    added or deleted through the registry, which invalidates the cache.
+    """
+
+    def __init__(self, url: str = DATABASE_URL):
+        self.url = url
+        self._platforms: Optional[List[Platform]] = None
+        self._lock = threading.Lock()
+
+    def all(self) -> List[Platform]:
+        with self._lock:
+            if self._platforms is None:
+                with session_scope(self.url) as session:
+                    platforms = session.query(Platform).order_by(Platform.id).all()
+                    session.expunge_all()
+                self._platforms = platforms
+            return list(self._platforms)
+
+    def get(self, platform_id: int) -> Optional[Platform]:
+        for platform in self.all():
+            if platform.id == platform_id:
+                return platform
+        return None
+
+    def add(
+        self,
+        name: str,
+        rtmp_url: str,
+        stream_key: str,
+        output_profile: str = COPY_PROFILE,
+        latency_profile: str = STANDARD_LATENCY,
+    ) -> Platform:
+        with session_scope(self.url) as session:
+            platform = Platform(
+                name=name, rtmp_url=rtmp_url, stream_key=stream_key,
+                output_profile=output_profile, latency_profile=latency_profile,
+            )
+            session.add(platform)
+            session.flush()
+            session.expunge(platform)
+        self.invalidate()
+        return platform
+
+    def update_stream_key(self, platform_id: int, stream_key: str) -> bool:
+        with session_scope(self.url) as session:
+            updated = (
+                session.query(Platform)
+                .filter(Platform.id == platform_id)
+                .update({Platform.stream_key: stream_key})
+            )
+        self.invalidate()
+        return bool(updated)
+
+    def update_latency_profile(self, platform_id: int, latency_profile: str) -> bool:
+        with session_scope(self.url) as session:
+            updated = (
+                session.query(Platform)
+                .filter(Platform.id == platform_id)
+                .update({Platform.latency_profile: latency_profile})
+            )
+        self.invalidate()
+        return bool(updated)
+
+    def delete(self, platform_id: int) -> bool:
+        with session_scope(self.url) as session:
+            deleted = session.query(Platform).filter(Platform.id == platform_id).delete()
+        self.invalidate()
+        return bool(deleted)
+
+    def invalidate(self):
+        with self._lock:
+            self._platforms = None
+
+
+@lru_cache(maxsize=None)
+def get_platform_registry(url: str = DATABASE_URL) -> PlatformRegistry:
+    return PlatformRegistry(url)
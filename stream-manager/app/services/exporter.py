@@ -0,0 +1,269 @@
+"""OpenMetrics exporter for relay and host health.
+
+Serves `/metrics` in OpenMetrics text format for Prometheus-style
+scrapers. Started from `app/main.py` it reports the live supervisor,
+including ffmpeg progress telemetry and watchdog restarts; started on its
+own it reads the relay registry state file and reports process state and
+CPU/RSS only, since progress pipes belong to the Streamlit process.
+
+    python -m app.services.exporter --port 9464
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.services.process_registry import STATE_FILE, Relay
+from app.services.relay_supervisor import RelaySupervisor
+from app.services.segment_buffer import SegmentBuffer
+from app.services.watchdog import RelayWatchdog, RestartEvent
+from app.utils import procstat
+
+EXPORTER_PORT = 9464
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# name -> (type, help); rendered headers are built once at import time.
+FAMILIES = {
+    "relay_up": ("gauge", "1 if the relay process for the platform is running."),
+    "relay_start_time_seconds": ("gauge", "Unix time the current relay process was started."),
+    "relay_restarts": ("counter", "Watchdog restarts of the relay since the exporter started."),
+    "relay_bitrate_kbps": ("gauge", "Output bitrate reported by ffmpeg progress."),
+    "relay_fps": ("gauge", "Frames per second reported by ffmpeg progress."),
+    "relay_speed_ratio": ("gauge", "Encoding speed relative to real time."),
+    "relay_dropped_frames": ("counter", "Frames dropped by the current relay process."),
+    "relay_duplicated_frames": ("counter", "Frames duplicated by the current relay process."),
+    "relay_progress_age_seconds": ("gauge", "Seconds since the relay last reported progress."),
+    "relay_cpu_seconds": ("counter", "User and system CPU time of the relay process."),
+    "relay_resident_memory_bytes": ("gauge", "Resident memory of the relay process."),
+    "host_load1": ("gauge", "1-minute load average."),
+    "host_load5": ("gauge", "5-minute load average."),
+    "host_load15": ("gauge", "15-minute load average."),
+    "host_memory_total_bytes": ("gauge", "Total memory of the host."),
+    "host_memory_available_bytes": ("gauge", "Memory available for new processes."),
+    "relay_recovery_seconds": ("gauge", "Start to first progress of the last relay recovered from the segment buffer."),
+    "segment_buffer_segments": ("gauge", "Completed segments listed in the segment buffer playlist."),
+    "segment_buffer_window_seconds": ("gauge", "Media time held by the segment buffer."),
+    "segment_buffer_disk_bytes": ("gauge", "Disk space used by segment buffer files."),
+    "segment_buffer_age_seconds": ("gauge", "Seconds since the segment buffer last completed a segment."),
+    "exporter_render_seconds": ("gauge", "Time spent rendering the previous scrape body."),
+}
+_HEADERS = {
+    name: f"# TYPE {name} {kind}\n# HELP {name} {text}\n"
+    for name, (kind, text) in FAMILIES.items()
+}
+_SUFFIX = {name: "_total" if kind == "counter" else "" for name, (kind, _) in FAMILIES.items()}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _host_memory() -> Dict[str, int]:
+    memory = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("MemTotal", "MemAvailable"):
+                    memory[key] = int(rest.split()[0]) * 1024
+    except OSError:
+        pass
+    return memory
+
+
+def _state_file_relays(state_file: str) -> Callable[[], List[Relay]]:
+    """Read-only view of the relays the Streamlit server last recorded."""
+    def relays() -> List[Relay]:
+        try:
+            with open(state_file) as f:
+                return [Relay.from_dict(data) for data in json.load(f)]
+        except (OSError, ValueError):
+            return []
+    return relays
+
+
+class MetricsExporter:
+    """Renders relay and host metrics at most once per `interval`.
+
+    Family headers and per-relay label sets are computed once and reused,
+    and a scrape within `interval` of the previous render is answered with
+    the cached body, so frequent scrapes cost a dictionary lookup and a
+    socket write.
+    """
+
+    def __init__(
+        self,
+        supervisor: Optional[RelaySupervisor] = None,
+        watchdog: Optional[RelayWatchdog] = None,
+        interval: float = 5.0,
+        state_file: str = STATE_FILE,
+        segment_buffer: Optional[SegmentBuffer] = None,
+    ):
+        self.supervisor = supervisor
+        self.segment_buffer = segment_buffer
+        self.interval = interval
+        self._relays = supervisor.relays if supervisor else _state_file_relays(state_file)
+        self._restarts: Dict[int, int] = {}
+        self._labels: Dict[Tuple[int, str], str] = {}
+        self._body = b""
+        self._rendered_at = 0.0
+        self._render_seconds = 0.0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        if watchdog is not None:
+            watchdog.on_restart(self._on_restart)
+
+    def _on_restart(self, event: RestartEvent):
+        with self._lock:
+            self._restarts[event.platform_id] = self._restarts.get(event.platform_id, 0) + 1
+
+    def _label(self, relay: Relay, used: Dict[Tuple[int, str], str]) -> str:
+        key = (relay.platform_id, relay.name)
+        label = self._labels.get(key)
+        if label is None:
+            label = f'{{platform_id="{relay.platform_id}",platform="{_escape(relay.name)}"}}'
+        used[key] = label
+        return label
+
+    def _collect(self) -> Dict[str, List[str]]:
+        samples: Dict[str, List[str]] = {name: [] for name in FAMILIES}
+
+        def add(name: str, labels: str, value):
+            if value is not None:
+                samples[name].append(f"{name}{_SUFFIX[name]}{labels} {_format(value)}\n")
+
+        telemetry = self.supervisor.telemetry.snapshot() if self.supervisor else {}
+        recoveries = {}
+        if self.segment_buffer is not None:
+            for recovery in self.segment_buffer.recoveries:
+                recoveries[recovery.platform_id] = recovery.first_progress_seconds
+        now = time.time()
+        used: Dict[Tuple[int, str], str] = {}
+        for relay in self._relays():
+            labels = self._label(relay, used)
+            running = relay.running
+            add("relay_up", labels, 1 if running else 0)
+            add("relay_restarts", labels, self._restarts.get(relay.platform_id, 0))
+            if relay.started_at is not None:
+                add("relay_start_time_seconds", labels, relay.started_at.timestamp())
+            metrics = telemetry.get(relay.platform_id)
+            if metrics is not None:
+                add("relay_bitrate_kbps", labels, metrics.bitrate_kbps)
+                add("relay_fps", labels, metrics.fps)
+                add("relay_speed_ratio", labels, metrics.speed)
+                add("relay_dropped_frames", labels, metrics.drop_frames)
+                add("relay_duplicated_frames", labels, metrics.dup_frames)
+                add("relay_progress_age_seconds", labels, round(now - metrics.ts.timestamp(), 3))
+            stat = procstat.sample(relay.pid) if running and relay.pid else None
+            if stat is not None:
+                add("relay_cpu_seconds", labels, stat.cpu_seconds)
+                add("relay_resident_memory_bytes", labels, stat.rss_bytes)
+            add("relay_recovery_seconds", labels, recoveries.get(relay.platform_id))
+        # Only relays still in the registry keep a cached label set and
+        # a restart count.
+        self._labels = used
+        platform_ids = {platform_id for platform_id, _ in used}
+        with self._lock:
+            self._restarts = {
+                platform_id: count for platform_id, count in self._restarts.items()
+                if platform_id in platform_ids
+            }
+
+        if self.segment_buffer is not None and self.segment_buffer.running:
+            buffer = self.segment_buffer.stats()
+            add("segment_buffer_segments", "", buffer.segments)
+            add("segment_buffer_window_seconds", "", buffer.window_seconds)
+            add("segment_buffer_disk_bytes", "", buffer.disk_bytes)
+            add("segment_buffer_age_seconds", "", buffer.age_seconds)
+
+        if hasattr(os, "getloadavg"):
+            load1, load5, load15 = os.getloadavg()
+            add("host_load1", "", load1)
+            add("host_load5", "", load5)
+            add("host_load15", "", load15)
+        memory = _host_memory()
+        add("host_memory_total_bytes", "", memory.get("MemTotal"))
+        add("host_memory_available_bytes", "", memory.get("MemAvailable"))
+        add("exporter_render_seconds", "", round(self._render_seconds, 6))
+        return samples
+
+    def render(self) -> bytes:
+        """The current scrape body, re-rendered only once it is `interval` old."""
+        with self._lock:
+            if self._body and time.monotonic() - self._rendered_at < self.interval:
+                return self._body
+            started = time.perf_counter()
+            samples = self._collect()
+            parts = []
+            for name, lines in samples.items():
+                if lines:
+                    parts.append(_HEADERS[name])
+                    parts.extend(lines)
+            parts.append("# EOF\n")
+            self._body = "".join(parts).encode()
+            self._rendered_at = time.monotonic()
+            self._render_seconds = time.perf_counter() - started
+            return self._body
+
+    def start(self, host: str = "0.0.0.0", port: int = EXPORTER_PORT) -> ThreadingHTTPServer:
+        """Serve `/metrics` from a background thread."""
+        if self._server is not None:
+            return self._server
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(
+            target=self._server.serve_forever, name="metrics-exporter", daemon=True
+        ).start()
+        return self._server
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve relay metrics for Prometheus")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=EXPORTER_PORT)
+    parser.add_argument("--interval", type=float, default=5.0,
+                        help="minimum seconds between renders")
+    parser.add_argument("--state-file", default=STATE_FILE)
+    args = parser.parse_args()
+
+    exporter = MetricsExporter(interval=args.interval, state_file=args.state_file)
+    server = exporter.start(args.host, args.port)
+    print(f"Serving metrics on http://{args.host}:{server.server_port}/metrics")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        exporter.stop()
+
+
+if __name__ == "__main__":
+    main()
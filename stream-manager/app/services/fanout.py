@@ -0,0 +1,86 @@
+from typing import Dict, Optional, Tuple
+
+from app.config.profiles import lowest_latency
+
+from app.services.process_registry import Relay
+from app.services.relay_supervisor import RelaySupervisor
+from app.stream_manager import StreamManager
+
+# Supervisor key for the shared tee process; platform ids start at 1.
+TEE_RELAY_ID = 0
+
+
+class TeeFanout:
+    """Single-process fan-out of one ingest to every platform.
+
+    Destinations are added and removed one platform at a time. The tee
+    muxer cannot change its outputs while running, so a change respawns a
+    running fan-out with the new destination set; destinations that fail
+    at runtime are dropped by `onfail=ignore` without a respawn.
+
+    Platforms with an output profile other than passthrough are served from
+    the shared transcoding ladder inside the same process. The shared input
+    uses the lowest-latency profile any destination asks for.
+    """
+
+    def __init__(self, supervisor: RelaySupervisor, stream_manager: StreamManager):
+        self.supervisor = supervisor
+        self.stream_manager = stream_manager
+        self._destinations: Dict[int, Tuple[str, str, Optional[str]]] = {}
+        self._latency: Dict[int, Optional[str]] = {}
+
+    @property
+    def destinations(self) -> Dict[int, Tuple[str, str, Optional[str]]]:
+        return dict(self._destinations)
+
+    def add(
+        self,
+        platform_id: int,
+        rtmp_url: str,
+        stream_key: str,
+        output_profile: Optional[str] = None,
+        latency_profile: Optional[str] = None,
+    ) -> Optional[Relay]:
+        destination = (rtmp_url, stream_key, output_profile)
+        if (
+            self._destinations.get(platform_id) == destination
+            and self._latency.get(platform_id) == latency_profile
+        ):
+            return None
+        self._destinations[platform_id] = destination
+        self._latency[platform_id] = latency_profile
+        return self._respawn() if self.running else None
+
+    def remove(self, platform_id: int) -> Optional[Relay]:
+        self._latency.pop(platform_id, None)
+        if self._destinations.pop(platform_id, None) is None:
+            return None
+        return self._respawn() if self.running else None
+
+    def sync(self, platforms) -> Optional[Relay]:
+        """Replace the destination set with the given platforms."""
+        wanted = {p.id: (p.rtmp_url, p.stream_key, p.output_profile) for p in platforms}
+        latency = {p.id: p.latency_profile for p in platforms}
+        if wanted == self._destinations and latency == self._latency and self.running:
+            return None
+        self._destinations = wanted
+        self._latency = latency
+        return self._respawn()
+
+    @property
+    def running(self) -> bool:
+        return any(
+            r.platform_id == TEE_RELAY_ID and r.running for r in self.supervisor.relays()
+        )
+
+    def get_command(self) -> str:
+        return self.stream_manager.get_ladder_command(
+            self._destinations.values(), lowest_latency(self._latency.values())
+        )
+
+    def _respawn(self) -> Optional[Relay]:
+        if not self._destinations:
+            self.supervisor.stop(TEE_RELAY_ID)
+            return None
+        # A running tee is being replaced, so it may start from buffered media.
+        return self.supervisor.start(TEE_RELAY_ID, "tee", self.get_command(), recover=self.running)
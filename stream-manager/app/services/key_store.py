@@ -0,0 +1,255 @@
+"""Versioned stream keys with in-place relay reload.
+
+Key versions live in the stream manager's database, as a local stand-in
+for Secret Manager versions. A `KeyWatcher` polls for new versions and
+restarts only the relay whose key changed, instead of replacing every
+relay node.
+
+    echo '{"youtube": "new-key"}' | python -m app.services.key_store import -
+    python -m app.services.key_store list
+"""
+import argparse
+import json
+import sys
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+from sqlalchemy import func
+
+from app.database import DATABASE_URL
+from app.models import StreamKeyVersion
+from app.services.data_access import PlatformRegistry, session_scope
+from app.services.fanout import TEE_RELAY_ID, TeeFanout
+from app.services.relay_agent import AgentClient, AgentError, platform_op, tee_op
+from app.services.relay_supervisor import RelaySupervisor
+from app.services.scheduler import RelayScheduler
+from app.stream_manager import StreamManager
+
+
+def key_name(platform_name: str) -> str:
+    """Key names are lower-cased platform names, as in the Secret Manager payload."""
+    return platform_name.strip().lower()
+
+
+class KeyStore:
+    """Append-only key versions; a new version is only added when the value changes."""
+
+    def __init__(self, url: str = DATABASE_URL):
+        self.url = url
+
+    def add_version(self, name: str, value: str) -> int:
+        """Store `value` as the newest version of `name` and return its number."""
+        name = key_name(name)
+        with session_scope(self.url) as session:
+            latest = (
+                session.query(StreamKeyVersion)
+                .filter(StreamKeyVersion.name == name)
+                .order_by(StreamKeyVersion.version.desc())
+                .first()
+            )
+            if latest is not None and latest.value == value:
+                return latest.version
+            version = (latest.version if latest else 0) + 1
+            session.add(StreamKeyVersion(name=name, version=version, value=value))
+        return version
+
+    def import_payload(self, payload: Dict[str, str]) -> Dict[str, int]:
+        """Add a version for every key whose value changed; returns name -> version."""
+        return {name: self.add_version(name, value) for name, value in payload.items() if value}
+
+    def latest(self, name: str) -> Optional[StreamKeyVersion]:
+        with session_scope(self.url) as session:
+            key = (
+                session.query(StreamKeyVersion)
+                .filter(StreamKeyVersion.name == key_name(name))
+                .order_by(StreamKeyVersion.version.desc())
+                .first()
+            )
+            if key is not None:
+                session.expunge(key)
+            return key
+
+    def latest_versions(self) -> Dict[str, int]:
+        """Newest version number per key, in one query; cheap enough to poll."""
+        with session_scope(self.url) as session:
+            rows = (
+                session.query(StreamKeyVersion.name, func.max(StreamKeyVersion.version))
+                .group_by(StreamKeyVersion.name)
+                .all()
+            )
+        return dict(rows)
+
+
+@dataclass
+class KeyRotation:
+    platform_id: int
+    name: str
+    version: int
+    applied_at: datetime
+    restarted: bool = False
+    error: Optional[str] = None
+
+
+class KeyWatcher:
+    """Applies new key versions to platforms and their running relays.
+
+    Only the relay of the platform whose key changed is restarted, in
+    place, with a command built from the new key. In tee mode all
+    destinations share one process, so a rotation respawns the tee.
+    Relays on a node agent or placed by the scheduler are restarted there
+    when `agent` or `scheduler` is set to the active relay target.
+    """
+
+    def __init__(
+        self,
+        store: KeyStore,
+        registry: PlatformRegistry,
+        supervisor: RelaySupervisor,
+        stream_manager: StreamManager,
+        tee_fanout: Optional[TeeFanout] = None,
+        interval: float = 2.0,
+        max_events: int = 100,
+    ):
+        self.store = store
+        self.registry = registry
+        self.supervisor = supervisor
+        self.stream_manager = stream_manager
+        self.tee_fanout = tee_fanout
+        self.agent: Optional[AgentClient] = None
+        self.scheduler: Optional[RelayScheduler] = None
+        self.interval = interval
+        self.rotations: Deque[KeyRotation] = deque(maxlen=max_events)
+        self._seen: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="key-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                # Keep polling; a locked or missing database is usually transient.
+                self.supervisor.log("keys", f"Key check failed: {e}")
+
+    def check(self) -> List[KeyRotation]:
+        """Apply every key version not seen yet; returns the rotations made."""
+        changed = {
+            name: version
+            for name, version in self.store.latest_versions().items()
+            if self._seen.get(name) != version
+        }
+        if not changed:
+            return []
+        platforms = {key_name(p.name): p for p in self.registry.all()}
+        applied = []
+        for name, version in changed.items():
+            self._seen[name] = version
+            platform = platforms.get(name)
+            key = self.store.latest(name)
+            if platform is None or key is None or key.value == platform.stream_key:
+                continue
+            rotation = self._apply(platform, key)
+            self.rotations.append(rotation)
+            applied.append(rotation)
+        return applied
+
+    def _apply(self, platform, key: StreamKeyVersion) -> KeyRotation:
+        rotation = KeyRotation(
+            platform_id=platform.id, name=platform.name, version=key.version,
+            applied_at=datetime.now(),
+        )
+        self.registry.update_stream_key(platform.id, key.value)
+        relay = self.supervisor.registry.get(platform.id)
+        if relay is not None:
+            command = self.stream_manager.get_platform_command(platform, key.value)
+            if relay.running:
+                relay = self.supervisor.start(platform.id, platform.name, command, recover=True)
+                rotation.restarted = True
+                rotation.error = relay.error
+            else:
+                # A relay waiting out a watchdog backoff restarts with the new key.
+                self.supervisor.set_command(platform.id, command)
+        if self.tee_fanout is not None and platform.id in self.tee_fanout.destinations:
+            rotation.restarted = self.tee_fanout.running or rotation.restarted
+            self.tee_fanout.add(
+                platform.id, platform.rtmp_url, key.value,
+                platform.output_profile, platform.latency_profile,
+            )
+        try:
+            self._apply_remote(platform, key, rotation)
+        except (OSError, AgentError) as e:
+            rotation.error = str(e)
+        self.supervisor.log(
+            platform.name,
+            f"Stream key rotated to version {key.version}"
+            + (", relay restarted" if rotation.restarted else ""),
+        )
+        return rotation
+
+    def _apply_remote(self, platform, key: StreamKeyVersion, rotation: KeyRotation):
+        """Restart the platform's relay, or the tee sending to it, on the remote target."""
+        results = []
+        agent, scheduler = self.agent, self.scheduler
+        if agent is not None:
+            relays = {relay["platform_id"]: relay for relay in agent.status()}
+            ops = []
+            if relays.get(platform.id, {}).get("running"):
+                ops.append(platform_op(platform, key.value))
+            if relays.get(TEE_RELAY_ID, {}).get("running"):
+                # The registry already holds the new key.
+                ops.append(tee_op(self.registry.all()))
+            results = agent.call(ops) if ops else []
+        elif scheduler is not None:
+            result = scheduler.reload(platform, key.value)
+            results = [result] if result is not None else []
+        if results:
+            rotation.restarted = True
+        for result in results:
+            if not result["ok"]:
+                rotation.error = result.get("error") or (result.get("relay") or {}).get("error")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage versioned stream keys")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="add a key version")
+    add.add_argument("name")
+    add.add_argument("value")
+    payload = commands.add_parser("import", help="import a JSON {name: key} payload")
+    payload.add_argument("file", help="JSON file, or - for stdin")
+    commands.add_parser("list", help="show the newest version of every key")
+    args = parser.parse_args()
+
+    store = KeyStore()
+    if args.command == "add":
+        print(f"{key_name(args.name)}: version {store.add_version(args.name, args.value)}")
+    elif args.command == "import":
+        if args.file == "-":
+            data = json.load(sys.stdin)
+        else:
+            with open(args.file) as f:
+                data = json.load(f)
+        for name, version in store.import_payload(data).items():
+            print(f"{name}: version {version}")
+    else:
+        for name, version in sorted(store.latest_versions().items()):
+            print(f"{name}: version {version}")
+
+
+if __name__ == "__main__":
+    main()
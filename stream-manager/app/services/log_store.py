@@ -0,0 +1,362 @@
+"""Bounded relay log store: per-relay rings in memory, a rotating spool on disk.
+
+Every line is kept twice. A fixed-size ring per relay holds the latest
+lines for quick display, and an append-only spool of numbered files holds
+the history across restarts. A spool file is closed once it reaches
+`max_file_bytes` and only the newest `max_files` are kept, so disk use is
+bounded as well as memory.
+
+Each spool file has a small index of blocks of `BLOCK_RECORDS` lines with
+their byte range, time range, platforms and highest level. Searches by
+platform, level and time only read the blocks that can match, and tails
+read backwards from the end of the files through `mmap`, so neither costs
+more memory than the lines it returns.
+
+Spool lines are tab-separated: ISO timestamp, level, platform id (`-`
+for lines not from a relay), source name and the text.
+"""
+import json
+import mmap
+import os
+import re
+import threading
+from collections import deque
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime
+from typing import Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+LOG_DIR = "./relay_logs"
+LEVELS = ("info", "warning", "error")
+BLOCK_RECORDS = 512
+# Bumped when the saved index format changes; older indexes are rebuilt.
+INDEX_VERSION = 2
+_FILE_PATTERN = re.compile(r"^relay-(\d{6})\.log$")
+_ERROR = re.compile(
+    r"\b(error|failed|fatal|invalid|could not|cannot|refused|broken pipe|timed out)\b", re.IGNORECASE
+)
+_WARNING = re.compile(r"\b(warning|deprecated|non-monotonous|past duration|dropping)\b", re.IGNORECASE)
+
+
+def classify_level(line: str) -> str:
+    """Level of an ffmpeg output line, which carries no level of its own."""
+    if _ERROR.search(line):
+        return "error"
+    if _WARNING.search(line):
+        return "warning"
+    return "info"
+
+
+@dataclass
+class LogRecord:
+    ts: datetime
+    platform_id: Optional[int]
+    name: str
+    level: str
+    line: str
+
+    def encode(self) -> bytes:
+        platform = "-" if self.platform_id is None else str(self.platform_id)
+        fields = (self.ts.isoformat(), self.level, platform, self.name, self.line)
+        text = "\t".join(f.replace("\t", " ").replace("\n", " ").replace("\r", " ") for f in fields)
+        return (text + "\n").encode("utf-8", errors="replace")
+
+    @classmethod
+    def decode(cls, raw: bytes) -> Optional["LogRecord"]:
+        parts = raw.decode("utf-8", errors="replace").rstrip("\n").split("\t", 4)
+        if len(parts) != 5:
+            return None
+        ts, level, platform, name, line = parts
+        try:
+            return cls(
+                ts=datetime.fromisoformat(ts),
+                platform_id=None if platform == "-" else int(platform),
+                name=name,
+                level=level,
+                line=line,
+            )
+        except ValueError:
+            return None
+
+    def format(self) -> str:
+        return f"[{self.ts.strftime('%H:%M:%S')}] {self.name}: {self.line}"
+
+
+@dataclass
+class _Block:
+    """Index entry for a run of consecutive spool lines."""
+    offset: int
+    end: int
+    first_ts: float
+    last_ts: float
+    # Platform ids in the block; None stands for lines not from a relay,
+    # since every int can be a relay id (the segment buffer's is -1).
+    platforms: Set[Optional[int]] = field(default_factory=set)
+    max_level: int = 0
+    records: int = 0
+
+    def add(self, record: LogRecord, end: int):
+        ts = record.ts.timestamp()
+        self.first_ts = min(self.first_ts, ts)
+        self.last_ts = max(self.last_ts, ts)
+        self.platforms.add(record.platform_id)
+        self.max_level = max(self.max_level, _level_rank(record.level))
+        self.records += 1
+        self.end = end
+
+    def matches(
+        self, platform_id: Optional[int], min_level: int, since: Optional[float], until: Optional[float]
+    ) -> bool:
+        if platform_id is not None and platform_id not in self.platforms:
+            return False
+        if self.max_level < min_level:
+            return False
+        if since is not None and self.last_ts < since:
+            return False
+        return until is None or self.first_ts <= until
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        # JSON null for None, after the ids so the list stays sortable.
+        data["platforms"] = sorted(p for p in self.platforms if p is not None)
+        if None in self.platforms:
+            data["platforms"].append(None)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "_Block":
+        return cls(**{**data, "platforms": set(data["platforms"])})
+
+
+def _level_rank(level: Optional[str]) -> int:
+    return LEVELS.index(level) if level in LEVELS else 0
+
+
+def _read_lines_backwards(path: str) -> Iterator[bytes]:
+    """Lines of a file from the last to the first, read through mmap."""
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as data:
+                end = size
+                # A line still being written has no newline yet.
+                if data[end - 1:end] != b"\n":
+                    end = data.rfind(b"\n", 0, end) + 1
+                while end > 0:
+                    start = data.rfind(b"\n", 0, end - 1) + 1
+                    yield data[start:end]
+                    end = start
+    except FileNotFoundError:
+        return
+
+
+class LogStore:
+    """Keeps relay output in bounded rings and a rotating, indexed spool.
+
+    `append` is safe to call from the supervisor's reader threads. Reads
+    take the lock only to flush and copy the index, then read the spool
+    without blocking writers.
+    """
+
+    def __init__(
+        self,
+        directory: str = LOG_DIR,
+        ring_lines: int = 500,
+        max_file_bytes: int = 16 * 1024 * 1024,
+        max_files: int = 8,
+    ):
+        self.directory = directory
+        self.ring_lines = ring_lines
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        # Incremented for every line, so readers can tell when to redraw.
+        self.sequence = 0
+        self._rings: Dict[Optional[int], Deque[LogRecord]] = {}
+        self._index: Dict[int, List[_Block]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        for number in self._numbers():
+            self._index[number] = self._load_index(number)
+        self._number = max(self._index, default=1)
+        self._file = open(self._path(self._number), "ab")
+        self._size = self._file.tell()
+        self._index.setdefault(self._number, [])
+        if self._size and self._index[self._number] and self._index[self._number][-1].end < self._size:
+            # End a line cut off by a crash, so the next one parses.
+            self._file.write(b"\n")
+            self._size += 1
+        self._prune()
+
+    def _numbers(self) -> List[int]:
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = _FILE_PATTERN.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def _path(self, number: int) -> str:
+        return os.path.join(self.directory, f"relay-{number:06d}.log")
+
+    def _index_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"relay-{number:06d}.idx")
+
+    def _load_index(self, number: int) -> List[_Block]:
+        """The saved index of a closed file, or one rebuilt from the file itself."""
+        size = os.path.getsize(self._path(number))
+        try:
+            with open(self._index_path(number)) as f:
+                saved = json.load(f)
+            if saved["version"] != INDEX_VERSION:
+                raise ValueError("old index format")
+            blocks = [_Block.from_dict(data) for data in saved["blocks"]]
+            if blocks and blocks[-1].end == size:
+                return blocks
+        except (OSError, ValueError, TypeError, KeyError):
+            pass
+        blocks: List[_Block] = []
+        offset = 0
+        with open(self._path(number), "rb") as f:
+            for raw in f:
+                end = offset + len(raw)
+                record = LogRecord.decode(raw) if raw.endswith(b"\n") else None
+                if record is not None:
+                    self._index_record(blocks, record, offset, end)
+                offset = end
+        return blocks
+
+    def _save_index(self, number: int):
+        path = self._index_path(number)
+        with open(path + ".tmp", "w") as f:
+            json.dump(
+                {"version": INDEX_VERSION, "blocks": [block.to_dict() for block in self._index.get(number, [])]}, f
+            )
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _index_record(blocks: List[_Block], record: LogRecord, offset: int, end: int):
+        if not blocks or blocks[-1].records >= BLOCK_RECORDS:
+            ts = record.ts.timestamp()
+            blocks.append(_Block(offset=offset, end=offset, first_ts=ts, last_ts=ts))
+        blocks[-1].add(record, end)
+
+    def append(
+        self, platform_id: Optional[int], name: str, line: str,
+        level: Optional[str] = None, ts: Optional[datetime] = None,
+    ) -> LogRecord:
+        record = LogRecord(ts or datetime.now(), platform_id, name, level or classify_level(line), line)
+        data = record.encode()
+        with self._lock:
+            ring = self._rings.get(platform_id)
+            if ring is None:
+                ring = self._rings[platform_id] = deque(maxlen=self.ring_lines)
+            ring.append(record)
+            if self._size and self._size + len(data) > self.max_file_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._index_record(self._index[self._number], record, self._size, self._size + len(data))
+            self._size += len(data)
+            self.sequence += 1
+        return record
+
+    def _rotate(self):
+        self._file.close()
+        self._save_index(self._number)
+        self._number += 1
+        self._file = open(self._path(self._number), "ab")
+        self._size = 0
+        self._index[self._number] = []
+        self._prune()
+
+    def _prune(self):
+        for number in sorted(self._index)[:-self.max_files]:
+            for path in (self._path(number), self._index_path(number)):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            del self._index[number]
+
+    def _snapshot(self) -> List[Tuple[int, List[_Block]]]:
+        """Flush pending lines and copy the index, newest file first."""
+        with self._lock:
+            self._file.flush()
+            return [
+                (number, [replace(block, platforms=set(block.platforms)) for block in self._index[number]])
+                for number in sorted(self._index, reverse=True)
+            ]
+
+    def recent(self, platform_id: Optional[int], limit: Optional[int] = None) -> List[LogRecord]:
+        """Latest in-memory lines of one relay (None: lines not from a relay)."""
+        with self._lock:
+            records = list(self._rings.get(platform_id, ()))
+        return records[-limit:] if limit else records
+
+    def tail(
+        self, limit: int, platform_id: Optional[int] = None, since: Optional[datetime] = None
+    ) -> List[LogRecord]:
+        """The last `limit` spooled lines, oldest first, newer than `since`."""
+        records: List[LogRecord] = []
+        for number, _ in self._snapshot():
+            for raw in _read_lines_backwards(self._path(number)):
+                record = LogRecord.decode(raw)
+                if record is None:
+                    continue
+                if since is not None and record.ts < since:
+                    return records[::-1]
+                if platform_id is None or record.platform_id == platform_id:
+                    records.append(record)
+                    if len(records) >= limit:
+                        return records[::-1]
+        return records[::-1]
+
+    def search(
+        self,
+        platform_id: Optional[int] = None,
+        level: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: int = 500,
+    ) -> List[LogRecord]:
+        """The newest `limit` lines matching every given filter, oldest first.
+
+        `level` is a minimum: "warning" also returns errors.
+        """
+        min_level = _level_rank(level)
+        since_ts = since.timestamp() if since else None
+        until_ts = until.timestamp() if until else None
+        matches: List[LogRecord] = []
+        for number, blocks in self._snapshot():
+            candidates = [
+                block for block in blocks if block.matches(platform_id, min_level, since_ts, until_ts)
+            ]
+            if not candidates:
+                continue
+            try:
+                f = open(self._path(number), "rb")
+            except FileNotFoundError:
+                continue
+            with f, mmap.mmap(f.fileno(), candidates[-1].end, access=mmap.ACCESS_READ) as data:
+                for block in reversed(candidates):
+                    found = []
+                    for raw in data[block.offset:block.end].splitlines(keepends=True):
+                        record = LogRecord.decode(raw)
+                        if (
+                            record is None
+                            or (platform_id is not None and record.platform_id != platform_id)
+                            or _level_rank(record.level) < min_level
+                            or (since is not None and record.ts < since)
+                            or (until is not None and record.ts > until)
+                        ):
+                            continue
+                        found.append(record)
+                    matches.extend(reversed(found))
+                    if len(matches) >= limit:
+                        return matches[:limit][::-1]
+        return matches[::-1]
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._save_index(self._number)
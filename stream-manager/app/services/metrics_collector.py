@@ -0,0 +1,315 @@
+"""Concurrent metrics collection for the relay instance group.
+
+Replaces the serial loop in `infrastructure/scripts/gather_metrics.sh`:
+every instance is collected in parallel on a bounded pool, each with a
+single remote round trip that prints all probes as marked sections, and
+the output is parsed into structured JSON.
+
+    python -m app.services.metrics_collector --group stream-relay-mig --zone us-central1-a
+"""
+import argparse
+import json
+import os
+import subprocess
+import xml.etree.ElementTree as ET
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from app.utils.rtmp_stat import parse_snapshot
+
+SECTION_MARKER = "@@section "
+
+# Probes run on each node in one shell session; each prints a marked section.
+REMOTE_SCRIPT = "; ".join(
+    f"echo '{SECTION_MARKER}{name}'; {command}"
+    for name, command in (
+        ("nginx_status", "curl -s --max-time 5 http://localhost/status"),
+        ("rtmp_stat", "curl -s --max-time 5 http://localhost/rtmp_stat"),
+        ("nginx_active", "systemctl is-active nginx"),
+        ("loadavg", "cat /proc/loadavg"),
+        ("cpu", "top -bn1 | head -n 5"),
+        ("memory", "free -m"),
+        ("disk", "df -P -m"),
+        ("rtmp_connections", "(ss -Htan 'sport = :1935' 2>/dev/null || netstat -tan | grep ':1935 ') | wc -l"),
+    )
+)
+
+
+class Transport(ABC):
+    """How the collector reaches instances; swap in a fake for tests."""
+
+    @abstractmethod
+    def list_instances(self) -> List[str]:
+        ...
+
+    def describe(self, instances: List[str]) -> Dict[str, Dict]:
+        """Instance metadata keyed by name, fetched in one call for all."""
+        return {}
+
+    @abstractmethod
+    def run(self, instance: str, script: str, timeout: float) -> str:
+        ...
+
+
+class GcloudTransport(Transport):
+    def __init__(self, group: str, zone: str):
+        self.group = group
+        self.zone = zone
+
+    def _gcloud(self, *args: str, timeout: float = 60.0) -> str:
+        result = subprocess.run(
+            ["gcloud", *args], capture_output=True, text=True, timeout=timeout, check=True
+        )
+        return result.stdout
+
+    def list_instances(self) -> List[str]:
+        output = self._gcloud(
+            "compute", "instance-groups", "managed", "list-instances", self.group,
+            f"--zone={self.zone}", "--format=value(instance)",
+        )
+        return [line.strip() for line in output.splitlines() if line.strip()]
+
+    def describe(self, instances: List[str]) -> Dict[str, Dict]:
+        if not instances:
+            return {}
+        output = self._gcloud(
+            "compute", "instances", "list",
+            f"--filter=name:({' '.join(instances)}) AND zone:{self.zone}",
+            "--format=json(name,status,cpuPlatform,machineType,networkInterfaces[0].networkIP)",
+        )
+        return {item["name"]: item for item in json.loads(output or "[]")}
+
+    def run(self, instance: str, script: str, timeout: float) -> str:
+        return self._gcloud(
+            "compute", "ssh", instance, f"--zone={self.zone}", f"--command={script}",
+            timeout=timeout,
+        )
+
+    def backend_health(self, backend: str = "stream-backend") -> Dict:
+        return json.loads(self._gcloud(
+            "compute", "backend-services", "get-health", backend, "--global", "--format=json",
+        ) or "{}")
+
+
+class LocalTransport(Transport):
+    """Runs the probes on this host, once per named fake instance."""
+
+    def __init__(self, instances: Optional[List[str]] = None):
+        self.instances = instances or ["localhost"]
+
+    def list_instances(self) -> List[str]:
+        return list(self.instances)
+
+    def describe(self, instances: List[str]) -> Dict[str, Dict]:
+        return {name: {"name": name, "status": "RUNNING"} for name in instances}
+
+    def run(self, instance: str, script: str, timeout: float) -> str:
+        result = subprocess.run(
+            ["sh", "-c", script], capture_output=True, text=True, timeout=timeout
+        )
+        return result.stdout
+
+
+def split_sections(output: str) -> Dict[str, str]:
+    sections: Dict[str, List[str]] = {}
+    current = None
+    for line in output.splitlines():
+        if line.startswith(SECTION_MARKER):
+            current = line[len(SECTION_MARKER):].strip()
+            sections[current] = []
+        elif current is not None:
+            sections[current].append(line)
+    return {name: "\n".join(lines).strip() for name, lines in sections.items()}
+
+
+def _ints(text: str) -> List[int]:
+    return [int(token) for token in text.split() if token.isdigit()]
+
+
+def parse_nginx_status(text: str) -> Optional[Dict]:
+    """Parse nginx stub_status output."""
+    lines = text.splitlines()
+    if len(lines) < 4 or not lines[0].startswith("Active connections"):
+        return None
+    accepts, handled, requests = _ints(lines[2])[:3]
+    reading, writing, waiting = _ints(lines[3].replace(":", " "))[:3]
+    return {
+        "active": _ints(lines[0].replace(":", " "))[0],
+        "accepts": accepts,
+        "handled": handled,
+        "requests": requests,
+        "reading": reading,
+        "writing": writing,
+        "waiting": waiting,
+    }
+
+
+def parse_loadavg(text: str) -> Optional[Dict]:
+    fields = text.split()
+    if len(fields) < 3:
+        return None
+    return {"1m": float(fields[0]), "5m": float(fields[1]), "15m": float(fields[2])}
+
+
+def parse_cpu(text: str) -> Optional[Dict]:
+    """Pull the `%Cpu(s)` line out of `top -bn1`."""
+    for line in text.splitlines():
+        if line.startswith("%Cpu"):
+            values = {}
+            for part in line.split(":", 1)[1].split(","):
+                number, _, key = part.strip().partition(" ")
+                try:
+                    values[key.strip()] = float(number)
+                except ValueError:
+                    continue
+            return {
+                "user": values.get("us"),
+                "system": values.get("sy"),
+                "idle": values.get("id"),
+                "iowait": values.get("wa"),
+                "steal": values.get("st"),
+            }
+    return None
+
+
+def parse_memory(text: str) -> Optional[Dict]:
+    """Parse the `Mem:` row of `free -m` (MiB)."""
+    lines = text.splitlines()
+    if not lines:
+        return None
+    header = lines[0].split()
+    for line in lines[1:]:
+        if line.startswith("Mem:"):
+            return dict(zip(header, (int(v) for v in line.split()[1:])))
+    return None
+
+
+def parse_disk(text: str) -> List[Dict]:
+    """Parse `df -P -m` into one record per filesystem (MiB)."""
+    disks = []
+    for line in text.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 6 or not fields[1].isdigit():
+            continue
+        disks.append({
+            "filesystem": fields[0],
+            "size_mb": int(fields[1]),
+            "used_mb": int(fields[2]),
+            "available_mb": int(fields[3]),
+            "use_percent": int(fields[4].rstrip("%") or 0),
+            "mount": fields[5],
+        })
+    return disks
+
+
+def parse_rtmp_stat(text: str) -> Optional[Dict]:
+    if not text:
+        return None
+    snapshot = parse_snapshot(text.encode())
+    return asdict(snapshot)
+
+
+def parse_count(text: str) -> Optional[int]:
+    text = text.strip()
+    return int(text) if text.isdigit() else None
+
+
+PARSERS: Dict[str, Callable[[str], object]] = {
+    "nginx_status": parse_nginx_status,
+    "rtmp_stat": parse_rtmp_stat,
+    "nginx_active": lambda text: text.strip() or None,
+    "loadavg": parse_loadavg,
+    "cpu": parse_cpu,
+    "memory": parse_memory,
+    "disk": parse_disk,
+    "rtmp_connections": parse_count,
+}
+
+
+def parse_output(output: str) -> Dict:
+    sections = split_sections(output)
+    parsed = {}
+    for name, parser in PARSERS.items():
+        try:
+            parsed[name] = parser(sections.get(name, ""))
+        except (ValueError, IndexError, ET.ParseError):
+            parsed[name] = None
+    return parsed
+
+
+class MetricsCollector:
+    def __init__(self, transport: Transport, max_workers: int = 8, timeout: float = 60.0):
+        self.transport = transport
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+    def collect_instance(self, instance: str) -> Dict:
+        started = datetime.now()
+        record = {"instance": instance, "collected_at": started.isoformat()}
+        try:
+            output = self.transport.run(instance, REMOTE_SCRIPT, self.timeout)
+            record.update(parse_output(output))
+        except (OSError, subprocess.SubprocessError) as e:
+            record["error"] = str(e)
+        record["duration_s"] = round((datetime.now() - started).total_seconds(), 3)
+        return record
+
+    def collect(self) -> Dict:
+        """Collect every instance concurrently and return one report."""
+        instances = self.transport.list_instances()
+        details = self.transport.describe(instances)
+        records = []
+        if instances:
+            workers = min(self.max_workers, len(instances))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="collect") as pool:
+                records = list(pool.map(self.collect_instance, instances))
+        for record in records:
+            record["details"] = details.get(record["instance"])
+        return {
+            "generated_at": datetime.now().isoformat(),
+            "instances": records,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect relay instance metrics")
+    parser.add_argument("--group", default="stream-relay-mig")
+    parser.add_argument("--zone", default="us-central1-a")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output-dir", default="../metrics")
+    parser.add_argument("--backend", default="stream-backend",
+                        help="backend service for load balancer health; empty to skip")
+    parser.add_argument("--local", action="store_true",
+                        help="probe this host instead of the instance group")
+    args = parser.parse_args()
+
+    transport = LocalTransport() if args.local else GcloudTransport(args.group, args.zone)
+    report = MetricsCollector(transport, args.workers, args.timeout).collect()
+    if args.backend and isinstance(transport, GcloudTransport):
+        try:
+            report["load_balancer"] = transport.backend_health(args.backend)
+        except (OSError, subprocess.SubprocessError, ValueError) as e:
+            report["load_balancer"] = {"error": str(e)}
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_file = os.path.join(args.output_dir, f"metrics_{timestamp}.json")
+    with open(output_file, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for record in report["instances"]:
+        status = (record.get("details") or {}).get("status", "UNKNOWN")
+        print(
+            f"- {record['instance']}: {status}, nginx {record.get('nginx_active')}, "
+            f"RTMP connections {record.get('rtmp_connections')}"
+            + (f", error: {record['error']}" if "error" in record else "")
+        )
+    print(f"Metrics stored in: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
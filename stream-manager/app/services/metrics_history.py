@@ -0,0 +1,273 @@
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func, select
+
+from app.database import DATABASE_URL
+from app.models import MetricRollup, MetricSample, RelaySession
+from app.services.data_access import session_scope
+from app.services.process_registry import Relay
+from app.services.relay_supervisor import RelaySupervisor
+from app.services.telemetry import RelayMetrics
+
+SAMPLE_INTERVAL = 10
+# (resolution, source resolution, settle seconds); 10 is the raw sample
+# table. An interval is only rolled up once it ended `settle` seconds ago,
+# so late flushes and the finer tier have landed first.
+ROLLUP_TIERS = ((60, SAMPLE_INTERVAL, 120), (3600, 60, 300))
+# How long each resolution is kept, in seconds.
+RETENTION = {
+    SAMPLE_INTERVAL: 24 * 3600,
+    60: 30 * 24 * 3600,
+    3600: 365 * 24 * 3600,
+}
+
+
+@dataclass
+class _Bucket:
+    bitrate_sum: float = 0.0
+    bitrate_count: int = 0
+    bitrate_min: Optional[float] = None
+    bitrate_max: Optional[float] = None
+    fps_sum: float = 0.0
+    speed_sum: float = 0.0
+    speed_count: int = 0
+    drops_first: Optional[int] = None
+    drops_last: int = 0
+    samples: int = 0
+
+    def add(self, metrics: RelayMetrics):
+        self.samples += 1
+        self.fps_sum += metrics.fps
+        if metrics.bitrate_kbps is not None:
+            self.bitrate_sum += metrics.bitrate_kbps
+            self.bitrate_count += 1
+            # A 0 kbps stall is a real minimum, not an unset one.
+            if self.bitrate_min is None or metrics.bitrate_kbps < self.bitrate_min:
+                self.bitrate_min = metrics.bitrate_kbps
+            if self.bitrate_max is None or metrics.bitrate_kbps > self.bitrate_max:
+                self.bitrate_max = metrics.bitrate_kbps
+        if metrics.speed is not None:
+            self.speed_sum += metrics.speed
+            self.speed_count += 1
+        if self.drops_first is None:
+            self.drops_first = metrics.drop_frames
+        self.drops_last = metrics.drop_frames
+
+
+@dataclass
+class _PendingSession:
+    relay: Relay
+    row_id: Optional[int] = None
+    ended: bool = False
+
+
+class MetricsHistory:
+    """Persists relay sessions and metric history with time-based rollups.
+
+    Telemetry records are folded in memory into 10-second buckets per
+    platform, and closed buckets are written in one batched insert per
+    flush. A background thread also rolls samples up to 1-minute and
+    1-hour rows and prunes each resolution past its retention.
+    """
+
+    def __init__(
+        self,
+        supervisor: RelaySupervisor,
+        url: str = DATABASE_URL,
+        flush_interval: float = 10.0,
+        rollup_interval: float = 60.0,
+    ):
+        self.url = url
+        self.flush_interval = flush_interval
+        self.rollup_interval = rollup_interval
+        self._buckets: Dict[Tuple[int, int], _Bucket] = {}
+        self._last_drops: Dict[int, int] = {}
+        self._sessions: List[_PendingSession] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+        supervisor.telemetry.subscribe(self.record)
+        supervisor.add_listener("start", self._on_start)
+        supervisor.add_listener("exit", self._on_exit)
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for target, interval, name in (
+            (self.flush, self.flush_interval, "metrics-flush"),
+            (self.rollup, self.rollup_interval, "metrics-rollup"),
+        ):
+            thread = threading.Thread(
+                target=self._loop, args=(target, interval), name=name, daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.flush(force=True)
+
+    def _loop(self, target, interval: float):
+        while not self._stop.wait(interval):
+            target()
+
+    def record(self, metrics: RelayMetrics):
+        ts = int(metrics.ts.timestamp())
+        key = (metrics.platform_id, ts - ts % SAMPLE_INTERVAL)
+        with self._lock:
+            self._buckets.setdefault(key, _Bucket()).add(metrics)
+
+    def _on_start(self, relay: Relay):
+        with self._lock:
+            self._sessions.append(_PendingSession(relay=relay))
+
+    def _on_exit(self, relay: Relay):
+        with self._lock:
+            for pending in self._sessions:
+                if pending.relay is relay:
+                    pending.ended = True
+
+    def flush(self, force: bool = False):
+        """Write closed 10-second buckets and session changes in one transaction."""
+        now = int(time.time())
+        with self._lock:
+            closed = sorted(
+                key for key in self._buckets
+                if force or key[1] + SAMPLE_INTERVAL <= now
+            )
+            buckets = [(key, self._buckets.pop(key)) for key in closed]
+            sessions = list(self._sessions)
+            self._sessions = [s for s in sessions if not s.ended]
+
+        rows = [self._sample_row(platform_id, ts, bucket) for (platform_id, ts), bucket in buckets]
+        if not rows and not sessions:
+            return
+
+        with session_scope(self.url) as session:
+            if rows:
+                session.bulk_insert_mappings(MetricSample, rows)
+            for pending in sessions:
+                relay = pending.relay
+                if pending.row_id is None:
+                    row = RelaySession(
+                        platform_id=relay.platform_id,
+                        pid=relay.pid,
+                        command=" ".join(relay.command),
+                        started_at=relay.started_at or datetime.now(),
+                    )
+                    session.add(row)
+                    session.flush()
+                    pending.row_id = row.id
+                if pending.ended:
+                    session.query(RelaySession).filter(RelaySession.id == pending.row_id).update({
+                        RelaySession.ended_at: relay.stopped_at or datetime.now(),
+                        RelaySession.exit_status: relay.exit_status,
+                    })
+
+    def _sample_row(self, platform_id: int, ts: int, bucket: _Bucket) -> Dict:
+        # drop_frames from ffmpeg is cumulative; store the per-interval delta.
+        previous = self._last_drops.get(platform_id, bucket.drops_first or 0)
+        if bucket.drops_last < previous:
+            previous = 0  # the relay restarted and its counter reset
+        self._last_drops[platform_id] = bucket.drops_last
+        return {
+            "platform_id": platform_id,
+            "ts": ts,
+            "bitrate_avg": bucket.bitrate_sum / bucket.bitrate_count if bucket.bitrate_count else None,
+            "bitrate_min": bucket.bitrate_min,
+            "bitrate_max": bucket.bitrate_max,
+            "fps_avg": bucket.fps_sum / bucket.samples,
+            "speed_avg": bucket.speed_sum / bucket.speed_count if bucket.speed_count else None,
+            "drop_frames": bucket.drops_last - previous,
+            "samples": bucket.samples,
+        }
+
+    def rollup(self, now: Optional[int] = None):
+        """Roll finished intervals up to coarser resolutions and prune old rows."""
+        now = int(time.time()) if now is None else now
+        with session_scope(self.url) as session:
+            for resolution, source, settle in ROLLUP_TIERS:
+                self._rollup_tier(session, resolution, source, now - settle)
+            for resolution, keep in RETENTION.items():
+                cutoff = now - keep
+                if resolution == SAMPLE_INTERVAL:
+                    session.query(MetricSample).filter(MetricSample.ts < cutoff).delete()
+                else:
+                    session.query(MetricRollup).filter(
+                        MetricRollup.resolution == resolution, MetricRollup.ts < cutoff
+                    ).delete()
+
+    @staticmethod
+    def _rollup_tier(session, resolution: int, source: int, now: int):
+        # Only whole intervals after the last one already rolled up.
+        watermark = session.query(func.max(MetricRollup.ts)).filter(
+            MetricRollup.resolution == resolution
+        ).scalar()
+        start = -1 if watermark is None else watermark + resolution
+        end = now - now % resolution
+
+        if source == SAMPLE_INTERVAL:
+            table = MetricSample.__table__
+            source_filter = []
+        else:
+            table = MetricRollup.__table__
+            source_filter = [table.c.resolution == source]
+
+        period = table.c.ts - table.c.ts % resolution
+        weight = table.c.samples
+
+        def weighted_avg(column):
+            # Buckets without a value count in neither the sum nor the weight.
+            return func.sum(column * weight) / func.sum(case((column.isnot(None), weight)))
+
+        query = (
+            select(
+                table.c.platform_id,
+                period.label("ts"),
+                weighted_avg(table.c.bitrate_avg).label("bitrate_avg"),
+                func.min(table.c.bitrate_min).label("bitrate_min"),
+                func.max(table.c.bitrate_max).label("bitrate_max"),
+                weighted_avg(table.c.fps_avg).label("fps_avg"),
+                weighted_avg(table.c.speed_avg).label("speed_avg"),
+                func.sum(table.c.drop_frames).label("drop_frames"),
+                func.sum(weight).label("samples"),
+            )
+            .where(table.c.ts >= start, table.c.ts < end, *source_filter)
+            .group_by(table.c.platform_id, period)
+        )
+        rows = [dict(row._mapping, resolution=resolution) for row in session.execute(query)]
+        if rows:
+            session.bulk_insert_mappings(MetricRollup, rows)
+
+    def history(
+        self, platform_id: int, since: datetime, until: Optional[datetime] = None
+    ) -> List[Dict]:
+        """Metric rows for a platform, at the finest resolution still retained."""
+        start = int(since.timestamp())
+        end = int((until or datetime.now()).timestamp())
+        age = int(time.time()) - start
+        with session_scope(self.url) as session:
+            if age <= RETENTION[SAMPLE_INTERVAL]:
+                query = session.query(MetricSample).filter(MetricSample.platform_id == platform_id)
+                model = MetricSample
+            else:
+                resolution = 60 if age <= RETENTION[60] else 3600
+                query = session.query(MetricRollup).filter(
+                    MetricRollup.platform_id == platform_id,
+                    MetricRollup.resolution == resolution,
+                )
+                model = MetricRollup
+            rows = query.filter(model.ts >= start, model.ts < end).order_by(model.ts).all()
+            return [
+                {column.name: getattr(row, column.name) for column in model.__table__.columns}
+                for row in rows
+            ]
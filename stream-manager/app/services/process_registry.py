@@ -0,0 +1,208 @@
+import json
+import os
+import signal
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+STATE_FILE = "./relay_registry.json"
+
+
+def _pid_matches(pid: int, command: List[str]) -> bool:
+    """Check that `pid` is alive and still runs `command`, not a reused pid."""
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read().split(b"\0")
+    except FileNotFoundError:
+        return False
+    except OSError:
+        # No /proc on this host; fall back to a liveness check.
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return False
+        return True
+    return [part.decode(errors="replace") for part in cmdline if part] == command
+
+
+@dataclass
+class Relay:
+    platform_id: int
+    name: str
+    command: List[str]
+    process: Optional[subprocess.Popen] = None
+    pid: Optional[int] = None
+    started_at: Optional[datetime] = None
+    exit_status: Optional[int] = None
+    stopped_at: Optional[datetime] = None
+    error: Optional[str] = None
+    # Set when the relay is stopped on purpose rather than exiting on its own.
+    stop_requested: bool = False
+    # Adopted from a previous server process: no pipes, signals by pid only.
+    orphan: bool = False
+    # What actually runs, when the supervisor's recovery hook rewrote
+    # `command`; restarts always begin again from `command`.
+    launch_command: Optional[List[str]] = None
+
+    @property
+    def running(self) -> bool:
+        if self.process is not None:
+            return self.process.poll() is None
+        if self.pid is None or self.exit_status is not None or self.stopped_at is not None:
+            return False
+        return _pid_matches(self.pid, self.launch_command or self.command)
+
+    def to_dict(self) -> Dict:
+        return {
+            "platform_id": self.platform_id,
+            "name": self.name,
+            "command": self.command,
+            "launch_command": self.launch_command,
+            "pid": self.pid,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "exit_status": self.exit_status,
+            "stopped_at": self.stopped_at.isoformat() if self.stopped_at else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Relay":
+        started_at = data.get("started_at")
+        stopped_at = data.get("stopped_at")
+        return cls(
+            platform_id=data["platform_id"],
+            name=data["name"],
+            command=list(data["command"]),
+            launch_command=data.get("launch_command"),
+            pid=data.get("pid"),
+            started_at=datetime.fromisoformat(started_at) if started_at else None,
+            exit_status=data.get("exit_status"),
+            stopped_at=datetime.fromisoformat(stopped_at) if stopped_at else None,
+        )
+
+
+def stop_relay(relay: Relay, deadline: float = 5.0) -> Optional[int]:
+    """Stop a relay gracefully and return its exit status.
+
+    ffmpeg is asked to quit with `q` on stdin and then with SIGINT so it
+    can close its outputs cleanly; it is killed if it is still running once
+    `deadline` seconds have passed.
+    """
+    relay.stop_requested = True
+    if not relay.running:
+        return relay.exit_status
+
+    if relay.process is not None:
+        # Ask nicely with `q` first, then SIGINT, then kill at the deadline.
+        try:
+            relay.process.stdin.write("q\n")
+            relay.process.stdin.flush()
+            code = relay.process.wait(timeout=deadline / 2)
+        except (AttributeError, OSError, ValueError, subprocess.TimeoutExpired):
+            code = None
+        if code is None:
+            relay.process.send_signal(signal.SIGINT)
+            try:
+                code = relay.process.wait(timeout=deadline / 2)
+            except subprocess.TimeoutExpired:
+                relay.process.kill()
+                code = relay.process.wait()
+    else:
+        # Not our child, so there is no exit status to collect.
+        code = None
+        try:
+            os.kill(relay.pid, signal.SIGINT)
+            end = time.monotonic() + deadline
+            while relay.running and time.monotonic() < end:
+                time.sleep(0.1)
+            if relay.running:
+                os.kill(relay.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    relay.exit_status = code
+    relay.stopped_at = datetime.now()
+    return code
+
+
+class ProcessRegistry:
+    """Relay processes keyed by `Platform.id`, persisted across restarts.
+
+    The registry keeps the latest relay record per platform, including
+    exited ones, and writes pid, command line, start time and exit status
+    to a JSON state file so relays that outlive the Streamlit server can be
+    adopted again by the next one.
+    """
+
+    def __init__(self, state_file: str = STATE_FILE):
+        self.state_file = state_file
+        self._relays: Dict[int, Relay] = {}
+        self._lock = threading.RLock()
+
+    def add(self, relay: Relay) -> Optional[Relay]:
+        """Register a relay and return the record it replaces, if any."""
+        with self._lock:
+            previous = self._relays.get(relay.platform_id)
+            self._relays[relay.platform_id] = relay
+            self._save()
+        return previous
+
+    def get(self, platform_id: int) -> Optional[Relay]:
+        with self._lock:
+            return self._relays.get(platform_id)
+
+    def pop(self, platform_id: int) -> Optional[Relay]:
+        with self._lock:
+            relay = self._relays.pop(platform_id, None)
+            self._save()
+        return relay
+
+    def set_command(self, platform_id: int, command: List[str]) -> Optional[Relay]:
+        """Change the command a registered relay is restarted with."""
+        with self._lock:
+            relay = self._relays.get(platform_id)
+            if relay is not None:
+                relay.command = command
+                self._save()
+        return relay
+
+    def all(self) -> List[Relay]:
+        with self._lock:
+            return list(self._relays.values())
+
+    def mark_exited(self, relay: Relay, code: Optional[int]):
+        with self._lock:
+            if relay.exit_status is None:
+                relay.exit_status = code
+            if relay.stopped_at is None:
+                relay.stopped_at = datetime.now()
+            self._save()
+
+    def recover_orphans(self) -> List[Relay]:
+        """Adopt relays from the state file whose processes are still alive."""
+        try:
+            with open(self.state_file) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return []
+
+        adopted = []
+        with self._lock:
+            for data in saved:
+                relay = Relay.from_dict(data)
+                if relay.platform_id in self._relays or not relay.running:
+                    continue
+                relay.orphan = True
+                self._relays[relay.platform_id] = relay
+                adopted.append(relay)
+            self._save()
+        return adopted
+
+    def _save(self):
+        data = [relay.to_dict() for relay in self._relays.values()]
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_file, self.state_file)
@@ -0,0 +1,495 @@
+"""Relay-node agent with a batched, authenticated command API.
+
+Runs on each relay node and controls relays there through a local
+`RelaySupervisor`, so the stream manager no longer opens a `gcloud compute
+ssh` session per action. Connections are persistent: a client
+authenticates once, with an HMAC over a server nonce, and then sends
+batches of operations, one JSON object per line in each direction. Every
+batch and every response carries an HMAC over the connection's nonce,
+its sequence number and its body, so a batch cannot be injected, altered
+or replayed on an open connection.
+
+Clients describe relays by platform (destination, key and profiles) and
+the agent builds the ffmpeg command itself; no argv crosses the wire.
+Stream keys are still sent in the clear, so run the agent on a private
+network or behind a TLS tunnel.
+
+    python -m app.services.relay_agent --listen tcp://0.0.0.0:7070
+    python -m app.services.relay_agent --listen unix:///run/relay-agent.sock
+
+The shared secret is read from `--secret-file` or `RELAY_AGENT_SECRET`.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.config.profiles import lowest_latency
+from app.services.fanout import TEE_RELAY_ID
+from app.services.log_store import LogStore
+from app.services.process_registry import Relay
+from app.services.relay_supervisor import RelaySupervisor
+from app.services.segment_buffer import SegmentBuffer
+from app.stream_manager import StreamManager
+from app.utils import procstat
+
+AGENT_PORT = 7070
+PROTOCOL_VERSION = 2
+# Longest accepted line; a batch of relay commands stays far below this.
+MAX_FRAME = 1 << 20
+AUTH_TIMEOUT = 10.0
+# Egress a node may use for relays unless --egress-kbps says otherwise.
+DEFAULT_EGRESS_KBPS = 1_000_000
+DESTINATION_SCHEMES = ("rtmp://", "rtmps://")
+
+
+class AgentError(Exception):
+    pass
+
+
+def parse_address(address: str) -> Tuple[str, ...]:
+    """`unix:///path` -> ("unix", path); `tcp://host:port` or `host:port` -> ("tcp", host, port)."""
+    if address.startswith("unix://"):
+        return ("unix", address[len("unix://"):])
+    if address.startswith("tcp://"):
+        address = address[len("tcp://"):]
+    host, _, port = address.rpartition(":")
+    return ("tcp", host or "127.0.0.1", int(port or AGENT_PORT))
+
+
+def sign(secret: bytes, nonce: str) -> str:
+    return hmac.new(secret, nonce.encode(), hashlib.sha256).hexdigest()
+
+
+def batch_mac(secret: bytes, nonce: str, seq: int, body: object) -> str:
+    """HMAC binding one request or response body to its connection and position."""
+    payload = f"{nonce}:{seq}:".encode() + json.dumps(body, sort_keys=True, separators=(",", ":")).encode()
+    return hmac.new(secret, payload, hashlib.sha256).hexdigest()
+
+
+def platform_op(platform, stream_key: Optional[str] = None) -> Dict:
+    """A "start" operation for a `Platform`, optionally with a replacement stream key."""
+    return {
+        "op": "start",
+        "platform_id": platform.id,
+        "name": platform.name,
+        "rtmp_url": platform.rtmp_url,
+        "stream_key": stream_key or platform.stream_key,
+        "output_profile": platform.output_profile,
+        "latency_profile": platform.latency_profile,
+    }
+
+
+def tee_op(platforms) -> Dict:
+    """A "start_tee" operation sending `platforms` through one shared tee relay."""
+    return {
+        "op": "start_tee",
+        "platform_id": TEE_RELAY_ID,
+        "destinations": [[p.rtmp_url, p.stream_key, p.output_profile] for p in platforms],
+        "latency_profile": lowest_latency(p.latency_profile for p in platforms),
+    }
+
+
+def _destination(url: object) -> str:
+    if not isinstance(url, str) or not url.startswith(DESTINATION_SCHEMES):
+        raise ValueError(f"destination must be an RTMP URL, not {url!r}")
+    return url
+
+
+def load_secret(path: Optional[str] = None) -> bytes:
+    if path:
+        with open(path, "rb") as f:
+            secret = f.read().strip()
+    else:
+        secret = os.environ.get("RELAY_AGENT_SECRET", "").encode()
+    if not secret:
+        raise AgentError("no agent secret: pass --secret-file or set RELAY_AGENT_SECRET")
+    return secret
+
+
+def _encode(message: Dict) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+def _tx_bytes() -> int:
+    """Bytes sent on all interfaces except loopback, from /proc/net/dev."""
+    total = 0
+    try:
+        with open("/proc/net/dev") as f:
+            for line in f.readlines()[2:]:
+                interface, _, counters = line.partition(":")
+                if interface.strip() != "lo":
+                    total += int(counters.split()[8])
+    except (OSError, IndexError, ValueError):
+        return 0
+    return total
+
+
+def _relay_state(relay: Relay) -> Dict:
+    return {
+        "platform_id": relay.platform_id,
+        "name": relay.name,
+        "pid": relay.pid,
+        "running": relay.running,
+        "started_at": relay.started_at.isoformat() if relay.started_at else None,
+        "exit_status": relay.exit_status,
+        "stop_requested": relay.stop_requested,
+        "error": relay.error,
+    }
+
+
+class RelayAgent:
+    """Serves batched relay operations for one node.
+
+    Operations in a batch run concurrently on a thread pool, except that
+    operations for the same platform keep their order, so `stop` followed
+    by `start` of one relay behaves as written, and node-wide operations
+    act as barriers. Results come back in request order.
+    """
+
+    def __init__(
+        self,
+        secret: bytes,
+        supervisor: Optional[RelaySupervisor] = None,
+        max_workers: int = 16,
+        cpu_cores: Optional[float] = None,
+        egress_kbps: float = DEFAULT_EGRESS_KBPS,
+        host_metrics: bool = True,
+        stream_manager: Optional[StreamManager] = None,
+        command_for: Optional[Callable[[object], object]] = None,
+    ):
+        self.secret = secret
+        self.supervisor = supervisor or RelaySupervisor(max_workers=max_workers)
+        self.stream_manager = stream_manager or StreamManager()
+        # Builds a platform's relay command; simulated nodes substitute their own.
+        self.command_for = command_for or self.stream_manager.get_platform_command
+        self.cpu_cores = cpu_cores or float(os.cpu_count() or 1)
+        self.egress_kbps = egress_kbps
+        # Simulated nodes share one host, so they report no load of their own.
+        self.host_metrics = host_metrics
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-op")
+
+    async def serve(self, address: str) -> asyncio.AbstractServer:
+        target = parse_address(address)
+        if target[0] == "unix":
+            if os.path.exists(target[1]):
+                os.unlink(target[1])
+            server = await asyncio.start_unix_server(self._handle, target[1], limit=MAX_FRAME)
+            os.chmod(target[1], 0o660)
+            return server
+        return await asyncio.start_server(self._handle, target[1], target[2], limit=MAX_FRAME)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        nonce = os.urandom(16).hex()
+        try:
+            writer.write(_encode({"agent": PROTOCOL_VERSION, "nonce": nonce}))
+            await writer.drain()
+            hello = json.loads(await asyncio.wait_for(reader.readline(), AUTH_TIMEOUT) or b"{}")
+            if not hmac.compare_digest(str(hello.get("auth", "")), sign(self.secret, nonce)):
+                writer.write(_encode({"ok": False, "error": "authentication failed"}))
+                await writer.drain()
+                return
+            writer.write(_encode({"ok": True}))
+            await writer.drain()
+
+            seq = 0
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                seq += 1
+                try:
+                    request = json.loads(line)
+                    ops = request["ops"]
+                    mac = str(request.get("mac", ""))
+                    if request.get("seq") != seq or not hmac.compare_digest(
+                        mac, batch_mac(self.secret, nonce, seq, ops)
+                    ):
+                        # Injected, altered or replayed: the session can no longer be trusted.
+                        writer.write(_encode({"id": None, "error": "bad batch signature"}))
+                        await writer.drain()
+                        return
+                    results = await self.execute(ops)
+                    response = {"id": request.get("id"), "seq": seq, "results": results}
+                    response["mac"] = batch_mac(self.secret, nonce, seq, results)
+                except (ValueError, KeyError, TypeError) as e:
+                    writer.write(_encode({"id": None, "error": f"bad request: {e}"}))
+                    await writer.drain()
+                    return
+                writer.write(_encode(response))
+                await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            return
+        finally:
+            writer.close()
+
+    async def execute(self, ops: Sequence[Dict]) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+        results: List[Optional[Dict]] = [None] * len(ops)
+
+        async def run_chain(indexes: List[int]):
+            for index in indexes:
+                results[index] = await loop.run_in_executor(self._executor, self.run_op, ops[index])
+
+        # Operations without a platform (status, metrics, ...) see everything
+        # before them done and finish before anything after them starts.
+        segments: List[Dict[object, List[int]]] = [{}]
+        for index, op in enumerate(ops):
+            platform_id = op.get("platform_id")
+            if platform_id is None:
+                segments.extend([{None: [index]}, {}])
+            else:
+                segments[-1].setdefault(platform_id, []).append(index)
+        for chains in segments:
+            if chains:
+                await asyncio.gather(*(run_chain(indexes) for indexes in chains.values()))
+        return results
+
+    def run_op(self, op: Dict) -> Dict:
+        """Run one operation synchronously; errors are returned, not raised."""
+        kind = op.get("op")
+        supervisor = self.supervisor
+        try:
+            if kind == "ping":
+                return {"ok": True, "time": time.time()}
+            if kind == "start":
+                platform = SimpleNamespace(
+                    id=int(op["platform_id"]),
+                    name=str(op["name"]),
+                    rtmp_url=_destination(op["rtmp_url"]),
+                    stream_key=str(op["stream_key"]),
+                    output_profile=op.get("output_profile"),
+                    latency_profile=op.get("latency_profile"),
+                )
+                relay = supervisor.start(platform.id, platform.name, self.command_for(platform))
+                return {"ok": relay.error is None, "relay": _relay_state(relay)}
+            if kind == "start_tee":
+                destinations = [
+                    (_destination(url), str(key), profile) for url, key, profile in op["destinations"]
+                ]
+                command = self.stream_manager.get_ladder_command(destinations, op.get("latency_profile"))
+                relay = supervisor.start(TEE_RELAY_ID, "tee", command)
+                return {"ok": relay.error is None, "relay": _relay_state(relay)}
+            if kind == "restart":
+                relay = supervisor.restart(op["platform_id"])
+                if relay is None:
+                    return {"ok": False, "error": "unknown relay"}
+                return {"ok": relay.error is None, "relay": _relay_state(relay)}
+            if kind == "stop":
+                return {"ok": True, "exit_status": supervisor.stop(op["platform_id"])}
+            if kind == "stop_all":
+                supervisor.stop_all()
+                return {"ok": True}
+            if kind == "status":
+                return {"ok": True, "relays": [_relay_state(r) for r in supervisor.relays()]}
+            if kind == "metrics":
+                return {"ok": True, "relays": self._metrics()}
+            if kind == "host":
+                return {"ok": True, "host": self._host()}
+            if kind == "output":
+                return {
+                    "ok": True,
+                    "lines": [[ts.isoformat(), name, line] for ts, name, line in supervisor.drain_output()],
+                }
+            return {"ok": False, "error": f"unknown op {kind!r}"}
+        except (KeyError, TypeError, ValueError) as e:
+            return {"ok": False, "error": f"bad {kind} op: {e}"}
+        except OSError as e:
+            return {"ok": False, "error": str(e)}
+
+    def _host(self) -> Dict:
+        """Capacity and load of this node, for the relay scheduler."""
+        measured = self.host_metrics and hasattr(os, "getloadavg")
+        return {
+            "cpu_cores": self.cpu_cores,
+            "egress_capacity_kbps": self.egress_kbps,
+            "load1": os.getloadavg()[0] if measured else 0.0,
+            "tx_bytes": _tx_bytes() if self.host_metrics else 0,
+            "monotonic": time.monotonic(),
+        }
+
+    def _metrics(self) -> List[Dict]:
+        telemetry = self.supervisor.telemetry.snapshot()
+        metrics = []
+        for relay in self.supervisor.relays():
+            record = _relay_state(relay)
+            progress = telemetry.get(relay.platform_id)
+            if progress is not None and relay.started_at and progress.ts < relay.started_at:
+                # Left over from an earlier relay for the same platform.
+                progress = None
+            record["progress"] = progress.to_dict() if progress else None
+            stat = procstat.sample(relay.pid) if relay.pid and record["running"] else None
+            record["cpu_seconds"] = stat.cpu_seconds if stat else None
+            record["rss_bytes"] = stat.rss_bytes if stat else None
+            metrics.append(record)
+        return metrics
+
+
+class AgentClient:
+    """Blocking client holding one persistent, authenticated connection.
+
+    Safe to share between threads; calls are serialized on the connection.
+    A connection found dead when sending is reopened once; a failure while
+    waiting for a response is raised, since the batch may have run. Batches
+    are signed and responses checked against the connection's nonce.
+
+    Connecting gives up after `connect_timeout`, and a failed connect is
+    raised again without retrying for `retry_after` seconds, so callers on
+    a host without an agent do not wait on every call.
+    """
+
+    def __init__(
+        self, address: str, secret: bytes, timeout: float = 30.0,
+        connect_timeout: float = 3.0, retry_after: float = 30.0,
+    ):
+        self.address = address
+        self.secret = secret
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retry_after = retry_after
+        self._retry_at = 0.0
+        self._connect_error: Optional[Exception] = None
+        self._sock: Optional[socket.socket] = None
+        self._file = None
+        self._nonce = ""
+        self._seq = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if time.monotonic() < self._retry_at:
+            raise ConnectionError(f"relay agent unreachable: {self._connect_error}")
+        target = parse_address(self.address)
+        sock = None
+        try:
+            if target[0] == "unix":
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.connect_timeout)
+                sock.connect(target[1])
+            else:
+                sock = socket.create_connection((target[1], target[2]), timeout=self.connect_timeout)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._sock = sock
+            self._file = sock.makefile("rb")
+            hello = self._read()
+        except OSError as e:
+            if self._file is not None:
+                self.close()
+            elif sock is not None:
+                sock.close()
+            self._retry_at = time.monotonic() + self.retry_after
+            self._connect_error = e
+            raise
+        sock.settimeout(self.timeout)
+        self._nonce = hello["nonce"]
+        self._seq = 0
+        sock.sendall(_encode({"auth": sign(self.secret, self._nonce)}))
+        reply = self._read()
+        if not reply.get("ok"):
+            self.close()
+            raise AgentError(reply.get("error", "authentication failed"))
+
+    def _read(self) -> Dict:
+        line = self._file.readline(MAX_FRAME)
+        if not line:
+            raise ConnectionError("agent closed the connection")
+        return json.loads(line)
+
+    def call(self, ops: Sequence[Dict]) -> List[Dict]:
+        """Send one batch of operations and return their results in order."""
+        ops = list(ops)
+        with self._lock:
+            self._next_id += 1
+            for attempt in range(2):
+                if self._sock is None:
+                    self._connect()
+                self._seq += 1
+                seq = self._seq
+                payload = _encode({
+                    "id": self._next_id, "seq": seq, "ops": ops,
+                    "mac": batch_mac(self.secret, self._nonce, seq, ops),
+                })
+                try:
+                    self._sock.sendall(payload)
+                    break
+                except OSError:
+                    self.close()
+                    if attempt:
+                        raise
+            try:
+                response = self._read()
+            except (OSError, ValueError):
+                self.close()
+                raise
+            if "error" in response:
+                self.close()
+                raise AgentError(response["error"])
+            results = response.get("results")
+            if response.get("seq") != seq or not hmac.compare_digest(
+                str(response.get("mac", "")), batch_mac(self.secret, self._nonce, seq, results)
+            ):
+                self.close()
+                raise AgentError("bad response signature")
+        return results
+
+    def start_platforms(self, platforms) -> List[Dict]:
+        return self.call([platform_op(platform) for platform in platforms])
+
+    def status(self) -> List[Dict]:
+        return self.call([{"op": "status"}])[0]["relays"]
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._file.close()
+                self._sock.close()
+            finally:
+                self._sock = None
+                self._file = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relay node agent")
+    parser.add_argument("--listen", default=f"tcp://0.0.0.0:{AGENT_PORT}")
+    parser.add_argument("--secret-file", help="file holding the shared secret")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--cpus", type=float, help="CPU cores offered to relays (default: all)")
+    parser.add_argument("--egress-kbps", type=float, default=DEFAULT_EGRESS_KBPS,
+                        help="egress bandwidth offered to relays")
+    parser.add_argument("--segment-buffer", metavar="DIR",
+                        help="buffer the ingest in DIR so restarted relays start from it")
+    parser.add_argument("--log-dir", metavar="DIR",
+                        help="also keep relay output in a rotating log spool in DIR")
+    args = parser.parse_args()
+
+    agent = RelayAgent(
+        load_secret(args.secret_file), max_workers=args.workers,
+        cpu_cores=args.cpus, egress_kbps=args.egress_kbps,
+    )
+    if args.log_dir:
+        agent.supervisor.log_store = LogStore(args.log_dir)
+    if args.segment_buffer:
+        SegmentBuffer(agent.supervisor, agent.stream_manager, args.segment_buffer).start()
+
+    async def run():
+        server = await agent.serve(args.listen)
+        print(f"Relay agent listening on {args.listen}")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        agent.supervisor.stop_all()
+
+
+if __name__ == "__main__":
+    main()
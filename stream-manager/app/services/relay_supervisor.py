@@ -0,0 +1,205 @@
+import shlex
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from app.services.log_store import LogStore
+from app.services.process_registry import ProcessRegistry, Relay, stop_relay
+from app.services.telemetry import ProgressParser, TelemetryHub
+
+Command = Union[str, Sequence[str]]
+
+
+class RelaySupervisor:
+    """Starts every platform relay at once and owns the child processes.
+
+    Each relay gets reader threads for both pipes: `-progress` blocks on
+    stdout are parsed into the telemetry hub and stderr lines go into a
+    bounded output buffer. The Streamlit script only reads what is already
+    there and never blocks on a running ffmpeg, and no pipe is left to fill.
+
+    Relays are tracked in a `ProcessRegistry`, so single platforms can be
+    stopped or restarted and relays left running by a previous server
+    process are adopted on startup. With a `log_store`, every output line
+    is also kept there, per relay and across restarts.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 16,
+        max_output_lines: int = 1000,
+        telemetry: Optional[TelemetryHub] = None,
+        registry: Optional[ProcessRegistry] = None,
+        stop_deadline: float = 5.0,
+        log_store: Optional[LogStore] = None,
+    ):
+        self.max_workers = max_workers
+        self.stop_deadline = stop_deadline
+        self.telemetry = telemetry or TelemetryHub()
+        self.registry = registry or ProcessRegistry()
+        self.log_store = log_store
+        self._output: deque = deque(maxlen=max_output_lines)
+        self._listeners: Dict[str, List[Callable[[Relay], None]]] = {"start": [], "exit": []}
+        # Rewrites the command of a replacement relay, e.g. to start from
+        # buffered media (see SegmentBuffer); takes platform id and args.
+        self.recovery: Optional[Callable[[int, List[str]], List[str]]] = None
+        for relay in self.registry.recover_orphans():
+            self._emit(relay.name, f"Recovered running relay (pid {relay.pid})", relay.platform_id)
+
+    def start_all(self, commands: Dict[int, Tuple[str, Command]]) -> List[Relay]:
+        """Start relays for all platforms concurrently.
+
+        `commands` maps platform id to a `(name, command)` pair.
+        """
+        if not commands:
+            return []
+        with self._pool(len(commands), "relay-start") as pool:
+            futures = [
+                pool.submit(self.start, platform_id, name, command)
+                for platform_id, (name, command) in commands.items()
+            ]
+            return [future.result() for future in futures]
+
+    def start(self, platform_id: int, name: str, command: Command, recover: bool = False) -> Relay:
+        """Start (or replace) the relay for a single platform.
+
+        With `recover` a copy of the command goes through `recovery` first,
+        for relays replacing one that failed or had to be respawned. The
+        relay keeps the original, so later restarts are rewritten afresh
+        and fall back to it when recovery no longer applies.
+        """
+        args = shlex.split(command) if isinstance(command, str) else list(command)
+        launch_args = args
+        if recover and self.recovery is not None:
+            launch_args = self.recovery(platform_id, list(args))
+        previous = self.registry.get(platform_id)
+        if previous is not None and previous.running:
+            stop_relay(previous, self.stop_deadline)
+
+        relay = Relay(
+            platform_id=platform_id, name=name, command=args,
+            launch_command=launch_args if launch_args != args else None,
+        )
+        try:
+            relay.process = subprocess.Popen(
+                launch_args,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                bufsize=1,
+            )
+            relay.pid = relay.process.pid
+            relay.started_at = datetime.now()
+        except OSError as e:
+            relay.error = str(e)
+            self.registry.add(relay)
+            self._emit(name, f"Error: {e}", platform_id, "error")
+            return relay
+
+        self.registry.add(relay)
+        self._emit(name, f"Started relay (pid {relay.pid})", platform_id, "info")
+        self._notify("start", relay)
+        for target, suffix in ((self._pump_progress, "progress"), (self._pump_log, "log")):
+            threading.Thread(
+                target=target, args=(relay,), name=f"relay-{platform_id}-{suffix}", daemon=True
+            ).start()
+        return relay
+
+    def restart(self, platform_id: int) -> Optional[Relay]:
+        """Restart a single relay with the command it was last started with."""
+        relay = self.registry.get(platform_id)
+        if relay is None:
+            return None
+        return self.start(platform_id, relay.name, relay.command, recover=True)
+
+    def set_command(self, platform_id: int, command: Command) -> Optional[Relay]:
+        """Have the next restart of a relay that is not running use `command`."""
+        args = shlex.split(command) if isinstance(command, str) else list(command)
+        return self.registry.set_command(platform_id, args)
+
+    def _pump_progress(self, relay: Relay):
+        """Parse `-progress` output into telemetry records until the relay exits."""
+        parser = ProgressParser(relay.platform_id)
+        for line in relay.process.stdout:
+            if "=" not in line:
+                self._emit(relay.name, line.rstrip(), relay.platform_id)
+                continue
+            metrics = parser.feed(line)
+            if metrics is not None:
+                self.telemetry.publish(metrics)
+
+    def _pump_log(self, relay: Relay):
+        """Forward a relay's stderr into the shared buffer until it exits."""
+        for line in relay.process.stderr:
+            line = line.rstrip()
+            if line:
+                self._emit(relay.name, line, relay.platform_id)
+        code = relay.process.wait()
+        self.registry.mark_exited(relay, code)
+        self._emit(relay.name, f"Relay exited with code {code}", relay.platform_id, "error" if code else "info")
+        self._notify("exit", relay)
+
+    def add_listener(self, event: str, callback: Callable[[Relay], None]):
+        """Call `callback` with the relay on every "start" or "exit" event."""
+        self._listeners[event].append(callback)
+
+    def _notify(self, event: str, relay: Relay):
+        for callback in list(self._listeners[event]):
+            callback(relay)
+
+    def _emit(self, name: str, line: str, platform_id: Optional[int] = None, level: Optional[str] = None):
+        ts = datetime.now()
+        self._output.append((ts, name, line))
+        if self.log_store is not None:
+            self.log_store.append(platform_id, name, line, level, ts)
+
+    def log(self, name: str, line: str, level: Optional[str] = None):
+        """Add a line to the shared output buffer on behalf of another service."""
+        self._emit(name, line, level=level)
+
+    def drain_output(self) -> List[Tuple[datetime, str, str]]:
+        """Return and clear the output collected since the last call."""
+        lines = []
+        while True:
+            try:
+                lines.append(self._output.popleft())
+            except IndexError:
+                return lines
+
+    def relays(self) -> List[Relay]:
+        return self.registry.all()
+
+    def stop(self, platform_id: int) -> Optional[int]:
+        """Gracefully stop the relay for a single platform."""
+        relay = self.registry.get(platform_id)
+        if relay is None:
+            return None
+        if not relay.running:
+            # Already exited; still keep the watchdog from restarting it.
+            relay.stop_requested = True
+            return relay.exit_status
+        code = stop_relay(relay, self.stop_deadline)
+        self.registry.mark_exited(relay, code)
+        self._emit(relay.name, "Relay stopped", relay.platform_id, "info")
+        return code
+
+    def stop_all(self):
+        """Gracefully stop every relay, in parallel, exited ones included."""
+        platform_ids = [relay.platform_id for relay in self.registry.all()]
+        if not platform_ids:
+            return
+        with self._pool(len(platform_ids), "relay-stop") as pool:
+            list(pool.map(self.stop, platform_ids))
+
+    def remove(self, platform_id: int) -> Optional[int]:
+        """Stop a platform's relay and drop it from the registry for good."""
+        code = self.stop(platform_id)
+        self.registry.pop(platform_id)
+        return code
+
+    def _pool(self, jobs: int, prefix: str) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=min(self.max_workers, jobs), thread_name_prefix=prefix)
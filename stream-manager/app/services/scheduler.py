@@ -0,0 +1,685 @@
+"""Load-aware placement of platform relays across the relay instance group.
+
+Each platform's relay is placed on a relay node by bin-packing its
+estimated egress bitrate and CPU against the node's measured headroom.
+Nodes are discovered from the managed instance group (or a static list)
+and measured through their relay agents. When nodes join or leave, or a
+node runs past its target load, relays are moved make-before-break: the
+new relay is started and seen streaming before the old one is stopped.
+
+    python -m app.services.scheduler --group stream-relay-mig --zone us-central1-a
+    python -m app.services.scheduler --simulate 3 --node-cpus 2 --node-egress-kbps 20000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.config.profiles import get_rendition
+from app.services.data_access import PlatformRegistry
+from app.services.metrics_collector import GcloudTransport
+from app.services.process_registry import ProcessRegistry
+from app.services.relay_agent import (
+    AGENT_PORT, AgentClient, AgentError, RelayAgent, load_secret, platform_op,
+)
+from app.services.relay_supervisor import RelaySupervisor
+
+# Assumed bitrate of the ingest, which passthrough relays forward as-is.
+SOURCE_BITRATE_KBPS = 6000
+AUDIO_BITRATE_KBPS = 160
+# A passthrough relay is mostly socket copying.
+COPY_CPU_CORES = 0.05
+# Decoding the ingest once per transcoding relay.
+DECODE_CPU_CORES = 0.25
+# libx264 veryfast throughput of one core, in pixels per second
+# (about 1.5 cores for 1080p30).
+PIXELS_PER_CORE = 41_000_000
+# Nodes are packed up to this share of their capacity, leaving room for spikes.
+TARGET_UTILIZATION = 0.8
+# How long a migrated relay may take to report progress before the move is abandoned.
+HANDOVER_TIMEOUT = 15.0
+
+
+@dataclass(frozen=True)
+class Demand:
+    """Estimated cost of one platform's relay."""
+
+    platform_id: int
+    name: str
+    cpu_cores: float
+    egress_kbps: float
+
+
+def estimate_demand(platform_id: int, name: str, output_profile: Optional[str]) -> Demand:
+    rendition = get_rendition(output_profile)
+    if rendition is None:
+        return Demand(platform_id, name, COPY_CPU_CORES, SOURCE_BITRATE_KBPS + AUDIO_BITRATE_KBPS)
+    pixels = rendition.width * rendition.height * rendition.fps
+    return Demand(
+        platform_id, name,
+        DECODE_CPU_CORES + pixels / PIXELS_PER_CORE,
+        rendition.video_bitrate_kbps + AUDIO_BITRATE_KBPS,
+    )
+
+
+@dataclass
+class Node:
+    """A relay node's capacity and the load not explained by our relays."""
+
+    name: str
+    address: str
+    cpu_cores: float
+    egress_kbps: float
+    background_cpu: float = 0.0
+    background_egress_kbps: float = 0.0
+
+    def headroom(self, target: float = TARGET_UTILIZATION) -> Tuple[float, float]:
+        return (
+            self.cpu_cores * target - self.background_cpu,
+            self.egress_kbps * target - self.background_egress_kbps,
+        )
+
+
+@dataclass
+class Move:
+    platform_id: int
+    name: str
+    source: Optional[str]
+    target: str
+
+
+@dataclass
+class Plan:
+    """Where every relay should run and what it takes to get there."""
+
+    placements: Dict[int, str]
+    demands: List[Demand] = field(default_factory=list)
+    moves: List[Move] = field(default_factory=list)
+    stops: Dict[int, str] = field(default_factory=dict)
+    unplaced: List[Demand] = field(default_factory=list)
+
+
+def pack(
+    demands: Iterable[Demand],
+    nodes: Iterable[Node],
+    current: Optional[Dict[int, str]] = None,
+    target: float = TARGET_UTILIZATION,
+    rebalance: bool = False,
+) -> Tuple[Dict[int, str], List[Demand]]:
+    """Best-fit decreasing over two dimensions, CPU and egress.
+
+    Relays are placed largest first, measured by their larger share of the
+    average node. A relay stays on its current node while it still fits
+    there, so repacking only moves what must move; otherwise it goes to the
+    node it leaves the least headroom on. A running relay that fits nowhere
+    stays where it is rather than being dropped. With `rebalance`, relays
+    are then moved from the busiest node to the idlest one for as long as
+    that lowers the busier of the two, e.g. to fill a node that just
+    joined. Returns the placements and the new demands that fit nowhere.
+    """
+    demands = list(demands)
+    nodes = list(nodes)
+    current = current or {}
+    placements: Dict[int, str] = {}
+    unplaced: List[Demand] = []
+    if not nodes:
+        return placements, demands
+
+    free = {node.name: list(node.headroom(target)) for node in nodes}
+    mean_cpu = sum(node.cpu_cores for node in nodes) / len(nodes)
+    mean_egress = sum(node.egress_kbps for node in nodes) / len(nodes)
+
+    def size(demand: Demand) -> float:
+        return max(demand.cpu_cores / mean_cpu, demand.egress_kbps / mean_egress)
+
+    def fits(name: str, demand: Demand) -> bool:
+        cpu, egress = free[name]
+        return demand.cpu_cores <= cpu and demand.egress_kbps <= egress
+
+    def left_over(name: str, demand: Demand) -> float:
+        cpu, egress = free[name]
+        return min((cpu - demand.cpu_cores) / mean_cpu, (egress - demand.egress_kbps) / mean_egress)
+
+    def place(demand: Demand, name: str):
+        free[name][0] -= demand.cpu_cores
+        free[name][1] -= demand.egress_kbps
+        placements[demand.platform_id] = name
+
+    capacity = {node.name: (node.cpu_cores, node.egress_kbps) for node in nodes}
+
+    def load(name: str, cpu_delta: float = 0.0, egress_delta: float = 0.0) -> float:
+        cpu, egress = capacity[name]
+        return max(
+            (cpu * target - free[name][0] + cpu_delta) / cpu,
+            (egress * target - free[name][1] + egress_delta) / egress,
+        )
+
+    # Relays that still fit at home claim their capacity first, so a relay
+    # being moved cannot displace one that was fine where it is.
+    moving = []
+    for demand in sorted(demands, key=size, reverse=True):
+        home = current.get(demand.platform_id)
+        if home in free and fits(home, demand):
+            place(demand, home)
+        else:
+            moving.append(demand)
+    for demand in moving:
+        home = current.get(demand.platform_id)
+        candidates = [name for name in free if fits(name, demand)]
+        if candidates:
+            place(demand, min(candidates, key=lambda name: (left_over(name, demand), name)))
+        elif home in free:
+            place(demand, home)
+        else:
+            unplaced.append(demand)
+
+    if rebalance and len(free) > 1:
+        placed = sorted((d for d in demands if d.platform_id in placements), key=size, reverse=True)
+        # No more moves than relays, so equally busy nodes cannot trade forever.
+        for _ in range(len(placed)):
+            busiest = max(free, key=load)
+            idlest = min(free, key=load)
+            # The move that leaves the busier of the two nodes least loaded.
+            best, best_peak = None, load(busiest)
+            for demand in placed:
+                if placements[demand.platform_id] != busiest or not fits(idlest, demand):
+                    continue
+                peak = max(
+                    load(busiest, -demand.cpu_cores, -demand.egress_kbps),
+                    load(idlest, demand.cpu_cores, demand.egress_kbps),
+                )
+                if peak < best_peak:
+                    best, best_peak = demand, peak
+            if best is None:
+                break
+            free[busiest][0] += best.cpu_cores
+            free[busiest][1] += best.egress_kbps
+            place(best, idlest)
+    return placements, unplaced
+
+
+def _streaming(relay: Dict) -> bool:
+    """Whether an agent relay record shows progress from this very relay."""
+    progress = relay.get("progress")
+    if progress is None or relay.get("started_at") is None:
+        return False
+    # Progress older than the relay was left by an earlier one on the node.
+    return datetime.fromisoformat(progress["ts"]) >= datetime.fromisoformat(relay["started_at"])
+
+
+class StaticNodes:
+    """A fixed set of nodes, `name -> agent address`."""
+
+    def __init__(self, addresses: Dict[str, str]):
+        self.addresses = dict(addresses)
+
+    def discover(self) -> Dict[str, str]:
+        return dict(self.addresses)
+
+
+class InstanceGroupNodes:
+    """Running members of a managed instance group, reached on their internal IPs."""
+
+    def __init__(self, transport: GcloudTransport, port: int = AGENT_PORT):
+        self.transport = transport
+        self.port = port
+
+    def discover(self) -> Dict[str, str]:
+        names = self.transport.list_instances()
+        nodes = {}
+        for name, details in self.transport.describe(names).items():
+            if details.get("status") != "RUNNING":
+                continue
+            interfaces = details.get("networkInterfaces") or [{}]
+            nodes[name] = f"tcp://{interfaces[0].get('networkIP', name)}:{self.port}"
+        return nodes
+
+
+class RelayScheduler:
+    """Keeps every platform's relay on a node with room for it.
+
+    `reconcile` rediscovers and measures the nodes, packs the platforms'
+    demands onto them and applies the difference. Starts on one node go out
+    as a single agent batch and nodes are handled in parallel. A relay that
+    changes node is started on the new node first; the old relay is only
+    stopped once the new one reports progress of its own. A new relay that
+    reports none within `handover_timeout` is stopped again and the old one
+    keeps streaming. When a node joins, relays are rebalanced onto it the
+    same way. Platforms that reject a second
+    publisher on the same key make the new relay exit; it is then started
+    again after the old one is stopped, at the cost of a short gap.
+    """
+
+    def __init__(
+        self,
+        directory,
+        secret: bytes,
+        target: float = TARGET_UTILIZATION,
+        handover_timeout: float = HANDOVER_TIMEOUT,
+        client_factory: Optional[Callable[[str, bytes], AgentClient]] = None,
+        log: Optional[Callable[[str, str], None]] = None,
+    ):
+        self.directory = directory
+        self.secret = secret
+        self.target = target
+        self.handover_timeout = handover_timeout
+        self.client_factory = client_factory or AgentClient
+        self.nodes: Dict[str, Node] = {}
+        self.placements: Dict[int, str] = {}
+        self._clients: Dict[str, AgentClient] = {}
+        self._tx: Dict[str, Tuple[int, float]] = {}
+        self._demands: Dict[int, Demand] = {}
+        self._log = log or (lambda name, line: print(f"[{name}] {line}"))
+        self._lock = threading.Lock()
+
+    def _client(self, name: str, address: Optional[str] = None) -> AgentClient:
+        client = self._clients.get(name)
+        if address is None:
+            if client is not None:
+                return client
+            address = self.nodes[name].address
+        if client is None or client.address != address:
+            if client is not None:
+                client.close()
+            client = self.client_factory(address, self.secret)
+            self._clients[name] = client
+        return client
+
+    def _probe(self, name: str, address: str) -> Optional[Tuple[Dict, List[Dict]]]:
+        """A node's host figures and the relays its agent runs."""
+        try:
+            host, status = self._client(name, address).call([{"op": "host"}, {"op": "status"}])
+            return host["host"], status["relays"]
+        except (OSError, ValueError, KeyError, AgentError) as e:
+            self._log("scheduler", f"Node {name} unreachable: {e}")
+            return None
+
+    def _adopt(self, relays: Dict[str, List[Dict]]):
+        """Rebuild placements from what the reachable nodes actually run.
+
+        After a restart of the stream manager this recovers every placement
+        instead of starting second publishers elsewhere. Placements whose
+        relay is gone are dropped so they are placed again, and a platform
+        found running on several nodes keeps one relay.
+        """
+        running: Dict[int, List[str]] = {}
+        for node, states in relays.items():
+            for relay in states:
+                # Platform ids start at 1; the tee and the segment buffer are not placed.
+                if relay["platform_id"] > 0 and relay["running"]:
+                    running.setdefault(relay["platform_id"], []).append(node)
+        for pid, node in list(self.placements.items()):
+            if node in relays and node not in running.get(pid, []):
+                del self.placements[pid]
+        for pid, nodes in running.items():
+            keep = self.placements.get(pid)
+            if keep not in nodes:
+                keep = self.placements[pid] = nodes[0]
+                self._log("scheduler", f"Relay {pid} found running on {keep}")
+            for node in nodes:
+                if node != keep:
+                    self._log("scheduler", f"Stopping duplicate relay {pid} on {node}")
+                    self._call(node, [{"op": "stop", "platform_id": pid}])
+
+    def _measure(self, name: str, address: str, host: Dict) -> Node:
+        ours = [d for pid, d in self._demands.items() if self.placements.get(pid) == name]
+        egress = 0.0
+        previous = self._tx.get(name)
+        self._tx[name] = (host["tx_bytes"], host["monotonic"])
+        if previous is not None and host["monotonic"] > previous[1]:
+            rate = (host["tx_bytes"] - previous[0]) * 8 / 1000 / (host["monotonic"] - previous[1])
+            egress = max(0.0, rate - sum(d.egress_kbps for d in ours))
+        return Node(
+            name=name,
+            address=address,
+            cpu_cores=host["cpu_cores"],
+            egress_kbps=host["egress_capacity_kbps"],
+            background_cpu=max(0.0, host["load1"] - sum(d.cpu_cores for d in ours)),
+            background_egress_kbps=egress,
+        )
+
+    def refresh(self) -> Tuple[List[str], List[str]]:
+        """Rediscover and measure nodes; returns the names that joined and left."""
+        addresses = self.directory.discover()
+        before = set(self.nodes)
+        probes: Dict[str, Tuple[Dict, List[Dict]]] = {}
+        if addresses:
+            with ThreadPoolExecutor(max_workers=min(16, len(addresses)), thread_name_prefix="measure") as pool:
+                results = pool.map(lambda item: (item[0], self._probe(*item)), addresses.items())
+                probes = {name: probe for name, probe in results if probe is not None}
+        self._adopt({name: relays for name, (_, relays) in probes.items()})
+        measured = {name: self._measure(name, addresses[name], host) for name, (host, _) in probes.items()}
+        for name in set(self._clients) - set(measured):
+            self._clients.pop(name).close()
+            self._tx.pop(name, None)
+        self.nodes = measured
+        return sorted(set(measured) - before), sorted(before - set(measured))
+
+    def plan(self, platforms, rebalance: bool = False) -> Plan:
+        """Pack `platforms` onto the measured nodes without changing anything.
+
+        With `rebalance`, relays that fit where they are may still be moved
+        to even out the load, see `pack`.
+        """
+        demands = [estimate_demand(p.id, p.name, p.output_profile) for p in platforms]
+        current = {pid: node for pid, node in self.placements.items() if node in self.nodes}
+        placements, unplaced = pack(demands, self.nodes.values(), current, self.target, rebalance)
+        plan = Plan(placements=placements, demands=demands, unplaced=unplaced)
+        for demand in demands:
+            target = placements.get(demand.platform_id)
+            source = current.get(demand.platform_id)
+            if target is not None and target != source:
+                plan.moves.append(Move(demand.platform_id, demand.name, source, target))
+        wanted = {demand.platform_id for demand in demands}
+        for pid, node in current.items():
+            if pid not in wanted:
+                plan.stops[pid] = node
+        self._demands = {demand.platform_id: demand for demand in demands}
+        return plan
+
+    def apply(self, plan: Plan, platforms) -> List[Dict]:
+        """Carry out `plan`; returns one result per started relay."""
+        by_id = {platform.id: platform for platform in platforms}
+        batches: Dict[str, List[Move]] = {}
+        for move in plan.moves:
+            batches.setdefault(move.target, []).append(move)
+
+        results: List[Dict] = []
+        if batches:
+            with ThreadPoolExecutor(max_workers=len(batches), thread_name_prefix="place") as pool:
+                for node_results in pool.map(
+                    lambda item: self._start_on(item[0], item[1], by_id), batches.items()
+                ):
+                    results.extend(node_results)
+
+        stops: Dict[str, List[int]] = {}
+        for pid, node in plan.stops.items():
+            stops.setdefault(node, []).append(pid)
+            self.placements.pop(pid, None)
+        for node, pids in stops.items():
+            self._call(node, [{"op": "stop", "platform_id": pid} for pid in pids])
+        for demand in plan.unplaced:
+            self._log(demand.name, "No relay node has room for this relay")
+        return results
+
+    def reconcile(self, platforms) -> Plan:
+        """Refresh nodes, repack and apply; safe to call on a timer."""
+        with self._lock:
+            platforms = list(platforms)
+            # Known before measuring, so adopted relays are not counted as background load.
+            self._demands = {
+                p.id: estimate_demand(p.id, p.name, p.output_profile) for p in platforms
+            }
+            joined, left = self.refresh()
+            for name in joined:
+                self._log("scheduler", f"Node {name} joined")
+            for name in left:
+                self._log("scheduler", f"Node {name} left; its relays will be placed again")
+            # Spread relays onto nodes that joined a running group. On the
+            # first pass every node "joins", and adopted relays stay put.
+            plan = self.plan(platforms, rebalance=bool(joined) and len(joined) < len(self.nodes))
+            self.apply(plan, platforms)
+            return plan
+
+    def _call(self, node: str, ops: List[Dict]) -> Optional[List[Dict]]:
+        try:
+            return self._client(node).call(ops)
+        except (OSError, ValueError, AgentError) as e:
+            self._log("scheduler", f"Node {node}: {e}")
+            return None
+
+    def _start_on(self, node: str, moves: List[Move], by_id: Dict) -> List[Dict]:
+        """Start a batch of relays on one node and hand them over from their old nodes."""
+        ops = [platform_op(by_id[move.platform_id]) for move in moves]
+        results = self._call(node, ops) or [{"ok": False, "error": "node unreachable"}] * len(ops)
+
+        handovers = []
+        for move, result in zip(moves, results):
+            if not result["ok"]:
+                self._log(move.name, f"Start on {node} failed: {result.get('error') or result.get('relay', {}).get('error')}")
+                continue
+            if move.source is None:
+                self.placements[move.platform_id] = node
+                self._log(move.name, f"Placed on {node}")
+            else:
+                handovers.append(move)
+        if handovers:
+            failed = self._hand_over(node, handovers, ops)
+            results = [
+                {**result, "ok": False, "error": "handover failed"} if move.platform_id in failed else result
+                for move, result in zip(moves, results)
+            ]
+        return results
+
+    def _hand_over(self, node: str, moves: List[Move], ops: List[Dict]) -> List[int]:
+        """Stop each moved relay's old copy once the new one streams; returns failed platform ids."""
+        waiting = {move.platform_id: move for move in moves}
+        ready, exited, unknown, stalled = [], [], [], []
+        deadline = time.monotonic() + self.handover_timeout
+        while waiting:
+            result = self._call(node, [{"op": "metrics"}])
+            if not result:
+                # Nothing is known about the new relays, so the old ones keep streaming.
+                unknown.extend(waiting.values())
+                break
+            relays = {r["platform_id"]: r for r in result[0]["relays"]}
+            timed_out = time.monotonic() >= deadline
+            for pid in list(waiting):
+                relay = relays.get(pid)
+                if relay is None or not relay["running"]:
+                    exited.append(waiting.pop(pid))
+                elif _streaming(relay):
+                    ready.append(waiting.pop(pid))
+                elif timed_out:
+                    stalled.append(waiting.pop(pid))
+            if waiting:
+                time.sleep(0.5)
+
+        for move in unknown:
+            # Best effort, so the platform is not left with two publishers.
+            self._call(node, [{"op": "stop", "platform_id": move.platform_id}])
+            self._log(move.name, f"Move to {node} failed: node did not answer; relay stays on {move.source}")
+        for move in stalled:
+            self._call(node, [{"op": "stop", "platform_id": move.platform_id}])
+            self._log(
+                move.name,
+                f"Move to {node} failed: no progress within {self.handover_timeout:.0f}s; "
+                f"relay stays on {move.source}",
+            )
+        for move in ready:
+            self._call(move.source, [{"op": "stop", "platform_id": move.platform_id}])
+            self.placements[move.platform_id] = node
+            self._log(move.name, f"Moved from {move.source} to {node}")
+        for move in exited:
+            # Most likely the platform refused a second publisher on the key.
+            self._call(move.source, [{"op": "stop", "platform_id": move.platform_id}])
+            start = next(op for op in ops if op["platform_id"] == move.platform_id)
+            result = self._call(node, [start])
+            if result and result[0]["ok"]:
+                self.placements[move.platform_id] = node
+                self._log(move.name, f"Moved from {move.source} to {node} after stopping the old relay")
+            else:
+                self.placements.pop(move.platform_id, None)
+                self._log(move.name, f"Move to {node} failed; relay is stopped")
+        return [move.platform_id for move in unknown + stalled]
+
+    def status(self) -> Dict[int, Dict]:
+        """Agent state of every placed relay, by platform id."""
+        return self._placed("status", refresh=True)
+
+    def metrics(self) -> Dict[int, Dict]:
+        """Agent state and latest progress of every placed relay, by platform id.
+
+        Meant for polling, so nodes are not rediscovered when none are known.
+        """
+        return self._placed("metrics", refresh=False)
+
+    def _placed(self, op: str, refresh: bool) -> Dict[int, Dict]:
+        with self._lock:
+            if refresh and not self.nodes:
+                self.refresh()
+            states: Dict[int, Dict] = {}
+            for node in self.nodes:
+                result = self._call(node, [{"op": op}])
+                for relay in result[0]["relays"] if result else []:
+                    if self.placements.get(relay["platform_id"]) == node:
+                        states[relay["platform_id"]] = relay
+            return states
+
+    def reload(self, platform, stream_key: Optional[str] = None) -> Optional[Dict]:
+        """Restart a placed platform's relay on its node, e.g. with a rotated stream key."""
+        with self._lock:
+            node = self.placements.get(platform.id)
+            if node is None or node not in self.nodes:
+                return None
+            result = self._call(node, [platform_op(platform, stream_key)])
+            return result[0] if result else {"ok": False, "error": "node unreachable"}
+
+    def stop(self, platform_id: int) -> Optional[int]:
+        """Stop one platform's relay on its node and forget its placement."""
+        with self._lock:
+            node = self.placements.pop(platform_id, None)
+            if node is None or node not in self.nodes:
+                return None
+            result = self._call(node, [{"op": "stop", "platform_id": platform_id}])
+            return result[0].get("exit_status") if result else None
+
+    def restart(self, platform_id: int) -> Optional[Dict]:
+        """Restart one platform's relay on the node it is placed on."""
+        with self._lock:
+            node = self.placements.get(platform_id)
+            if node is None or node not in self.nodes:
+                return None
+            result = self._call(node, [{"op": "restart", "platform_id": platform_id}])
+            return result[0] if result else None
+
+    def stop_all(self):
+        """Stop every relay this scheduler placed, one batch per node."""
+        with self._lock:
+            by_node: Dict[str, List[int]] = {}
+            for pid, node in self.placements.items():
+                by_node.setdefault(node, []).append(pid)
+            for node, pids in by_node.items():
+                if node in self.nodes:
+                    self._call(node, [{"op": "stop", "platform_id": pid} for pid in pids])
+            self.placements.clear()
+
+    def close(self):
+        for client in self._clients.values():
+            client.close()
+        self._clients.clear()
+
+
+def simulate_nodes(
+    count: int,
+    secret: bytes,
+    cpu_cores: float = 2.0,
+    egress_kbps: float = 20_000,
+    directory: Optional[str] = None,
+    command_for: Optional[Callable[[object], object]] = None,
+) -> Tuple[StaticNodes, Callable[[], None]]:
+    """Run `count` relay agents in this process, each on its own unix socket.
+
+    Every simulated node has its own supervisor and state file and reports
+    the given capacity with no background load; `command_for` replaces the
+    relay command the agents build. Returns the node directory and a
+    function that stops the agents and their relays.
+    """
+    directory = directory or tempfile.mkdtemp(prefix="relay-nodes-")
+    os.makedirs(directory, exist_ok=True)
+    loop = asyncio.new_event_loop()
+    agents, servers, addresses = [], [], {}
+    for index in range(count):
+        name = f"sim-node-{index}"
+        supervisor = RelaySupervisor(registry=ProcessRegistry(os.path.join(directory, f"{name}.json")))
+        agents.append(RelayAgent(
+            secret, supervisor, cpu_cores=cpu_cores, egress_kbps=egress_kbps, host_metrics=False,
+            command_for=command_for,
+        ))
+        addresses[name] = f"unix://{os.path.join(directory, name + '.sock')}"
+    for agent, address in zip(agents, addresses.values()):
+        servers.append(loop.run_until_complete(agent.serve(address)))
+    thread = threading.Thread(target=loop.run_forever, name="sim-nodes", daemon=True)
+    thread.start()
+
+    async def shutdown():
+        for server in servers:
+            server.close()
+        # Connections end once their clients hang up.
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if tasks:
+            await asyncio.wait(tasks, timeout=1.0)
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        for agent in agents:
+            agent.supervisor.stop_all()
+
+    return StaticNodes(addresses), stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Place platform relays across relay nodes")
+    parser.add_argument("--group", default="stream-relay-mig")
+    parser.add_argument("--zone", default="us-central1-a")
+    parser.add_argument("--port", type=int, default=AGENT_PORT)
+    parser.add_argument("--secret-file", help="file holding the relay agent secret")
+    parser.add_argument("--simulate", type=int, metavar="N", help="run N local agents instead")
+    parser.add_argument("--node-cpus", type=float, default=2.0, help="simulated node CPU cores")
+    parser.add_argument("--node-egress-kbps", type=float, default=20_000,
+                        help="simulated node egress")
+    parser.add_argument("--dry-run", action="store_true", help="print the plan only")
+    parser.add_argument("--interval", type=float, help="keep reconciling every N seconds")
+    args = parser.parse_args()
+
+    registry = PlatformRegistry()
+    stop_simulation = None
+    if args.simulate:
+        secret = os.urandom(16)
+        directory, stop_simulation = simulate_nodes(
+            args.simulate, secret, args.node_cpus, args.node_egress_kbps,
+        )
+    else:
+        secret = load_secret(args.secret_file)
+        directory = InstanceGroupNodes(GcloudTransport(args.group, args.zone), args.port)
+
+    scheduler = RelayScheduler(directory, secret)
+    try:
+        while True:
+            platforms = registry.all()
+            if args.dry_run:
+                scheduler.refresh()
+                plan = scheduler.plan(platforms)
+            else:
+                plan = scheduler.reconcile(platforms)
+            for node in sorted(scheduler.nodes.values(), key=lambda n: n.name):
+                placed = [d for d in plan.demands if plan.placements.get(d.platform_id) == node.name]
+                print(
+                    f"{node.name}: {len(placed)} relays, "
+                    f"{sum(d.cpu_cores for d in placed):.2f}/{node.cpu_cores:g} cores, "
+                    f"{sum(d.egress_kbps for d in placed):.0f}/{node.egress_kbps:.0f} kbps"
+                )
+            for demand in plan.unplaced:
+                print(f"unplaced: {demand.name}")
+            if args.dry_run or not args.interval:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.close()
+        if stop_simulation is not None:
+            stop_simulation()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Rolling on-disk buffer of the ingest for fast relay recovery.
+
+One recorder process reads the ingest once and copies it into a ring of
+MPEG-TS segments cut on keyframes, with a live HLS playlist of the
+completed ones. A relay that replaces a failed or respawned one reads that
+playlist from its newest segment instead of the RTMP ingest, so it has a
+keyframe to send as soon as it connects rather than waiting up to a GOP
+for the next one. It sends the buffered segment faster than real time and
+then follows the playlist until it is next started fresh. That keeps it
+one completed segment behind the ingest: `segment_seconds` (2 s by
+default), stretched to the next keyframe, plus up to one playlist reload.
+
+Relays with a low-latency profile are not rewritten. Their input options
+(`-rtmp_buffer`, `-probesize`, ...) only apply to the live RTMP input, and
+the lag would undo what the profile is for, so they reconnect to the
+ingest and wait for its next keyframe as before.
+
+Disk use is bounded by the ring (`segment_wrap`): the ingest is written
+once, at its own bitrate, into a fixed number of reused files.
+"""
+import math
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+from app.services.process_registry import Relay
+from app.services.relay_supervisor import RelaySupervisor
+from app.services.telemetry import PROGRESS_ARGS, RelayMetrics
+from app.stream_manager import StreamManager
+
+# Supervisor key for the recorder; the tee uses 0 and platform ids start at 1.
+BUFFER_RELAY_ID = -1
+BUFFER_DIR = "./segment_buffer"
+PLAYLIST = "live.m3u8"
+SEGMENT_PATTERN = "seg%03d.ts"
+# Input options of the low-latency profiles, which the HLS demuxer rejects
+# or which starve its probing of the buffered segment.
+_LIVE_INPUT_OPTIONS = {"-rtmp_buffer", "-rw_timeout", "-probesize", "-analyzeduration"}
+
+
+def build_recorder_args(
+    ingest_url: str, directory: str, segment_seconds: float, segments: int
+) -> List[str]:
+    """Copy the ingest into a ring of keyframe-aligned segments.
+
+    The ring has two more files than the playlist lists, so a listed
+    segment is never the one being overwritten.
+    """
+    return [
+        "ffmpeg", *PROGRESS_ARGS, "-i", ingest_url,
+        "-map", "0", "-c", "copy",
+        "-f", "segment", "-segment_format", "mpegts",
+        "-segment_time", f"{segment_seconds:g}",
+        "-segment_wrap", str(segments + 2),
+        "-segment_list", os.path.join(directory, PLAYLIST),
+        "-segment_list_type", "m3u8",
+        "-segment_list_size", str(segments),
+        "-segment_list_flags", "+live",
+        os.path.join(directory, SEGMENT_PATTERN),
+    ]
+
+
+def recovery_args(args: List[str], ingest_url: str, playlist: str) -> List[str]:
+    """Point a relay command's ingest input at the newest buffered segment.
+
+    Commands whose input is neither the ingest nor the playlist, and
+    commands with a low-latency profile's input options, are returned
+    unchanged.
+    """
+    try:
+        index = next(
+            i for i in range(len(args) - 1)
+            if args[i] == "-i" and args[i + 1] in (ingest_url, playlist)
+        )
+    except StopIteration:
+        return args
+    if any(arg in _LIVE_INPUT_OPTIONS for arg in args[:index]):
+        return args
+    options, i = [], 0
+    while i < index:
+        if args[i] == "-live_start_index":
+            i += 2
+            continue
+        options.append(args[i])
+        i += 1
+    return [*options, "-live_start_index", "-1", "-i", playlist, *args[index + 2:]]
+
+
+def read_playlist(path: str) -> List[float]:
+    """Durations of the segments a playlist lists; empty if it is missing."""
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    durations = []
+    for line in lines:
+        if line.startswith("#EXTINF:"):
+            try:
+                durations.append(float(line[len("#EXTINF:"):].split(",", 1)[0]))
+            except ValueError:
+                continue
+    return durations
+
+
+@dataclass
+class BufferStats:
+    segments: int
+    window_seconds: float
+    disk_bytes: int
+    # Seconds since the playlist last changed, i.e. since a segment completed.
+    age_seconds: Optional[float]
+    write_kbps: Optional[float]
+
+
+@dataclass
+class Recovery:
+    platform_id: int
+    started_at: datetime
+    # Seconds from the replacement relay's start to its first progress report.
+    first_progress_seconds: Optional[float] = None
+
+
+class SegmentBuffer:
+    """Runs the recorder and rewrites replacement relays to read from it.
+
+    The recorder is a relay of the shared supervisor, so it is logged,
+    exported and restarted by the watchdog like any other. While the
+    buffer is fresh, `RelaySupervisor.start(..., recover=True)` goes
+    through `recover`; a stale buffer leaves commands untouched.
+    """
+
+    def __init__(
+        self,
+        supervisor: RelaySupervisor,
+        stream_manager: StreamManager,
+        directory: str = BUFFER_DIR,
+        segment_seconds: float = 2.0,
+        window_seconds: float = 10.0,
+        max_events: int = 100,
+    ):
+        self.supervisor = supervisor
+        self.stream_manager = stream_manager
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.segments = max(2, math.ceil(window_seconds / segment_seconds))
+        self.recoveries: Deque[Recovery] = deque(maxlen=max_events)
+        self._pending: Dict[int, Recovery] = {}
+        self._unsubscribe = None
+
+    @property
+    def playlist(self) -> str:
+        return os.path.join(self.directory, PLAYLIST)
+
+    @property
+    def running(self) -> bool:
+        relay = self.supervisor.registry.get(BUFFER_RELAY_ID)
+        return relay is not None and relay.running
+
+    def start(self) -> Relay:
+        os.makedirs(self.directory, exist_ok=True)
+        # Segments from an earlier run are not the current ingest.
+        for name in os.listdir(self.directory):
+            if name == PLAYLIST or name.endswith(".ts"):
+                os.unlink(os.path.join(self.directory, name))
+        args = build_recorder_args(
+            self.stream_manager.config["ingest_url"], self.directory,
+            self.segment_seconds, self.segments,
+        )
+        relay = self.supervisor.start(BUFFER_RELAY_ID, "buffer", args)
+        self.supervisor.recovery = self.recover
+        if self._unsubscribe is None:
+            self._unsubscribe = self.supervisor.telemetry.subscribe(self._on_metrics)
+        return relay
+
+    def stop(self):
+        if self.supervisor.recovery == self.recover:
+            self.supervisor.recovery = None
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+        self.supervisor.stop(BUFFER_RELAY_ID)
+
+    def available(self) -> bool:
+        """Whether the newest segment is recent enough to start a relay from."""
+        try:
+            age = time.time() - os.stat(self.playlist).st_mtime
+        except OSError:
+            return False
+        # A segment lasts at least segment_time and at most until the next keyframe.
+        return age < 3 * self.segment_seconds and bool(read_playlist(self.playlist))
+
+    def recover(self, platform_id: int, args: List[str]) -> List[str]:
+        if platform_id == BUFFER_RELAY_ID or not self.running or not self.available():
+            return args
+        recovered = recovery_args(args, self.stream_manager.config["ingest_url"], self.playlist)
+        if recovered is not args:
+            self._pending[platform_id] = Recovery(platform_id, datetime.now())
+        return recovered
+
+    def _on_metrics(self, metrics: RelayMetrics):
+        recovery = self._pending.get(metrics.platform_id)
+        if recovery is None or metrics.ended or metrics.frame == 0 or metrics.ts <= recovery.started_at:
+            return
+        recovery.first_progress_seconds = round((metrics.ts - recovery.started_at).total_seconds(), 3)
+        self.recoveries.append(recovery)
+        self._pending.pop(metrics.platform_id, None)
+
+    def stats(self) -> BufferStats:
+        durations = read_playlist(self.playlist)
+        disk_bytes = 0
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".ts"):
+                        disk_bytes += entry.stat().st_size
+        except OSError:
+            pass
+        try:
+            age = round(time.time() - os.stat(self.playlist).st_mtime, 3)
+        except OSError:
+            age = None
+        recorder = self.supervisor.telemetry.latest(BUFFER_RELAY_ID)
+        return BufferStats(
+            segments=len(durations),
+            window_seconds=round(sum(durations), 3),
+            disk_bytes=disk_bytes,
+            age_seconds=age,
+            write_kbps=recorder.bitrate_kbps if recorder is not None and self.running else None,
+        )
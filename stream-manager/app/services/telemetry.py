@@ -0,0 +1,133 @@
+import threading
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional
+
+# Global options that make ffmpeg write key=value progress blocks to stdout
+# and keep the human-readable status line off stderr.
+PROGRESS_ARGS = ["-nostats", "-progress", "pipe:1"]
+
+
+@dataclass
+class RelayMetrics:
+    platform_id: int
+    ts: datetime
+    frame: int = 0
+    fps: float = 0.0
+    bitrate_kbps: Optional[float] = None
+    total_size: int = 0
+    out_time_s: float = 0.0
+    speed: Optional[float] = None
+    dup_frames: int = 0
+    drop_frames: int = 0
+    ended: bool = False
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data["ts"] = self.ts.isoformat()
+        return data
+
+
+def _number(value: str, suffix: str = "") -> Optional[float]:
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[: -len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class ProgressParser:
+    """Incremental parser for ffmpeg `-progress` output.
+
+    ffmpeg writes one `key=value` pair per line and closes each block with
+    `progress=continue` or `progress=end`. Lines are fed one at a time and a
+    `RelayMetrics` record is returned whenever a block completes.
+    """
+
+    def __init__(self, platform_id: int):
+        self.platform_id = platform_id
+        self._block: Dict[str, str] = {}
+
+    def feed(self, line: str) -> Optional[RelayMetrics]:
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return None
+        if key != "progress":
+            self._block[key] = value
+            return None
+        block, self._block = self._block, {}
+        return self._build(block, ended=value == "end")
+
+    def _build(self, block: Dict[str, str], ended: bool) -> RelayMetrics:
+        out_time_us = _number(block.get("out_time_us", "")) or 0.0
+        return RelayMetrics(
+            platform_id=self.platform_id,
+            ts=datetime.now(),
+            frame=int(_number(block.get("frame", "")) or 0),
+            fps=_number(block.get("fps", "")) or 0.0,
+            bitrate_kbps=_number(block.get("bitrate", ""), "kbits/s"),
+            total_size=int(_number(block.get("total_size", "")) or 0),
+            out_time_s=out_time_us / 1_000_000,
+            speed=_number(block.get("speed", ""), "x"),
+            dup_frames=int(_number(block.get("dup_frames", "")) or 0),
+            drop_frames=int(_number(block.get("drop_frames", "")) or 0),
+            ended=ended,
+        )
+
+
+class TelemetryHub:
+    """Latest and recent metric records per platform.
+
+    Reader threads publish records as relays report progress; the UI and
+    exporters read snapshots or subscribe to new records.
+    """
+
+    def __init__(self, history_size: int = 120):
+        self.history_size = history_size
+        self._latest: Dict[int, RelayMetrics] = {}
+        self._history: Dict[int, Deque[RelayMetrics]] = {}
+        self._subscribers: List[Callable[[RelayMetrics], None]] = []
+        self._lock = threading.Lock()
+
+    def publish(self, metrics: RelayMetrics):
+        with self._lock:
+            self._latest[metrics.platform_id] = metrics
+            history = self._history.setdefault(
+                metrics.platform_id, deque(maxlen=self.history_size)
+            )
+            history.append(metrics)
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(metrics)
+
+    def latest(self, platform_id: int) -> Optional[RelayMetrics]:
+        with self._lock:
+            return self._latest.get(platform_id)
+
+    def snapshot(self) -> Dict[int, RelayMetrics]:
+        with self._lock:
+            return dict(self._latest)
+
+    def history(self, platform_id: int) -> List[RelayMetrics]:
+        with self._lock:
+            return list(self._history.get(platform_id, ()))
+
+    def subscribe(self, callback: Callable[[RelayMetrics], None]) -> Callable[[], None]:
+        """Call `callback` with every new record; returns an unsubscribe function."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+
+        return unsubscribe
+
+    def forget(self, platform_id: int):
+        with self._lock:
+            self._latest.pop(platform_id, None)
+            self._history.pop(platform_id, None)
@@ -0,0 +1,66 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.config.profiles import Rendition, get_latency_profile, get_rendition
+from app.services.telemetry import PROGRESS_ARGS
+from app.utils.ffmpeg_args import tee_outputs
+
+# (destination url, output profile name)
+Destination = Tuple[str, Optional[str]]
+
+
+def group_by_rendition(destinations: Iterable[Destination]) -> Dict[Optional[Rendition], List[str]]:
+    """Group destination urls by the rendition they need; None is passthrough."""
+    groups: Dict[Optional[Rendition], List[str]] = {}
+    for url, profile in destinations:
+        groups.setdefault(get_rendition(profile), []).append(url)
+    return groups
+
+
+def _encoder_args(rendition: Rendition) -> List[str]:
+    bitrate = rendition.video_bitrate_kbps
+    return [
+        "-c:v", "libx264", "-preset", rendition.preset, "-pix_fmt", "yuv420p",
+        "-b:v", f"{bitrate}k", "-maxrate", f"{bitrate}k", "-bufsize", f"{bitrate * 2}k",
+        "-g", str(rendition.gop), "-keyint_min", str(rendition.gop), "-sc_threshold", "0",
+        # Audio is passed through; only video differs between renditions.
+        "-c:a", "copy",
+        "-flags", "+global_header",
+    ]
+
+
+def build_ladder_args(
+    ingest_url: str, destinations: Iterable[Destination], latency_profile: Optional[str] = None
+) -> List[str]:
+    """Build one ffmpeg process serving every destination from a single decode.
+
+    The ingest is decoded once and `split` in a filter graph into one
+    scaled branch per unique rendition. Each rendition is encoded once and
+    written to all of its destinations through the tee muxer, and
+    passthrough destinations share a single `-c copy` tee output, so CPU
+    cost grows with the number of renditions rather than destinations.
+    The latency profile applies to the shared input and every tee output.
+    """
+    groups = group_by_rendition(destinations)
+    if not groups:
+        raise ValueError("transcoding ladder needs at least one destination")
+
+    latency = get_latency_profile(latency_profile)
+    args = ["ffmpeg", *PROGRESS_ARGS, *latency.input_args, "-i", ingest_url]
+    renditions = [rendition for rendition in groups if rendition is not None]
+    if renditions:
+        splits = "".join(f"[s{i}]" for i in range(len(renditions)))
+        scales = ";".join(
+            f"[s{i}]scale=w={r.width}:h={r.height}:force_original_aspect_ratio=decrease"
+            f":force_divisible_by=2,fps={r.fps}[v{i}]"
+            for i, r in enumerate(renditions)
+        )
+        args += ["-filter_complex", f"[0:v]split={len(renditions)}{splits};{scales}"]
+
+    if None in groups:
+        args += ["-map", "0", "-c", "copy", *latency.output_args]
+        args += ["-f", "tee", tee_outputs(groups[None])]
+    for i, rendition in enumerate(renditions):
+        args += ["-map", f"[v{i}]", "-map", "0:a?", *_encoder_args(rendition)]
+        args += [*latency.encoder_args, *latency.output_args]
+        args += ["-f", "tee", tee_outputs(groups[rendition])]
+    return args
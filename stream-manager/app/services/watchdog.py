@@ -0,0 +1,196 @@
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional
+
+from app.services.relay_supervisor import RelaySupervisor
+
+
+@dataclass
+class WatchdogConfig:
+    poll_interval: float = 1.0
+    # Restart a running relay that has not reported progress for this long.
+    stall_timeout: float = 15.0
+    # Bitrate collapse: below this fraction of the relay's own running
+    # average for `collapse_samples` consecutive progress records.
+    collapse_ratio: float = 0.2
+    collapse_samples: int = 5
+    # Jittered exponential backoff between restarts of the same relay.
+    backoff_base: float = 1.0
+    backoff_max: float = 60.0
+    # A relay that stays healthy this long has its backoff reset.
+    stable_after: float = 60.0
+
+
+@dataclass
+class RestartEvent:
+    platform_id: int
+    name: str
+    reason: str
+    attempt: int
+    delay: float
+    detected_at: datetime
+    restarted_at: Optional[datetime] = None
+    pid: Optional[int] = None
+
+
+@dataclass
+class _RelayHealth:
+    attempt: int = 0
+    next_restart: float = 0.0
+    pending_reason: Optional[str] = None
+    detected_at: Optional[datetime] = None
+    healthy_since: float = field(default_factory=time.monotonic)
+    bitrate_avg: Optional[float] = None
+    low_samples: int = 0
+    last_progress: Optional[datetime] = None
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Full-jitter exponential backoff for the given restart attempt."""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+class RelayWatchdog:
+    """Detects failed relays and restarts only the affected platform.
+
+    A relay is considered failed when its process exits, when it stops
+    reporting progress for `stall_timeout` seconds, or when its bitrate
+    collapses against its own running average. Every restart is recorded
+    as a `RestartEvent`.
+    """
+
+    def __init__(
+        self,
+        supervisor: RelaySupervisor,
+        config: Optional[WatchdogConfig] = None,
+        max_events: int = 500,
+    ):
+        self.supervisor = supervisor
+        self.config = config or WatchdogConfig()
+        self.events: Deque[RestartEvent] = deque(maxlen=max_events)
+        self._health: Dict[int, _RelayHealth] = {}
+        self._listeners: List[Callable[[RestartEvent], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.supervisor.telemetry.subscribe(self._on_metrics)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="relay-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def on_restart(self, callback: Callable[[RestartEvent], None]):
+        self._listeners.append(callback)
+
+    def forget(self, platform_id: int):
+        """Stop watching a platform, e.g. after it was stopped on purpose."""
+        with self._lock:
+            self._health.pop(platform_id, None)
+
+    def _on_metrics(self, metrics):
+        with self._lock:
+            health = self._health.setdefault(metrics.platform_id, _RelayHealth())
+            health.last_progress = metrics.ts
+            bitrate = metrics.bitrate_kbps
+            if bitrate is None:
+                return
+            if health.bitrate_avg is None:
+                health.bitrate_avg = bitrate
+                return
+            if bitrate < health.bitrate_avg * self.config.collapse_ratio:
+                health.low_samples += 1
+            else:
+                health.low_samples = 0
+                health.bitrate_avg = 0.9 * health.bitrate_avg + 0.1 * bitrate
+
+    def _run(self):
+        while not self._stop.wait(self.config.poll_interval):
+            self.check()
+
+    def check(self):
+        """Run one detection and restart pass over all watched relays."""
+        now = time.monotonic()
+        for relay in self.supervisor.relays():
+            with self._lock:
+                health = self._health.setdefault(relay.platform_id, _RelayHealth())
+                if relay.stop_requested:
+                    # Stopped on purpose, possibly while a restart was pending.
+                    health.pending_reason = None
+                    continue
+                reason = health.pending_reason or self._detect(relay, health)
+                if reason is None:
+                    if now - health.healthy_since >= self.config.stable_after:
+                        health.attempt = 0
+                    continue
+                if health.pending_reason is None:
+                    health.pending_reason = reason
+                    health.detected_at = datetime.now()
+                    delay = backoff_delay(
+                        health.attempt, self.config.backoff_base, self.config.backoff_max
+                    )
+                    health.next_restart = now + delay
+                    event = RestartEvent(
+                        platform_id=relay.platform_id,
+                        name=relay.name,
+                        reason=reason,
+                        attempt=health.attempt + 1,
+                        delay=delay,
+                        detected_at=health.detected_at,
+                    )
+                    self.events.append(event)
+                if now < health.next_restart:
+                    continue
+                event = self._pending_event(relay.platform_id)
+            self._restart(relay.platform_id, event)
+
+    def _detect(self, relay, health: _RelayHealth) -> Optional[str]:
+        if relay.stop_requested:
+            return None
+        if not relay.running:
+            if relay.error:
+                return f"failed to start ({relay.error})"
+            code = "unknown status" if relay.exit_status is None else f"code {relay.exit_status}"
+            return f"exited ({code})"
+        if relay.orphan:
+            # Adopted relays have no progress pipe to judge them by.
+            return None
+        last = health.last_progress or relay.started_at
+        if last is not None and (datetime.now() - last).total_seconds() > self.config.stall_timeout:
+            return f"stalled (no progress for {self.config.stall_timeout:.0f}s)"
+        if health.low_samples >= self.config.collapse_samples:
+            return f"bitrate collapse (below {self.config.collapse_ratio:.0%} of average)"
+        return None
+
+    def _pending_event(self, platform_id: int) -> Optional[RestartEvent]:
+        for event in reversed(self.events):
+            if event.platform_id == platform_id:
+                return event
+        return None
+
+    def _restart(self, platform_id: int, event: Optional[RestartEvent]):
+        relay = self.supervisor.restart(platform_id)
+        with self._lock:
+            health = self._health.setdefault(platform_id, _RelayHealth())
+            health.attempt += 1
+            health.pending_reason = None
+            health.healthy_since = time.monotonic()
+            health.last_progress = None
+            health.low_samples = 0
+            health.bitrate_avg = None
+        if event is not None:
+            event.restarted_at = datetime.now()
+            event.pid = relay.pid if relay is not None else None
+            for callback in self._listeners:
+                callback(event)
@@ -1,17 +1,95 @@
+import shlex
+from typing import Iterable, List, Optional, Tuple
+
+from app.config.profiles import get_latency_profile, get_rendition
+from app.services.telemetry import PROGRESS_ARGS
+from app.services.transcode import build_ladder_args
+from app.utils.ffmpeg_args import tee_outputs
+
+
 class StreamManager:
     def __init__(self):
         self.config = {
             "instance": "stream-relay",
             "zone": "us-central1-a",
+            "ingest_url": "rtmp://localhost:1935/live",
+            # Relay agent on the node (app.services.relay_agent)
+            "agent_address": "tcp://stream-relay:7070",
+            # Relay nodes the scheduler places relays on (app.services.scheduler)
+            "instance_group": "stream-relay-mig",
         }
-    
+
     def get_ssh_command(self):
         return f"gcloud compute ssh {self.config['instance']} --zone={self.config['zone']}"
-    
-    def get_stream_command(self, rtmp_url, stream_key):
+
+    def get_stream_args(
+        self,
+        rtmp_url,
+        stream_key,
+        output_profile: Optional[str] = None,
+        latency_profile: Optional[str] = None,
+    ) -> List[str]:
+        if get_rendition(output_profile) is not None:
+            # A dedicated encode for this platform alone; the tee fan-out
+            # shares encodes between platforms with the same profile.
+            return self.get_ladder_args([(rtmp_url, stream_key, output_profile)], latency_profile)
+        latency = get_latency_profile(latency_profile)
         # Corrected YouTube RTMP URL format
-        return f'ffmpeg -i rtmp://localhost:1935/live -c copy -f flv {rtmp_url}/{stream_key}'
-    
+        return [
+            "ffmpeg", *PROGRESS_ARGS, *latency.input_args, "-i", self.config["ingest_url"],
+            "-c", "copy", *latency.output_args, "-f", "flv", f"{rtmp_url}/{stream_key}",
+        ]
+
+    def get_stream_command(
+        self,
+        rtmp_url,
+        stream_key,
+        output_profile: Optional[str] = None,
+        latency_profile: Optional[str] = None,
+    ):
+        return shlex.join(self.get_stream_args(rtmp_url, stream_key, output_profile, latency_profile))
+
+    def get_platform_command(self, platform, stream_key: Optional[str] = None):
+        """Relay command for a `Platform`, optionally with a replacement stream key."""
+        return self.get_stream_command(
+            platform.rtmp_url, stream_key or platform.stream_key,
+            platform.output_profile, platform.latency_profile,
+        )
+
+    def get_tee_args(self, destinations: Iterable[Tuple[str, str]]) -> List[str]:
+        """Build one ffmpeg process that pulls the ingest once and fans out.
+
+        Every slave output gets `onfail=ignore` so a failing destination is
+        dropped without taking the others down.
+        """
+        return [
+            "ffmpeg", *PROGRESS_ARGS, "-i", self.config["ingest_url"],
+            "-map", "0", "-c", "copy", "-f", "tee",
+            tee_outputs(f"{rtmp_url}/{stream_key}" for rtmp_url, stream_key in destinations),
+        ]
+
+    def get_tee_command(self, destinations: Iterable[Tuple[str, str]]):
+        return shlex.join(self.get_tee_args(destinations))
+
+    def get_ladder_args(
+        self,
+        destinations: Iterable[Tuple[str, str, Optional[str]]],
+        latency_profile: Optional[str] = None,
+    ) -> List[str]:
+        """Tee fan-out that also serves platforms needing their own rendition."""
+        return build_ladder_args(
+            self.config["ingest_url"],
+            [(f"{rtmp_url}/{stream_key}", profile) for rtmp_url, stream_key, profile in destinations],
+            latency_profile,
+        )
+
+    def get_ladder_command(
+        self,
+        destinations: Iterable[Tuple[str, str, Optional[str]]],
+        latency_profile: Optional[str] = None,
+    ):
+        return shlex.join(self.get_ladder_args(destinations, latency_profile))
+
     def execute_remote_command(self, command):
-        ssh_command = f"{self.get_ssh_command()} --command='{command}'"
-        return ssh_command
\ No newline at end of file
+        ssh_command = f"{self.get_ssh_command()} --command={shlex.quote(command)}"
+        return ssh_command
@@ -0,0 +1,203 @@
+"""Live relay status tiles for the Streamlit page.
+
+Tiles are laid out once as placeholders and then refreshed in place on a
+throttled timer from the supervisor's telemetry, or from relay agent
+`metrics` records for relays on other hosts, instead of re-running the
+whole script. A tile is redrawn only when what it shows changed, and
+values are rounded to what a person reads (10 kbps, whole fps, minutes of
+uptime), so a tick with 50 steady relays sends almost nothing to the
+browser.
+"""
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional
+
+import streamlit as st
+
+from app.services.relay_supervisor import RelaySupervisor
+
+# A running relay without progress for this long is shown as stalled.
+STALE_AFTER_SECONDS = 5.0
+
+# Relay agent `metrics` records, or None while the agent cannot be reached.
+RecordSource = Callable[[], Optional[Iterable[Dict]]]
+
+
+@dataclass(frozen=True)
+class TileState:
+    name: str
+    state: str
+    bitrate_kbps: Optional[int] = None
+    fps: Optional[int] = None
+    uptime: str = ""
+
+
+def format_uptime(seconds: float) -> str:
+    """Seconds during the first minute, then minutes, so tiles change rarely."""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    minutes = seconds // 60
+    if minutes < 60:
+        return f"{minutes}m"
+    return f"{minutes // 60}h {minutes % 60:02d}m"
+
+
+def _tile(
+    name: str,
+    now: datetime,
+    running: bool,
+    state: str,
+    started_at: Optional[datetime],
+    progress_ts: Optional[datetime],
+    bitrate: Optional[float] = None,
+    fps: float = 0.0,
+) -> TileState:
+    """A relay's tile; a running relay is "starting" until it reports progress of its own."""
+    if not running:
+        return TileState(name, state)
+    uptime = format_uptime((now - started_at).total_seconds()) if started_at else ""
+    if progress_ts is None or (started_at and progress_ts < started_at):
+        return TileState(name, "starting", uptime=uptime)
+    stale = (now - progress_ts).total_seconds() > STALE_AFTER_SECONDS
+    return TileState(
+        name,
+        "stalled" if stale else "live",
+        int(round(bitrate, -1)) if bitrate is not None else None,
+        int(round(fps)),
+        uptime,
+    )
+
+
+def _exit_state(error: Optional[str], stop_requested: bool, exit_status: Optional[int]) -> str:
+    if error:
+        return "failed to start"
+    if stop_requested:
+        return "stopped"
+    return f"exited ({exit_status})"
+
+
+def tile_states(
+    supervisor: RelaySupervisor, names: Dict[int, str], now: datetime
+) -> Dict[int, TileState]:
+    """What every relay's tile shows, from the registry and the latest telemetry."""
+    telemetry = supervisor.telemetry.snapshot()
+    tiles = {}
+    for relay in supervisor.relays():
+        metrics = telemetry.get(relay.platform_id)
+        tiles[relay.platform_id] = _tile(
+            names.get(relay.platform_id, relay.name),
+            now,
+            relay.running,
+            _exit_state(relay.error, relay.stop_requested, relay.exit_status),
+            relay.started_at,
+            metrics.ts if metrics else None,
+            metrics.bitrate_kbps if metrics else None,
+            metrics.fps if metrics else 0.0,
+        )
+    return tiles
+
+
+def remote_tile_states(
+    records: Iterable[Dict], names: Dict[int, str], now: datetime
+) -> Dict[int, TileState]:
+    """Tiles for relays on other hosts, from relay agent `metrics` records."""
+    tiles = {}
+    for record in records:
+        progress = record.get("progress") or {}
+        started_at = record.get("started_at")
+        tiles[record["platform_id"]] = _tile(
+            names.get(record["platform_id"], record["name"]),
+            now,
+            record["running"],
+            _exit_state(record.get("error"), record.get("stop_requested", False), record.get("exit_status")),
+            datetime.fromisoformat(started_at) if started_at else None,
+            datetime.fromisoformat(progress["ts"]) if progress else None,
+            progress.get("bitrate_kbps"),
+            progress.get("fps") or 0.0,
+        )
+    return tiles
+
+
+def render_tile(tile: TileState) -> str:
+    details = []
+    if tile.bitrate_kbps is not None:
+        details.append(f"{tile.bitrate_kbps} kbps")
+    if tile.fps is not None:
+        details.append(f"{tile.fps} fps")
+    if tile.uptime:
+        details.append(f"up {tile.uptime}")
+    return f"**{tile.name}** · {tile.state}  \n{' · '.join(details) or '—'}"
+
+
+class LiveDashboard:
+    """Redraws changed relay tiles every `interval` seconds until the script reruns.
+
+    `run` blocks, so it must be the last thing the script draws. Any
+    widget interaction starts a new run, which Streamlit stops this loop
+    for at its next call; the "updated" caption written every tick is that
+    call. When relays appear or disappear the tile grid is rebuilt with a
+    rerun.
+
+    Tiles come from the local supervisor unless `records` is given: a
+    function returning relay agent `metrics` records for relays on another
+    host, or None when that host cannot be reached right now, in which
+    case the tiles keep what they show.
+    """
+
+    def __init__(self, supervisor: RelaySupervisor, interval: float = 1.0, columns: int = 3):
+        self.supervisor = supervisor
+        self.interval = interval
+        self.columns = columns
+
+    def _tiles(
+        self, names: Dict[int, str], now: datetime, records: Optional[RecordSource]
+    ) -> Optional[Dict[int, TileState]]:
+        if records is None:
+            return tile_states(self.supervisor, names, now)
+        remote = records()
+        return remote_tile_states(remote, names, now) if remote is not None else None
+
+    def _layout(self, tiles: Dict[int, TileState]) -> Dict[int, object]:
+        if not tiles:
+            st.caption("No relays running")
+        columns = st.columns(self.columns)
+        return {
+            platform_id: columns[index % self.columns].empty()
+            for index, platform_id in enumerate(sorted(tiles))
+        }
+
+    def render_once(
+        self, names: Dict[int, str], records: Optional[RecordSource] = None
+    ):
+        tiles = self._tiles(names, datetime.now(), records) or {}
+        for platform_id, placeholder in self._layout(tiles).items():
+            placeholder.markdown(render_tile(tiles[platform_id]))
+
+    def run(
+        self,
+        names: Dict[int, str],
+        on_tick: Optional[Callable[[], None]] = None,
+        records: Optional[RecordSource] = None,
+    ):
+        placeholders = self._layout(self._tiles(names, datetime.now(), records) or {})
+        status = st.empty()
+        rendered: Dict[int, TileState] = {}
+
+        next_tick = time.monotonic()
+        while True:
+            now = datetime.now()
+            tiles = self._tiles(names, now, records)
+            if tiles is not None and tiles.keys() != placeholders.keys():
+                st.rerun()
+            for platform_id, tile in (tiles or {}).items():
+                if rendered.get(platform_id) != tile:
+                    placeholders[platform_id].markdown(render_tile(tile))
+                    rendered[platform_id] = tile
+            if on_tick is not None:
+                on_tick()
+            status.caption(f"Updated {now.strftime('%H:%M:%S')}")
+            # A slow tick delays the next one instead of causing a burst.
+            next_tick = max(next_tick + self.interval, time.monotonic())
+            time.sleep(next_tick - time.monotonic())
@@ -0,0 +1,16 @@
+from typing import Iterable
+
+
+def tee_escape(value: str) -> str:
+    """Escape characters the tee muxer treats as separators."""
+    for char in ("\\", "'", "|", "[", "]"):
+        value = value.replace(char, f"\\{char}")
+    return value
+
+
+def tee_outputs(urls: Iterable[str], fmt: str = "flv") -> str:
+    """Tee muxer target for `urls`, each failing independently of the others."""
+    outputs = [f"[f={fmt}:onfail=ignore]{tee_escape(url)}" for url in urls]
+    if not outputs:
+        raise ValueError("tee fan-out needs at least one destination")
+    return "|".join(outputs)
@@ -0,0 +1,165 @@
+import os
+import re
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Pattern, Tuple
+
+
+def _translate(pattern: str) -> Tuple[Pattern, bool, bool]:
+    """Compile one gitignore-style pattern to `(regex, dir_only, negate)`.
+
+    A pattern without a slash matches a name at any depth; one with a
+    slash is anchored to the scan root. `*` and `?` stop at `/`, `**`
+    crosses directories and a trailing `/` matches directories only.
+    """
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+            continue
+        char = pattern[i]
+        if char == "*":
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            body = pattern[i + 1:end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            regex += f"[{body}]"
+            i = end
+        else:
+            regex += re.escape(char)
+        i += 1
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    return re.compile(regex + r"\Z"), dir_only, negate
+
+
+def read_ignore_file(path: str) -> List[str]:
+    """Patterns from a `.gitignore`-style file; missing files give none."""
+    try:
+        with open(path) as f:
+            lines = [line.rstrip("\n") for line in f]
+    except OSError:
+        return []
+    return [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+
+
+class PathFilter:
+    """Decides which entries a scan skips.
+
+    `names` are matched exactly against an entry's name (so `test` does not
+    match `contest`), ignoring case with `ignore_case`; `patterns` are
+    gitignore-style globs matched against the path relative to the scan
+    root. Later patterns win, and `!pattern` re-includes what an earlier
+    one excluded.
+    """
+
+    def __init__(self, names: Iterable[str] = (), patterns: Iterable[str] = (), ignore_case: bool = False):
+        self.ignore_case = ignore_case
+        self.names = frozenset(name.lower() for name in names) if ignore_case else frozenset(names)
+        self._rules = [_translate(pattern) for pattern in patterns]
+
+    def ignored(self, rel_path: str, name: str, is_dir: bool) -> bool:
+        if (name.lower() if self.ignore_case else name) in self.names:
+            return True
+        ignored = False
+        for regex, dir_only, negate in self._rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                ignored = not negate
+        return ignored
+
+
+class ScanEntry(NamedTuple):
+    entry: os.DirEntry
+    rel_path: str
+    depth: int
+
+    @property
+    def path(self) -> str:
+        return self.entry.path
+
+    @property
+    def name(self) -> str:
+        return self.entry.name
+
+
+def scan(
+    root: str,
+    path_filter: Optional[PathFilter] = None,
+    max_depth: Optional[int] = None,
+    follow_symlinks: bool = False,
+    include_dirs: bool = True,
+    include_files: bool = True,
+    on_error: Optional[Callable[[OSError], None]] = None,
+) -> Iterator[ScanEntry]:
+    """Walk `root` with `os.scandir`, yielding entries as they are found.
+
+    Ignored directories are pruned, so nothing below them is listed.
+    Entries directly in `root` have depth 1 and `max_depth` stops descent
+    below that depth. When following symlinks, each directory is entered
+    at most once (by device and inode), so link cycles end the branch.
+    Entries are yielded in name order, each directory before its contents.
+    """
+    visited = set()
+    if follow_symlinks:
+        stat = os.stat(root)
+        visited.add((stat.st_dev, stat.st_ino))
+
+    stack: List[Tuple[str, str, int]] = [(os.fspath(root), "", 0)]
+    while stack:
+        dir_path, rel_dir, depth = stack.pop()
+        try:
+            with os.scandir(dir_path) as iterator:
+                entries = sorted(iterator, key=lambda e: e.name)
+        except OSError as e:
+            if on_error is not None:
+                on_error(e)
+            continue
+
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=follow_symlinks)
+            except OSError:
+                is_dir = False
+            if path_filter is not None and path_filter.ignored(rel_path, entry.name, is_dir):
+                continue
+            if not is_dir:
+                if include_files:
+                    yield ScanEntry(entry, rel_path, depth + 1)
+                continue
+            if include_dirs:
+                yield ScanEntry(entry, rel_path, depth + 1)
+            if max_depth is not None and depth + 1 >= max_depth:
+                continue
+            if follow_symlinks:
+                try:
+                    stat = entry.stat()
+                except OSError as e:
+                    if on_error is not None:
+                        on_error(e)
+                    continue
+                key = (stat.st_dev, stat.st_ino)
+                if key in visited:
+                    continue
+                visited.add(key)
+            subdirs.append((entry.path, rel_path, depth + 1))
+        stack.extend(reversed(subdirs))
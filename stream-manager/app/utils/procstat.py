@@ -0,0 +1,46 @@
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+@dataclass
+class ProcSample:
+    pid: int
+    ts: float
+    cpu_seconds: float
+    rss_bytes: int
+
+
+def sample(pid: int) -> Optional[ProcSample]:
+    """Read CPU time and resident memory for a process from /proc.
+
+    Returns None if the process is gone or /proc is not available.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+        with open(f"/proc/{pid}/statm") as f:
+            statm = f.read().split()
+    except OSError:
+        return None
+    # The command name may contain spaces, so split after its closing paren.
+    fields = stat[stat.rindex(")") + 2:].split()
+    utime, stime = int(fields[11]), int(fields[12])
+    return ProcSample(
+        pid=pid,
+        ts=time.monotonic(),
+        cpu_seconds=(utime + stime) / _CLOCK_TICKS,
+        rss_bytes=int(statm[1]) * _PAGE_SIZE,
+    )
+
+
+def cpu_percent(before: ProcSample, after: ProcSample) -> float:
+    """CPU usage between two samples, as a percentage of one core."""
+    elapsed = after.ts - before.ts
+    if elapsed <= 0:
+        return 0.0
+    return 100.0 * (after.cpu_seconds - before.cpu_seconds) / elapsed
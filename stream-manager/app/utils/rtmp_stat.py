@@ -0,0 +1,225 @@
+import io
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, List, Optional, Union
+
+Source = Union[str, bytes, BinaryIO]
+
+
+@dataclass
+class ClientStat:
+    id: str = ""
+    address: str = ""
+    time_ms: int = 0
+    flashver: str = ""
+    dropped: int = 0
+    avsync: int = 0
+    timestamp: int = 0
+    publishing: bool = False
+    active: bool = False
+
+
+@dataclass
+class StreamStat:
+    application: str
+    name: str
+    time_ms: int = 0
+    bw_in: int = 0
+    bytes_in: int = 0
+    bw_out: int = 0
+    bytes_out: int = 0
+    bw_audio: int = 0
+    bw_video: int = 0
+    nclients: int = 0
+    publishing: bool = False
+    active: bool = False
+    video: Dict[str, str] = field(default_factory=dict)
+    audio: Dict[str, str] = field(default_factory=dict)
+    clients: List[ClientStat] = field(default_factory=list)
+
+    @property
+    def dropped(self) -> int:
+        return sum(client.dropped for client in self.clients)
+
+
+@dataclass
+class ApplicationStat:
+    name: str
+    nclients: int = 0
+    streams: Dict[str, StreamStat] = field(default_factory=dict)
+
+
+@dataclass
+class RtmpSnapshot:
+    taken_at: float
+    uptime: int = 0
+    naccepted: int = 0
+    bw_in: int = 0
+    bytes_in: int = 0
+    bw_out: int = 0
+    bytes_out: int = 0
+    applications: Dict[str, ApplicationStat] = field(default_factory=dict)
+
+    def streams(self) -> List[StreamStat]:
+        return [s for app in self.applications.values() for s in app.streams.values()]
+
+
+_INT_FIELDS = {
+    "time": "time_ms", "bw_in": "bw_in", "bytes_in": "bytes_in", "bw_out": "bw_out",
+    "bytes_out": "bytes_out", "bw_audio": "bw_audio", "bw_video": "bw_video",
+    "nclients": "nclients", "dropped": "dropped", "avsync": "avsync",
+    "timestamp": "timestamp", "uptime": "uptime", "naccepted": "naccepted",
+}
+_FLAG_FIELDS = {"publishing", "active"}
+
+
+def _set_field(record: Dict, tag: str, text: Optional[str]):
+    if tag in _FLAG_FIELDS:
+        record[tag] = True
+    elif tag in _INT_FIELDS:
+        try:
+            record[_INT_FIELDS[tag]] = int(text or 0)
+        except ValueError:
+            pass
+    else:
+        record[tag] = (text or "").strip()
+
+
+def parse_snapshot(source: Source, taken_at: Optional[float] = None) -> RtmpSnapshot:
+    """Parse nginx-rtmp `/rtmp_stat` XML incrementally.
+
+    Elements are cleared as soon as their client or stream record is built,
+    so memory stays flat no matter how many streams and clients the server
+    reports. `source` is a path, raw XML bytes or a binary file object.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    snapshot = RtmpSnapshot(taken_at=time.time() if taken_at is None else taken_at)
+    server: Dict = {}
+    app: Optional[ApplicationStat] = None
+    stream: Dict = {}
+    client: Dict = {}
+    meta: Dict[str, Dict[str, str]] = {"video": {}, "audio": {}}
+    elements: List[ET.Element] = []
+    stack: List[str] = []
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            elements.append(elem)
+            stack.append(elem.tag)
+            if elem.tag == "application":
+                app = ApplicationStat(name="")
+            elif elem.tag == "stream":
+                stream, meta = {"clients": []}, {"video": {}, "audio": {}}
+            elif elem.tag == "client":
+                client = {}
+            continue
+
+        tag = stack.pop()
+        elements.pop()
+        parent = stack[-1] if stack else None
+        done = True
+        if tag == "client":
+            stream["clients"].append(ClientStat(**{
+                k: v for k, v in client.items() if k in ClientStat.__dataclass_fields__
+            }))
+        elif tag == "stream" and app is not None:
+            fields = {k: v for k, v in stream.items() if k in StreamStat.__dataclass_fields__}
+            fields.update(application=app.name, video=meta["video"], audio=meta["audio"])
+            record = StreamStat(**fields)
+            app.streams[record.name] = record
+        elif tag == "application" and app is not None:
+            snapshot.applications[app.name] = app
+            app = None
+        else:
+            done = False
+        if done:
+            # Detach the finished subtree so the document never grows in memory.
+            elem.clear()
+            if elements:
+                elements[-1].remove(elem)
+        elif len(elem) == 0:
+            if parent == "client":
+                _set_field(client, tag, elem.text)
+            elif parent == "stream":
+                _set_field(stream, tag, elem.text)
+            elif parent in meta and stack[-2:-1] == ["meta"]:
+                meta[parent][tag] = (elem.text or "").strip()
+            elif parent == "application" and tag == "name" and app is not None:
+                app.name = (elem.text or "").strip()
+            elif parent == "live" and tag == "nclients" and app is not None:
+                app.nclients = int(elem.text or 0)
+            elif parent == "rtmp":
+                _set_field(server, tag, elem.text)
+
+    for key in ("uptime", "naccepted", "bw_in", "bytes_in", "bw_out", "bytes_out"):
+        if key in server:
+            setattr(snapshot, key, server[key])
+    return snapshot
+
+
+@dataclass
+class StreamDelta:
+    application: str
+    name: str
+    in_kbps: float
+    out_kbps: float
+    dropped: int
+    clients_joined: List[str]
+    clients_left: List[str]
+
+
+@dataclass
+class SnapshotDelta:
+    elapsed_s: float
+    in_kbps: float
+    out_kbps: float
+    streams: List[StreamDelta]
+    streams_started: List[str]
+    streams_ended: List[str]
+
+
+def _counter_delta(before: int, after: int) -> int:
+    # Counters go backwards when nginx restarts or a stream is republished.
+    return after - before if after >= before else after
+
+
+def _rate_kbps(before: int, after: int, elapsed: float) -> float:
+    return _counter_delta(before, after) * 8 / 1000 / elapsed if elapsed > 0 else 0.0
+
+
+def diff_snapshots(previous: RtmpSnapshot, current: RtmpSnapshot) -> SnapshotDelta:
+    """Bandwidth, dropped frames and client churn between two snapshots.
+
+    Elapsed time is the difference of the snapshots' `taken_at` wall-clock
+    times; the server's `uptime` only has whole seconds. Rates are zero
+    when no time passed between the two.
+    """
+    elapsed = current.taken_at - previous.taken_at
+
+    before = {(s.application, s.name): s for s in previous.streams()}
+    after = {(s.application, s.name): s for s in current.streams()}
+    streams = []
+    for key, stream in after.items():
+        old = before.get(key)
+        old_clients = {c.id for c in old.clients} if old else set()
+        new_clients = {c.id for c in stream.clients}
+        streams.append(StreamDelta(
+            application=stream.application,
+            name=stream.name,
+            in_kbps=_rate_kbps(old.bytes_in if old else 0, stream.bytes_in, elapsed),
+            out_kbps=_rate_kbps(old.bytes_out if old else 0, stream.bytes_out, elapsed),
+            dropped=_counter_delta(old.dropped if old else 0, stream.dropped),
+            clients_joined=sorted(new_clients - old_clients),
+            clients_left=sorted(old_clients - new_clients),
+        ))
+
+    return SnapshotDelta(
+        elapsed_s=elapsed,
+        in_kbps=_rate_kbps(previous.bytes_in, current.bytes_in, elapsed),
+        out_kbps=_rate_kbps(previous.bytes_out, current.bytes_out, elapsed),
+        streams=streams,
+        streams_started=sorted(f"{a}/{n}" for a, n in after.keys() - before.keys()),
+        streams_ended=sorted(f"{a}/{n}" for a, n in before.keys() - after.keys()),
+    )
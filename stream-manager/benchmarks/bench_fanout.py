@@ -0,0 +1,106 @@
+"""Compare CPU and memory per destination for the two fan-out modes.
+
+Runs N destinations first as one ffmpeg per platform and then as a single
+tee process, both pulling from a live ingest, and reports CPU and RSS per
+destination as JSON. Destinations are local FLV files so the numbers cover
+the relay itself rather than the upstream network.
+
+    python benchmarks/bench_fanout.py --ingest rtmp://localhost:1935/live -n 5
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.fanout import TeeFanout
+from app.services.process_registry import ProcessRegistry
+from app.services.relay_supervisor import RelaySupervisor
+from app.stream_manager import StreamManager
+from app.utils import procstat
+
+
+def measure(supervisor: RelaySupervisor, warmup: float, duration: float) -> dict:
+    time.sleep(warmup)
+    pids = [r.pid for r in supervisor.relays() if r.running]
+    before = {pid: procstat.sample(pid) for pid in pids}
+    time.sleep(duration)
+    after = {pid: procstat.sample(pid) for pid in pids}
+
+    cpu = 0.0
+    rss = 0
+    for pid in pids:
+        if before[pid] is None or after[pid] is None:
+            continue
+        cpu += procstat.cpu_percent(before[pid], after[pid])
+        rss += after[pid].rss_bytes
+    return {"processes": len(pids), "cpu_percent": cpu, "rss_bytes": rss}
+
+
+def run_mode(mode: str, sink_dir: str, stream_manager: StreamManager, args) -> dict:
+    # Each mode writes into its own directory so ffmpeg never hits an
+    # existing file and stops to ask about overwriting it.
+    mode_dir = os.path.join(sink_dir, mode)
+    os.makedirs(mode_dir)
+    platforms = [
+        SimpleNamespace(
+            id=i, name=f"dest{i}", rtmp_url=mode_dir, stream_key=f"dest{i}.flv", output_profile=None,
+            latency_profile=None,
+        )
+        for i in range(1, args.destinations + 1)
+    ]
+    # A registry of its own, so relays of a running server are not adopted and stopped.
+    supervisor = RelaySupervisor(registry=ProcessRegistry(os.path.join(sink_dir, f"{mode}.json")))
+    try:
+        if mode == "process":
+            supervisor.start_all({
+                p.id: (p.name, stream_manager.get_stream_command(p.rtmp_url, p.stream_key))
+                for p in platforms
+            })
+        else:
+            TeeFanout(supervisor, stream_manager).sync(platforms)
+        result = measure(supervisor, args.warmup, args.duration)
+    finally:
+        supervisor.stop_all()
+
+    count = len(platforms)
+    result.update({
+        "mode": mode,
+        "destinations": count,
+        "cpu_percent_per_destination": result["cpu_percent"] / count,
+        "rss_bytes_per_destination": result["rss_bytes"] // count,
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ingest", default="rtmp://localhost:1935/live")
+    parser.add_argument("-n", "--destinations", type=int, default=5)
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    stream_manager = StreamManager()
+    stream_manager.config["ingest_url"] = args.ingest
+
+    with tempfile.TemporaryDirectory(prefix="bench_fanout_") as sink_dir:
+        results = [
+            run_mode(mode, sink_dir, stream_manager, args)
+            for mode in ("process", "tee")
+        ]
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
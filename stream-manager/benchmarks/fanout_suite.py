@@ -0,0 +1,148 @@
+"""Fan-out benchmark suite against local loopback ingest and sinks.
+
+For each destination count the suite starts listening sinks, drives the
+stream manager's real command builders (one process per platform, then
+the single tee process) and reports startup time, per-relay CPU/RSS,
+delivered bitrate and end-to-end lag as JSON.
+
+    python benchmarks/fanout_suite.py --counts 1 5 10 25 50 --output bench_output.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.fanout import TeeFanout
+from app.services.process_registry import ProcessRegistry
+from app.services.relay_supervisor import RelaySupervisor
+from app.stream_manager import StreamManager
+from app.utils import procstat
+from benchmarks.loopback import LoopbackProcess, free_port, make_test_file, start_ingest, start_sink
+
+MODES = ("process", "tee")
+DEFAULT_COUNTS = (1, 5, 10, 25, 50)
+
+
+def _wait_for_sinks(sinks: List[LoopbackProcess], start: float, timeout: float) -> float:
+    """Seconds from `start` until every sink received media, or `timeout`."""
+    while time.monotonic() - start < timeout:
+        if all(sink.first_progress is not None for sink in sinks):
+            return max(sink.first_progress for sink in sinks) - start
+        time.sleep(0.05)
+    return timeout
+
+
+def _lag_seconds(ingests: List[LoopbackProcess], sinks: List[LoopbackProcess]) -> List[float]:
+    """Media time sent by the ingest minus media time received by each sink."""
+    lags = []
+    for i, sink in enumerate(sinks):
+        ingest = ingests[i] if len(ingests) > 1 else ingests[0]
+        if ingest.latest is not None and sink.latest is not None:
+            lags.append(ingest.latest.out_time_s - sink.latest.out_time_s)
+    return lags
+
+
+def run_case(mode: str, count: int, source_file: str, state_dir: str, args) -> Dict:
+    stream_manager = StreamManager()
+    sinks, ingests = [], []
+    supervisor = RelaySupervisor(
+        registry=ProcessRegistry(os.path.join(state_dir, f"{mode}_{count}.json")),
+        max_workers=max(count, 1),
+    )
+    try:
+        platforms = []
+        for i in range(1, count + 1):
+            port = free_port()
+            sinks.append(start_sink(port, f"key{i}"))
+            platforms.append(SimpleNamespace(
+                id=i, name=f"sink{i}", rtmp_url=f"rtmp://127.0.0.1:{port}/live",
+                stream_key=f"key{i}", output_profile=None, latency_profile=None,
+            ))
+
+        # A -listen 1 ingest serves one client, so each process needs its own.
+        ingest_count = count if mode == "process" else 1
+        commands = {}
+        for i in range(ingest_count):
+            port = free_port()
+            ingests.append(start_ingest(source_file, port))
+            stream_manager.config["ingest_url"] = ingests[-1].url
+            if mode == "process":
+                p = platforms[i]
+                commands[p.id] = (p.name, stream_manager.get_stream_args(p.rtmp_url, p.stream_key))
+
+        started = time.monotonic()
+        if mode == "process":
+            supervisor.start_all(commands)
+        else:
+            TeeFanout(supervisor, stream_manager).sync(platforms)
+        startup = _wait_for_sinks(sinks, started, args.startup_timeout)
+        delivered = sum(1 for sink in sinks if sink.first_progress is not None)
+
+        pids = [relay.pid for relay in supervisor.relays() if relay.running]
+        before = {pid: procstat.sample(pid) for pid in pids}
+        size_before = [sink.latest.total_size if sink.latest else 0 for sink in sinks]
+        time.sleep(args.duration)
+        after = {pid: procstat.sample(pid) for pid in pids}
+        size_after = [sink.latest.total_size if sink.latest else 0 for sink in sinks]
+        lags = _lag_seconds(ingests, sinks)
+
+        cpu = [
+            procstat.cpu_percent(before[pid], after[pid])
+            for pid in pids if before[pid] and after[pid]
+        ]
+        rss = [after[pid].rss_bytes for pid in pids if after[pid]]
+        bitrates = [(b - a) * 8 / 1000 / args.duration for a, b in zip(size_before, size_after)]
+        return {
+            "mode": mode,
+            "destinations": count,
+            "relay_processes": len(pids),
+            "delivered": delivered,
+            "startup_seconds": round(startup, 3),
+            "cpu_percent_total": round(sum(cpu), 2),
+            "cpu_percent_per_destination": round(sum(cpu) / count, 2),
+            "rss_bytes_total": sum(rss),
+            "rss_bytes_per_destination": sum(rss) // count,
+            "delivered_kbps_avg": round(sum(bitrates) / count, 1),
+            "delivered_kbps_min": round(min(bitrates), 1),
+            "lag_seconds_avg": round(sum(lags) / len(lags), 3) if lags else None,
+            "lag_seconds_max": round(max(lags), 3) if lags else None,
+        }
+    finally:
+        supervisor.stop_all()
+        for process in sinks + ingests:
+            process.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", type=int, nargs="+", default=list(DEFAULT_COUNTS))
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--duration", type=float, default=15.0, help="measurement window (s)")
+    parser.add_argument("--startup-timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="fanout_suite_") as work_dir:
+        source_file = make_test_file(os.path.join(work_dir, "source.flv"))
+        for count in args.counts:
+            for mode in args.modes:
+                result = run_case(mode, count, source_file, work_dir, args)
+                print(json.dumps(result), file=sys.stderr)
+                results.append(result)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""End-to-end latency probe for relay commands and latency profiles.
+
+A loopback ingest generates a small video whose frames carry the
+wallclock time they were generated at, drawn as a 24-bit millisecond
+code in a 6x4 grid of black and white cells. A loopback sink decodes
+every frame it receives to that grid, so each frame's delay is the
+arrival time minus the embedded time, in milliseconds and on the same
+clock. Each case starts the stream manager's real relay command for one
+output and latency profile between its own ingest and sink. A reference
+sink reading the ingest directly gives the delay of the probe itself,
+which is subtracted to get what the relay adds.
+
+    python benchmarks/latency_probe.py --latency-profiles standard low minimal --output latency.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.profiles import COPY_PROFILE, LATENCY_PROFILES
+from app.services.process_registry import ProcessRegistry
+from app.services.relay_supervisor import RelaySupervisor
+from app.stream_manager import StreamManager
+from benchmarks.loopback import free_port, wait_listening
+
+GRID_COLUMNS, GRID_ROWS = 6, 4
+CODE_BITS = GRID_COLUMNS * GRID_ROWS
+CODE_MODULO = 1 << CODE_BITS
+FRAME_RATE = 30
+# Frames from the first seconds are dropped while connections settle.
+WARMUP_SECONDS = 2.0
+
+# Wallclock milliseconds (mod 2^24) taken as each frame is generated and
+# drawn as bit (column + 6 * row) of the grid.
+MARKER_FILTER = (
+    f"color=c=black:s=96x64:r={FRAME_RATE},realtime,settb=1/1000,setpts=RTCTIME/1000,"
+    "geq=lum='if(mod(floor(mod(floor(T*1000),{modulo})"
+    "/pow(2,floor(X*{cols}/W)+{cols}*floor(Y*{rows}/H))),2),235,16)':cb=128:cr=128,"
+    f"setpts=N/({FRAME_RATE}*TB)"
+).format(modulo=CODE_MODULO, cols=GRID_COLUMNS, rows=GRID_ROWS)
+
+LOW_DELAY_INPUT = ["-fflags", "nobuffer", "-flags", "low_delay"]
+
+
+def decode_marker(frame: bytes) -> int:
+    """Millisecond code from one 6x4 gray frame."""
+    return sum(1 << bit for bit, value in enumerate(frame[:CODE_BITS]) if value > 128)
+
+
+def _stop(process: subprocess.Popen):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def start_marker_ingest(port: int) -> subprocess.Popen:
+    """Serve the marker video live to one RTMP client."""
+    url = f"rtmp://127.0.0.1:{port}/live/ingest"
+    process = subprocess.Popen(
+        [
+            "ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", MARKER_FILTER,
+            "-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency",
+            "-pix_fmt", "yuv420p", "-g", str(FRAME_RATE), "-flush_packets", "1",
+            "-f", "flv", "-listen", "1", url,
+        ],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+    )
+    wait_listening(port)
+    return process
+
+
+class MarkerSink:
+    """Decodes received frames to the marker grid and records their delay."""
+
+    def __init__(self, url: str, listen: bool):
+        self.url = url
+        self.delays_ms: List[float] = []
+        self.started = time.monotonic()
+        args = ["ffmpeg", "-loglevel", "error", *LOW_DELAY_INPUT]
+        if listen:
+            args += ["-listen", "1", "-f", "flv"]
+        args += [
+            "-i", url, "-an",
+            "-vf", f"scale={GRID_COLUMNS}:{GRID_ROWS}:flags=area,format=gray",
+            "-f", "rawvideo", "pipe:1",
+        ]
+        self.process = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE)
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        frame_size = GRID_COLUMNS * GRID_ROWS
+        while True:
+            frame = self.process.stdout.read(frame_size)
+            arrived_ms = int(time.time() * 1000) % CODE_MODULO
+            if len(frame) < frame_size:
+                return
+            if time.monotonic() - self.started < WARMUP_SECONDS:
+                continue
+            delay = (arrived_ms - decode_marker(frame)) % CODE_MODULO
+            # A garbled frame decodes to an arbitrary code; keep plausible delays.
+            if delay < 60_000:
+                self.delays_ms.append(delay)
+
+    def stop(self):
+        _stop(self.process)
+
+
+def _summary(delays: List[float]) -> Dict:
+    if not delays:
+        return {"frames": 0, "p50_ms": None, "p95_ms": None, "max_ms": None}
+    ordered = sorted(delays)
+    return {
+        "frames": len(ordered),
+        "p50_ms": round(statistics.median(ordered), 1),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+        "max_ms": round(ordered[-1], 1),
+    }
+
+
+def run_reference(duration: float) -> Dict:
+    """Probe delay with no relay: a sink reading the ingest directly."""
+    ingest_port = free_port()
+    ingest = start_marker_ingest(ingest_port)
+    sink = MarkerSink(f"rtmp://127.0.0.1:{ingest_port}/live/ingest", listen=False)
+    try:
+        time.sleep(WARMUP_SECONDS + duration)
+    finally:
+        sink.stop()
+        _stop(ingest)
+    return {"case": "reference", **_summary(sink.delays_ms)}
+
+
+def run_case(
+    output_profile: str, latency_profile: str, state_dir: str, duration: float,
+    reference_ms: Optional[float],
+) -> Dict:
+    stream_manager = StreamManager()
+    supervisor = RelaySupervisor(
+        registry=ProcessRegistry(os.path.join(state_dir, f"{output_profile}_{latency_profile}.json")),
+    )
+    ingest_port, sink_port = free_port(), free_port()
+    ingest = start_marker_ingest(ingest_port)
+    sink = MarkerSink(f"rtmp://127.0.0.1:{sink_port}/live/probe", listen=True)
+    try:
+        wait_listening(sink_port)
+        stream_manager.config["ingest_url"] = f"rtmp://127.0.0.1:{ingest_port}/live/ingest"
+        command = stream_manager.get_stream_args(
+            f"rtmp://127.0.0.1:{sink_port}/live", "probe", output_profile, latency_profile
+        )
+        relay = supervisor.start(1, "probe", command)
+        if relay.error:
+            raise RuntimeError(f"relay failed to start: {relay.error}")
+        sink.started = time.monotonic()
+        time.sleep(WARMUP_SECONDS + duration)
+    finally:
+        supervisor.stop_all()
+        sink.stop()
+        _stop(ingest)
+
+    result = {
+        "case": "relay",
+        "output_profile": output_profile,
+        "latency_profile": latency_profile,
+        **_summary(sink.delays_ms),
+    }
+    if reference_ms is not None and result["p50_ms"] is not None:
+        result["added_p50_ms"] = round(result["p50_ms"] - reference_ms, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-profiles", nargs="+", choices=list(LATENCY_PROFILES),
+                        default=list(LATENCY_PROFILES))
+    parser.add_argument("--output-profiles", nargs="+", default=[COPY_PROFILE])
+    parser.add_argument("--duration", type=float, default=10.0, help="measurement window per case (s)")
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    reference = run_reference(args.duration)
+    print(json.dumps(reference), file=sys.stderr)
+    results = [reference]
+    with tempfile.TemporaryDirectory(prefix="latency_probe_") as state_dir:
+        for output_profile in args.output_profiles:
+            for latency_profile in args.latency_profiles:
+                result = run_case(
+                    output_profile, latency_profile, state_dir, args.duration, reference["p50_ms"]
+                )
+                print(json.dumps(result), file=sys.stderr)
+                results.append(result)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
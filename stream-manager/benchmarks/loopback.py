@@ -0,0 +1,134 @@
+"""Local stand-ins for the ingest server and destination platforms.
+
+Benchmarks start a listening ffmpeg as the ingest (`-listen 1`, serving a
+pre-encoded test file in real time) and one listening ffmpeg per
+destination as the sink. Both report `-progress`, so delivered bitrate and
+media time can be compared without any external RTMP server.
+"""
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.telemetry import PROGRESS_ARGS, ProgressParser, RelayMetrics
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _listening_ports() -> Optional[set]:
+    try:
+        with open("/proc/net/tcp") as f:
+            lines = f.readlines()[1:]
+    except OSError:
+        return None
+    # Column 1 is local "ADDR:PORT" in hex, column 3 the state; 0A is LISTEN.
+    return {
+        int(fields[1].split(":")[1], 16)
+        for fields in (line.split() for line in lines)
+        if fields[3] == "0A"
+    }
+
+
+def wait_listening(port: int, timeout: float = 10.0):
+    """Wait until something listens on `port` without connecting to it.
+
+    A `-listen 1` ffmpeg serves exactly one client, so probing it with a
+    connection would use that client up.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        ports = _listening_ports()
+        if ports is None:
+            time.sleep(1.0)
+            return
+        if port in ports:
+            return
+        time.sleep(0.05)
+    raise TimeoutError(f"nothing listening on port {port} after {timeout}s")
+
+
+def make_test_file(path: str, duration: int = 60, bitrate_kbps: int = 3000) -> str:
+    """Encode a test pattern with a 2s GOP once, so ingests only copy it."""
+    subprocess.run(
+        [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"testsrc2=duration={duration}:size=1280x720:rate=30",
+            "-f", "lavfi", "-i", f"sine=frequency=1000:duration={duration}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-b:v", f"{bitrate_kbps}k",
+            "-g", "60", "-c:a", "aac", "-b:a", "128k", "-f", "flv", path,
+        ],
+        check=True,
+    )
+    return path
+
+
+class LoopbackProcess:
+    """An ffmpeg whose `-progress` output is tracked in the background."""
+
+    def __init__(self, name: str, url: str, args: List[str]):
+        self.name = name
+        self.url = url
+        self.args = args
+        self.latest: Optional[RelayMetrics] = None
+        self.first_progress: Optional[float] = None
+        self.process = subprocess.Popen(
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        parser = ProgressParser(0)
+        for line in self.process.stdout:
+            metrics = parser.feed(line)
+            if metrics is None:
+                continue
+            if self.first_progress is None and metrics.out_time_s > 0:
+                self.first_progress = time.monotonic()
+            self.latest = metrics
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def start_ingest(source_file: str, port: int) -> LoopbackProcess:
+    """Serve `source_file` in real time, looping, to one RTMP client."""
+    url = f"rtmp://127.0.0.1:{port}/live/ingest"
+    process = LoopbackProcess(f"ingest:{port}", url, [
+        "ffmpeg", *PROGRESS_ARGS, "-re", "-stream_loop", "-1", "-i", source_file,
+        "-c", "copy", "-f", "flv", "-listen", "1", url,
+    ])
+    wait_listening(port)
+    return process
+
+
+def start_sink(port: int, stream_key: str) -> LoopbackProcess:
+    """Accept one published stream and discard it after remuxing.
+
+    Writing FLV to /dev/null keeps `total_size` meaningful, which the
+    null muxer does not report.
+    """
+    url = f"rtmp://127.0.0.1:{port}/live/{stream_key}"
+    process = LoopbackProcess(f"sink:{port}", url, [
+        "ffmpeg", *PROGRESS_ARGS, "-listen", "1", "-f", "flv", "-i", url,
+        "-c", "copy", "-f", "flv", "-y", os.devnull,
+    ])
+    wait_listening(port)
+    return process
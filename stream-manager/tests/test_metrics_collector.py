@@ -0,0 +1,44 @@
+import os
+import threading
+
+import pytest
+
+from app.services.metrics_collector import LocalTransport, MetricsCollector, Transport
+
+
+class RecordingTransport(LocalTransport):
+    """Runs the real probes locally and notes which thread ran each instance."""
+
+    def __init__(self, instances):
+        super().__init__(instances)
+        self.threads = {}
+        self._barrier = threading.Barrier(len(instances), timeout=30)
+
+    def run(self, instance, script, timeout):
+        self.threads[instance] = threading.current_thread().name
+        # Only returns once every instance is being collected at the same time.
+        self._barrier.wait()
+        return super().run(instance, script, timeout)
+
+
+def test_transport_is_abstract():
+    with pytest.raises(TypeError):
+        Transport()
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/loadavg"), reason="probes need a Linux host")
+def test_collects_local_instances_in_parallel():
+    instances = ["node-a", "node-b", "node-c"]
+    transport = RecordingTransport(instances)
+
+    report = MetricsCollector(transport, max_workers=len(instances), timeout=30).collect()
+
+    records = report["instances"]
+    assert [record["instance"] for record in records] == instances
+    assert len(set(transport.threads.values())) == len(instances)
+    for record in records:
+        assert "error" not in record
+        assert record["details"] == {"name": record["instance"], "status": "RUNNING"}
+        assert set(record["loadavg"]) == {"1m", "5m", "15m"}
+        assert record["memory"] is not None
+        assert record["duration_s"] >= 0
@@ -0,0 +1,104 @@
+import os
+
+import pytest
+
+from app.utils.rtmp_stat import diff_snapshots, parse_snapshot
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "rtmp_stat")
+
+
+def load(name, taken_at):
+    return parse_snapshot(os.path.join(FIXTURES, name), taken_at=taken_at)
+
+
+def test_parse_server_application_stream_and_clients():
+    snapshot = load("snapshot_1.xml", 1000.0)
+
+    assert snapshot.taken_at == 1000.0
+    assert snapshot.uptime == 3600
+    assert snapshot.naccepted == 12
+    assert snapshot.bytes_in == 2757600000
+    assert list(snapshot.applications) == ["live"]
+    assert snapshot.applications["live"].nclients == 3
+
+    stream = snapshot.applications["live"].streams["main"]
+    assert stream.application == "live"
+    assert stream.time_ms == 3540000
+    assert stream.bw_video == 5968000
+    assert stream.nclients == 3
+    assert stream.publishing and stream.active
+    assert stream.video["codec"] == "H264"
+    assert stream.video["width"] == "1920"
+    assert stream.audio["sample_rate"] == "48000"
+    assert [client.id for client in stream.clients] == ["7", "9", "10"]
+
+    publisher = stream.clients[0]
+    assert publisher.address == "10.128.0.5"
+    assert publisher.flashver.startswith("FMLE/3.0")
+    assert publisher.avsync == -3
+    assert publisher.publishing and publisher.active
+    assert not stream.clients[1].publishing
+    assert stream.dropped == 4
+
+
+def test_parse_stream_without_metadata_or_activity():
+    snapshot = load("snapshot_2.xml", 1010.0)
+
+    backup = snapshot.applications["live"].streams["backup"]
+    assert backup.publishing and not backup.active
+    assert backup.video == {} and backup.audio == {}
+    assert [client.id for client in backup.clients] == ["12"]
+    assert [s.name for s in snapshot.streams()] == ["main", "backup"]
+
+
+def test_parse_accepts_bytes():
+    with open(os.path.join(FIXTURES, "snapshot_1.xml"), "rb") as f:
+        snapshot = parse_snapshot(f.read(), taken_at=1.0)
+    assert snapshot.applications["live"].streams["main"].bytes_out == 5420000000
+
+
+def test_diff_rates_drops_and_churn():
+    delta = diff_snapshots(load("snapshot_1.xml", 1000.0), load("snapshot_2.xml", 1010.0))
+
+    assert delta.elapsed_s == 10.0
+    assert delta.in_kbps == pytest.approx(6128.0)
+    assert delta.out_kbps == pytest.approx(12256.0)
+    assert delta.streams_started == ["live/backup"]
+    assert delta.streams_ended == []
+
+    main = next(s for s in delta.streams if s.name == "main")
+    assert main.in_kbps == pytest.approx(6128.0)
+    assert main.out_kbps == pytest.approx(12256.0)
+    assert main.dropped == 6
+    assert main.clients_joined == ["11"]
+    assert main.clients_left == ["10"]
+
+
+def test_diff_uses_wall_clock_not_uptime():
+    # Scraped 2.5 s apart, while the uptime counter moved by 10 s.
+    delta = diff_snapshots(load("snapshot_1.xml", 1000.0), load("snapshot_2.xml", 1002.5))
+
+    assert delta.elapsed_s == 2.5
+    assert delta.in_kbps == pytest.approx(6128.0 * 4)
+
+
+def test_diff_without_elapsed_time_has_zero_rates():
+    delta = diff_snapshots(load("snapshot_1.xml", 1000.0), load("snapshot_2.xml", 1000.0))
+
+    assert delta.in_kbps == 0.0
+    assert all(s.in_kbps == 0.0 and s.out_kbps == 0.0 for s in delta.streams)
+
+
+def test_diff_across_counter_reset():
+    delta = diff_snapshots(load("snapshot_2.xml", 1010.0), load("restarted.xml", 1015.0))
+
+    # After an nginx restart the new counters are the whole delta.
+    assert delta.in_kbps == pytest.approx(6128.0)
+    assert delta.out_kbps == pytest.approx(6128.0)
+    assert delta.streams_ended == ["live/backup"]
+
+    main = delta.streams[0]
+    assert main.in_kbps == pytest.approx(6128.0)
+    assert main.dropped == 2
+    assert main.clients_joined == ["1", "2"]
+    assert main.clients_left == ["11", "7", "9"]